@@ -1,17 +1,16 @@
 # app.py
-import tempfile
+# Gradio UI. gradio and pandas are imported when the UI is first built, so
+# `python app.py --headless` / `python app.py batch|parse ...` never load them.
+from __future__ import annotations
+import os
+import sys
 from typing import List, Dict, Any
-import gradio as gr
-import pandas as pd
 
-from core import estimate_all, DISCLAIMER
-
-# Optional PDF export (uses reportlab like your Flask route)
-from io import BytesIO
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+import metrics
+import preload
+from core import DISCLAIMER, Role
+from memo import estimate_all
+from report import pdf_path
 
 TASKS = [
     "lagging/insulation",
@@ -46,128 +45,272 @@ COLUMNS = [
     ("lev", "bool"),
 ]
 
-def _df_to_roles(df: pd.DataFrame) -> List[Dict[str, Any]]:
-    # Coerce and drop empty rows
-    roles: List[Dict[str, Any]] = []
-    for _, row in df.iterrows():
-        if pd.isna(row.get("task")) or pd.isna(row.get("era")):
-            continue
-        try:
-            roles.append({
-                "task": str(row["task"]).strip(),
-                "era": str(row["era"]).strip(),
-                "start_year": int(row["start_year"]),
-                "end_year": int(row["end_year"]),
-                "days_per_week": float(row["days_per_week"]),
-                "hours_per_day": float(row["hours_per_day"]),
-                "rpe": bool(row["rpe"]),
-                "lev": bool(row["lev"]),
-            })
-        except Exception:
-            # Skip malformed row
-            continue
-    return roles
-
-def predict(df: pd.DataFrame):
-    roles = _df_to_roles(df)
-    if not roles:
+# Above this many rows the Estimate button uses the columnar engine instead
+# of the memoised per-role path (same numbers, no per-row Python).
+COLUMNAR_MIN_ROWS = 2000
+
+def _ingest(df):
+    from ingest import ingest_frame
+    with metrics.stage("df_to_roles"):
+        return ingest_frame(df)
+
+def _df_to_roles(df) -> List[Role]:
+    # Valid rows as Roles; empty and malformed rows are dropped.
+    return _ingest(df).roles()
+
+def _estimate(ingested) -> Dict[str, Any]:
+    if len(ingested) < COLUMNAR_MIN_ROWS:
+        return estimate_all(ingested.roles())
+    import pandas as pd
+    from core import estimate_batch
+    res = estimate_batch(ingested.columns, table=ingested.table)
+    summaries = pd.DataFrame({"task": ingested.labels["task"], "era": ingested.labels["era"], **res["summaries"]})
+    latency = res["latency_years"][0]
+    return {
+        "summaries": summaries,
+        "total_low": float(res["total_low"][0]),
+        "total_high": float(res["total_high"][0]),
+        "latency_years": None if latency != latency else int(latency),
+        "disclaimer": res["disclaimer"],
+    }
+
+def _timeline_frame(ingested):
+    # Cumulative dose by calendar year (low/high) in the long layout
+    # gr.LinePlot wants; roles are split at era boundaries and overlaps capped.
+    import pandas as pd
+    from timeline import timeline_batch
+    res = timeline_batch(ingested.columns, table=ingested.table)
+    years = res["years"]
+    if not len(years):
+        return pd.DataFrame({"year": [], "bound": [], "dose": []})
+    return pd.DataFrame({
+        "year": list(years) * 2,
+        "bound": ["low"] * len(years) + ["high"] * len(years),
+        "dose": [*res["cumulative_low"][0], *res["cumulative_high"][0]],
+    })
+
+def predict(df):
+    # Every ASBESTOS_PROFILE_EVERY-th click is profiled (see metrics.py)
+    with metrics.profile("predict"):
+        return _predict(df)
+
+def _predict(df):
+    import gradio as gr
+    import pandas as pd
+    from ingest import errors_frame
+    ingested = _ingest(df)
+    skipped = errors_frame(ingested)
+    if not len(ingested):
         return (
             gr.update(value=None),
             gr.update(value=None),
             "Add at least one valid role row.",
             pd.DataFrame(),
+            skipped,
+            None,
         )
-    result = estimate_all(roles)
+    with metrics.stage("estimate_all"):
+        result = _estimate(ingested)
     summaries_df = pd.DataFrame(result["summaries"])
+    try:
+        with metrics.stage("timeline"):
+            curve = _timeline_frame(ingested)
+    except ValueError:      # e.g. a mistyped year spanning centuries
+        curve = None
+    note = f"Latency (years since first exposure): ~{result['latency_years']}" if result["latency_years"] is not None else "Latency: n/a"
+    return result["total_low"], result["total_high"], note, summaries_df, skipped, curve
+
+def live(df, session):
+    # Grid edits: only the changed rows are re-parsed and estimated (editor.py).
+    # The session is per browser tab, in gr.State; the timeline curve waits
+    # for the Estimate button.
+    from editor import EditSession
+    session = session or EditSession()
+    with metrics.stage("estimate_live"):
+        result = session.update(df)
+    if not result["valid"]:
+        return None, None, "Add at least one valid role row.", result["summaries"], result["errors"], session
     note = f"Latency (years since first exposure): ~{result['latency_years']}" if result["latency_years"] is not None else "Latency: n/a"
-    totals = f"{result['total_low']}–{result['total_high']} f/ml·years"
-    return result["total_low"], result["total_high"], note, summaries_df
+    return result["total_low"], result["total_high"], note, result["summaries"], result["errors"], session
+
+def _sweep_values(text: str) -> List[float]:
+    # "1-5" (whole numbers, inclusive) and/or "2.5, 7" -> [values]
+    values: List[float] = []
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        lo, sep, hi = part.partition("-")
+        if sep and lo.strip():
+            values.extend(range(int(lo), int(hi) + 1))
+        else:
+            values.append(float(part))
+    return values
 
-def make_pdf(df: pd.DataFrame, totals_low, totals_high, latency_note: str):
+def what_if(df, days: str, hours: str, rpe: List[str], lev: List[str], roles_text: str, bound: str):
+    import gradio as gr
+    import pandas as pd
+    from sweep import MAX_POINTS, rows, sweep
+    roles = _df_to_roles(df)
+    if not roles:
+        return "Add at least one valid role row.", None, None
+    try:
+        grid = {}
+        if days.strip():
+            grid["days_per_week"] = _sweep_values(days)
+        if hours.strip():
+            grid["hours_per_day"] = _sweep_values(hours)
+        if rpe:
+            grid["rpe"] = [v == "yes" for v in rpe]
+        if lev:
+            grid["lev"] = [v == "yes" for v in lev]
+        points = 1
+        for values in grid.values():
+            points *= len(values)
+        if points > MAX_POINTS:
+            raise ValueError(f"{points} combinations; at most {MAX_POINTS}")
+        apply_to = [int(i) - 1 for i in roles_text.replace(",", " ").split()] or None
+        with metrics.stage("sweep"):
+            result = sweep(roles, grid, apply_to)
+    except ValueError as e:
+        raise gr.Error(str(e))
+    table = pd.DataFrame(rows(result))
+    value = f"total_{bound}"
+    # Heat-map layout: hours/day across, the other swept fields down
+    index = [p for p in result["params"] if p != "hours_per_day"]
+    if "hours_per_day" in result["params"] and index:
+        heat = table.pivot_table(index=index, columns="hours_per_day", values=value).reset_index()
+        heat.columns = [str(c) for c in heat.columns]
+    else:
+        heat = table[[*result["params"], value]]
+    base = result["baseline"]
+    note = f"As entered: {base['total_low']}–{base['total_high']} f/ml·years; {len(table)} combinations."
+    return note, heat, table
+
+def make_pdf(df, totals_low, totals_high, latency_note: str):
     roles = _df_to_roles(df)
     if not roles:
         return None
+    import bands
+    from timeline import timeline
+    try:
+        curves = timeline(roles)
+    except ValueError:
+        curves = None
+    comparison = None
+    if len(bands.band_sets()) > 1:
+        # Alternative band sets are installed: record the totals under each
+        from compare import compare
+        comparison = compare(roles)
+    # Served from the report cache when these exact inputs were exported before
+    return pdf_path(roles, totals_low, totals_high, latency_note, timeline=curves, comparison=comparison)
 
-    # Build PDF to a temp file and return its path
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    path = tmp.name
-    tmp.close()
-
-    styles = getSampleStyleSheet()
-    doc = SimpleDocTemplate(path, pagesize=A4)
-    elems = []
-
-    elems.append(Paragraph("<b>Asbestos Exposure Educational Estimator — Summary</b>", styles["Title"]))
-    elems.append(Spacer(1, 12))
-
-    for i, r in enumerate(roles, start=1):
-        elems.append(Paragraph(f"<b>Role {i}:</b> {r['task']} ({r['era']}) {r['start_year']}–{r['end_year']}", styles["BodyText"]))
-        elems.append(Paragraph(
-            f"Days/week: {r['days_per_week']}, Hours/day: {r['hours_per_day']}, RPE: {bool(r['rpe'])}, LEV: {bool(r['lev'])}",
-            styles["BodyText"]
-        ))
-        elems.append(Spacer(1, 6))
-
-    elems.append(Spacer(1, 6))
-    elems.append(Paragraph(
-        f"<b>Cumulative exposure (f/ml·years):</b> {totals_low}–{totals_high}",
-        styles["Heading2"]
-    ))
-    elems.append(Paragraph(f"<b>{latency_note}</b>", styles["BodyText"]))
-    elems.append(Spacer(1, 12))
-
-    interp = [
-        ["Educational context (not diagnostic)"],
-        ["• Asbestosis/Diffuse pleural thickening often associated with ~10–25+ f/ml·years."],
-        ["• Lung cancer without asbestosis: typically very high cumulative exposures."],
-        ["• Mesothelioma: no safe threshold; qualitative exposure history remains important."],
-    ]
-    table = Table(interp, colWidths=[480])
-    table.setStyle(TableStyle([
-        ("BACKGROUND",(0,0),(-1,0), colors.lightgrey),
-        ("BOX",(0,0),(-1,-1),0.5,colors.black),
-        ("INNERGRID",(0,0),(-1,-1),0.25,colors.grey)
-    ]))
-    elems.append(table)
-    elems.append(Spacer(1, 12))
-    elems.append(Paragraph("<b>Disclaimer</b>", styles["Heading3"]))
-    elems.append(Paragraph(DISCLAIMER, styles["BodyText"]))
-
-    doc.build(elems)
-    return path
-
-with gr.Blocks(title="Asbestos Exposure Estimator") as demo:
-    gr.Markdown("## Asbestos Exposure Estimator (Educational)\nEnter one or more roles, then click **Estimate**.")
-
-    df = gr.Dataframe(
-        headers=[c[0] for c in COLUMNS],
-        datatype=[c[1] for c in COLUMNS],
-        value=pd.DataFrame(DEFAULT_ROWS),
-        wrap=True,
-        row_count=(1, "dynamic"),
-        col_count=(len(COLUMNS), "fixed"),
-        label="Exposure roles",
-    )
-
-    with gr.Row():
-        total_low = gr.Number(label="Total low (f/ml·years)", interactive=False)
-        total_high = gr.Number(label="Total high (f/ml·years)", interactive=False)
-
-    latency_text = gr.Textbox(label="Latency", interactive=False)
-    summaries = gr.Dataframe(label="Per-role summaries (computed)", interactive=False)
-
-    with gr.Row():
-        btn = gr.Button("Estimate", variant="primary")
-        pdf_btn = gr.Button("Export PDF")
-
-    pdf_file = gr.File(label="Download PDF")
-
-    btn.click(predict, inputs=[df], outputs=[total_low, total_high, latency_text, summaries])
-    pdf_btn.click(make_pdf, inputs=[df, total_low, total_high, latency_text], outputs=[pdf_file])
-
-    gr.Markdown(
-        "> **Disclaimer:** " + DISCLAIMER
-    )
+def build_ui():
+    import gradio as gr
+    import pandas as pd
 
-if __name__ == "__main__":
+    with gr.Blocks(title="Asbestos Exposure Estimator") as demo:
+        gr.Markdown("## Asbestos Exposure Estimator (Educational)\nEnter one or more roles; the totals update as you edit, and **Estimate** adds the timeline.")
+
+        df = gr.Dataframe(
+            headers=[c[0] for c in COLUMNS],
+            datatype=[c[1] for c in COLUMNS],
+            value=pd.DataFrame(DEFAULT_ROWS),
+            wrap=True,
+            row_count=(1, "dynamic"),
+            col_count=(len(COLUMNS), "fixed"),
+            label="Exposure roles",
+        )
+
+        with gr.Tabs():
+            with gr.Tab("Estimate"):
+                with gr.Row():
+                    total_low = gr.Number(label="Total low (f/ml·years)", interactive=False)
+                    total_high = gr.Number(label="Total high (f/ml·years)", interactive=False)
+
+                latency_text = gr.Textbox(label="Latency", interactive=False)
+                summaries = gr.Dataframe(label="Per-role summaries (computed)", interactive=False)
+                skipped = gr.Dataframe(
+                    headers=["row", "field", "value", "error"],
+                    label="Skipped rows (not included in the estimate)",
+                    interactive=False,
+                )
+
+                curve = gr.LinePlot(
+                    x="year", y="dose", color="bound",
+                    title="Cumulative exposure by year (f/ml·years; roles split at era boundaries)",
+                    label="Timeline",
+                )
+
+                with gr.Row():
+                    btn = gr.Button("Estimate", variant="primary")
+                    pdf_btn = gr.Button("Export PDF")
+
+                pdf_file = gr.File(label="Download PDF")
+                session = gr.State(None)
+
+                # always_last drops edits queued behind a running update,
+                # so a burst of keystrokes costs one update for the final grid.
+                df.change(live, inputs=[df, session],
+                          outputs=[total_low, total_high, latency_text, summaries, skipped, session],
+                          trigger_mode="always_last", show_progress="hidden")
+
+                btn.click(predict, inputs=[df], outputs=[total_low, total_high, latency_text, summaries, skipped, curve])
+                pdf_btn.click(make_pdf, inputs=[df, total_low, total_high, latency_text], outputs=[pdf_file])
+
+            with gr.Tab("What-if"):
+                gr.Markdown("Re-estimate the roles above over every combination of the values below "
+                            "(a blank field keeps each role's own value).")
+                with gr.Row():
+                    sweep_days = gr.Textbox(value="1-5", label="Days/week (e.g. 1-5 or 2.5, 3)")
+                    sweep_hours = gr.Textbox(value="1-10", label="Hours/day")
+                with gr.Row():
+                    sweep_rpe = gr.CheckboxGroup(["no", "yes"], value=["no", "yes"], label="RPE consistent")
+                    sweep_lev = gr.CheckboxGroup(["no", "yes"], value=["no", "yes"], label="LEV")
+                with gr.Row():
+                    sweep_roles = gr.Textbox(label="Roles to change (numbers as in the per-role summaries; blank = all)")
+                    sweep_bound = gr.Radio(["high", "low"], value="high", label="Heat map of total")
+                sweep_btn = gr.Button("Run sweep", variant="primary")
+                sweep_note = gr.Textbox(label="Baseline", interactive=False)
+                sweep_heat = gr.Dataframe(label="Cumulative total (f/ml·years) by hours/day", interactive=False)
+                sweep_table = gr.Dataframe(label="All combinations", interactive=False)
+                sweep_btn.click(what_if,
+                                inputs=[df, sweep_days, sweep_hours, sweep_rpe, sweep_lev, sweep_roles, sweep_bound],
+                                outputs=[sweep_note, sweep_heat, sweep_table])
+
+        gr.Markdown(
+            "> **Disclaimer:** " + DISCLAIMER
+        )
+    return demo
+
+def __getattr__(name: str):
+    # `demo` is built on first access (gradio's reloader and Spaces look it up)
+    if name == "demo":
+        demo = globals()["demo"] = build_ui()
+        return demo
+    raise AttributeError(name)
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--headless"]:
+        # JSON API only (server.py); no gradio, pandas or ReportLab at startup
+        import uvicorn
+        from server import app
+        uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("PORT", 5000)))
+        return 0
+    if argv[:1] in (["batch"], ["parse"]):
+        import core
+        return core.main(argv)
+    port = os.environ.get("ASBESTOS_METRICS_PORT")
+    if port:
+        metrics.serve(int(port))
+    demo = build_ui()
+    if preload.ENABLED:
+        # Nothing forks here, but the first PDF no longer pays for the
+        # assets and collections skip everything built so far.
+        preload.preload()
     demo.launch()
+    return 0
+
+if __name__ == "__main__":
+    # PDF rendering uses a process pool; needed for the PyInstaller .exe
+    import multiprocessing
+    multiprocessing.freeze_support()
+    raise SystemExit(main())
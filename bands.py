@@ -0,0 +1,260 @@
+# bands.py
+# Band table loaded from data/bands.json, interned to small integer codes,
+# plus any named band sets in data/bands/ to compare it with.
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+# Built-in defaults, used when data/bands.json is missing or unreadable.
+BASE_BANDS: Dict[Tuple[str, str], Tuple[float, float]] = {
+    ("lagging/insulation", "pre-1980"): (5.0, 10.0),
+    ("maintenance/demolition", "pre-1980"): (0.5, 2.0),
+    ("cement/board cutting", "pre-1980"): (1.0, 5.0),
+    ("garage/brakes", "pre-1980"): (0.2, 1.0),
+    ("bystander", "pre-1980"): (0.1, 0.5),
+    ("lagging/insulation", "1980-1999"): (0.5, 2.0),
+    ("maintenance/demolition", "1980-1999"): (0.2, 0.8),
+    ("bystander", "1980-1999"): (0.05, 0.2),
+    ("any", "2000+"): (0.01, 0.05),
+}
+
+# Fallbacks band_for has always applied: unknown task in 2000+ gets the
+# ("any", "2000+") band, anything else unknown gets DEFAULT_BAND.
+ANY_TASK = "any"
+RECENT_ERA = "2000+"
+DEFAULT_BAND: Tuple[float, float] = (0.05, 0.2)
+
+# PyInstaller one-file builds unpack data/ next to the bundle, not the module.
+_BASE_DIR = Path(getattr(sys, "_MEIPASS", Path(__file__).resolve().parent))
+BANDS_PATH = Path(os.environ.get("ASBESTOS_BANDS", _BASE_DIR / "data" / "bands.json"))
+# Alternative tables for comparison (compare.py): every *.json in here.
+BAND_SETS_DIR = Path(os.environ.get("ASBESTOS_BAND_SETS", _BASE_DIR / "data" / "bands"))
+
+# How often (seconds) the read path is allowed to stat() the file.
+CHECK_INTERVAL = 2.0
+
+@dataclass(frozen=True)
+class BandTable:
+    tasks: Tuple[str, ...]
+    eras: Tuple[str, ...]
+    # (len(tasks) + 1, len(eras) + 1) grid of (low, high); the last row and
+    # column are the fallbacks. `low`/`high` are the same as NumPy arrays.
+    rows: Tuple[Tuple[Tuple[float, float], ...], ...]
+    task_index: Dict[str, int]
+    era_index: Dict[str, int]
+    path: Optional[Path] = None
+    mtime: Optional[float] = None
+    name: Optional[str] = None
+    version: Optional[str] = None
+    source: Optional[str] = None
+
+    @classmethod
+    def from_pairs(cls, pairs: Mapping[Tuple[str, str], Tuple[float, float]],
+                   path: Optional[Path] = None, mtime: Optional[float] = None,
+                   name: Optional[str] = None, version: Optional[str] = None,
+                   source: Optional[str] = None) -> "BandTable":
+        tasks: Dict[str, None] = {}
+        eras: Dict[str, None] = {}
+        for task, era in pairs:
+            if task != ANY_TASK:
+                tasks.setdefault(task)
+            eras.setdefault(era)
+        any_recent = tuple(pairs.get((ANY_TASK, RECENT_ERA), BASE_BANDS[(ANY_TASK, RECENT_ERA)]))
+
+        def fallback(era: str) -> Tuple[float, float]:
+            return any_recent if era == RECENT_ERA else DEFAULT_BAND
+
+        rows = tuple(
+            tuple(
+                tuple(map(float, pairs.get((task, era), fallback(era))))
+                for era in (*eras, "")
+            )
+            for task in (*tasks, "")
+        )
+        return cls(
+            tasks=tuple(tasks),
+            eras=tuple(eras),
+            rows=rows,
+            task_index={t: i for i, t in enumerate(tasks)},
+            era_index={e: i for i, e in enumerate(eras)},
+            path=path,
+            mtime=mtime,
+            name=name,
+            version=version,
+            source=source,
+        )
+
+    @classmethod
+    def from_json(cls, data: Mapping[str, Mapping[str, Any]],
+                  path: Optional[Path] = None, mtime: Optional[float] = None) -> "BandTable":
+        # bands.json layout: {task: {era: [low, high]}}, or that under "bands"
+        # with "name", "version" and "source" alongside.
+        meta: Dict[str, Any] = {}
+        if isinstance(data.get("bands"), Mapping):
+            meta = {k: None if data.get(k) is None else str(data[k]) for k in ("name", "version", "source")}
+            data = data["bands"]
+        pairs = {}
+        for task, by_era in data.items():
+            for era, (low, high) in by_era.items():
+                pairs[(task.lower().strip(), era.strip())] = (float(low), float(high))
+        return cls.from_pairs(pairs, path, mtime, **meta)
+
+    @property
+    def label(self) -> str:
+        return self.name or (self.path.stem if self.path else "built-in")
+
+    @cached_property
+    def digest(self) -> str:
+        # Short content hash, so a report can say exactly which numbers it used.
+        blob = json.dumps([self.tasks, self.eras, self.rows], separators=(",", ":"))
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:12]
+
+    # NumPy is only imported once something asks for the arrays, so the
+    # scalar path (and `import core`) stays light.
+    def _grid(self, i: int):
+        import numpy as np
+        arr = np.array(self.rows, dtype=float)[:, :, i].copy()
+        arr.flags.writeable = False
+        return arr
+
+    @cached_property
+    def low(self):
+        return self._grid(0)
+
+    @cached_property
+    def high(self):
+        return self._grid(1)
+
+    def task_code(self, task: str) -> int:
+        code = self.task_index.get(task)
+        if code is None:
+            code = self.task_index.get(task.lower().strip(), len(self.tasks))
+        return code
+
+    def era_code(self, era: str) -> int:
+        code = self.era_index.get(era)
+        if code is None:
+            code = self.era_index.get(era.strip(), len(self.eras))
+        return code
+
+    def band(self, task: str, era: str) -> Tuple[float, float]:
+        return self.rows[self.task_code(task)][self.era_code(era)]
+
+    def encode_tasks(self, values):
+        import numpy as np
+        return np.fromiter(map(self.task_code, values), dtype=np.int16, count=len(values))
+
+    def encode_eras(self, values):
+        import numpy as np
+        return np.fromiter(map(self.era_code, values), dtype=np.int16, count=len(values))
+
+def load(path: Path = BANDS_PATH) -> BandTable:
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return BandTable.from_json(data, path, mtime)
+
+def _initial() -> BandTable:
+    try:
+        return load(BANDS_PATH)
+    except (OSError, ValueError, TypeError) as e:
+        log.warning("bands: using built-in BASE_BANDS (%s: %s)", BANDS_PATH, e)
+        return BandTable.from_pairs(BASE_BANDS)
+
+# Readers only ever load this reference; reload() builds a complete new
+# table and swaps it in with a single assignment, so no lock on reads.
+_table: BandTable = _initial()
+_next_check = time.monotonic() + CHECK_INTERVAL
+_reload_lock = threading.Lock()
+_failed_mtime: Optional[float] = None
+
+def reload(force: bool = False) -> BandTable:
+    global _table, _failed_mtime
+    # Only one thread re-reads the file; the others keep the current table.
+    if not _reload_lock.acquire(blocking=False):
+        return _table
+    try:
+        path = _table.path or BANDS_PATH
+        try:
+            if _table.path is None and not path.exists():
+                return _table
+            mtime = path.stat().st_mtime
+            if force or mtime not in (_table.mtime, _failed_mtime):
+                _failed_mtime = mtime
+                _table = load(path)
+                _failed_mtime = None
+                log.info("bands: reloaded %s", path)
+        except (OSError, ValueError, TypeError) as e:
+            # Half-written or broken file: keep serving the last good table
+            # until the file changes again.
+            log.warning("bands: reload of %s failed, keeping previous table (%s)", path, e)
+        return _table
+    finally:
+        _reload_lock.release()
+
+def current() -> BandTable:
+    global _next_check
+    now = time.monotonic()
+    if now >= _next_check:
+        _next_check = now + CHECK_INTERVAL
+        return reload()
+    return _table
+
+# === Named band sets ===
+
+# Same rules as the main table: re-scanned at most every CHECK_INTERVAL, only
+# changed files are re-read, and a broken file keeps its last good table.
+_sets: Tuple[BandTable, ...] = ()
+_sets_next_check = 0.0
+_sets_lock = threading.Lock()
+_sets_failed: Dict[Path, float] = {}
+
+def _scan(previous: Tuple[BandTable, ...]) -> Tuple[BandTable, ...]:
+    old = {t.path: t for t in previous}
+    tables = []
+    for path in sorted(BAND_SETS_DIR.glob("*.json")):
+        prev = old.get(path)
+        try:
+            mtime = path.stat().st_mtime
+        except OSError:
+            continue
+        if prev is not None and prev.mtime == mtime or _sets_failed.get(path) == mtime:
+            tables.extend([prev] if prev is not None else [])
+            continue
+        try:
+            tables.append(load(path))
+            _sets_failed.pop(path, None)
+        except (OSError, ValueError, TypeError) as e:
+            log.warning("bands: cannot load band set %s (%s)", path, e)
+            _sets_failed[path] = mtime
+            tables.extend([prev] if prev is not None else [])
+    return tuple(tables)
+
+def band_sets() -> Dict[str, BandTable]:
+    """The tables to compare, by label: the current table first, then each
+    band set in BAND_SETS_DIR in file name order (a later file with a label
+    already taken is skipped)."""
+    global _sets, _sets_next_check
+    now = time.monotonic()
+    if now >= _sets_next_check and _sets_lock.acquire(blocking=False):
+        try:
+            _sets_next_check = now + CHECK_INTERVAL
+            _sets = _scan(_sets)
+        finally:
+            _sets_lock.release()
+    out: Dict[str, BandTable] = {}
+    for table in (current(), *_sets):
+        out.setdefault(table.label, table)
+    return out
@@ -0,0 +1,178 @@
+# batch.py
+# Offline batch mode: stream histories from JSONL/CSV through estimate_all
+# on a process pool, writing results in input order.
+from __future__ import annotations
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from itertools import groupby, islice
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from core import ROLE_FIELDS, Role, estimate_all, to_json
+
+CHUNK_SIZE = 500        # records per task sent to a worker
+INFLIGHT_PER_WORKER = 4  # chunks queued per worker before the reader waits
+
+# A unit of work: (record number, source, payload). JSONL payloads are raw
+# lines, parsed in the worker; CSV payloads are the history's row dicts.
+Record = Tuple[int, str, Any]
+
+def _history_from_json(line: str) -> Tuple[Any, List[Dict[str, Any]]]:
+    data = json.loads(line)
+    if isinstance(data, list):
+        return None, data
+    if not isinstance(data, dict) or not isinstance(data.get("roles"), list):
+        raise ValueError("expected an object with a 'roles' list")
+    return data.get("id"), data["roles"]
+
+def _history_from_rows(rows: List[Dict[str, str]]) -> Tuple[Any, List[Role]]:
+    roles = []
+    for row in rows:
+        missing = [f for f in ROLE_FIELDS if not row.get(f)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        roles.append(Role.from_dict({
+            "task": row["task"].strip(),
+            "era": row["era"].strip(),
+            "start_year": row["start_year"],
+            "end_year": row["end_year"],
+            "days_per_week": row["days_per_week"],
+            "hours_per_day": row["hours_per_day"],
+            "rpe": row["rpe"].strip().lower() in ("1", "true", "yes", "y"),
+            "lev": row["lev"].strip().lower() in ("1", "true", "yes", "y"),
+        }))
+    return rows[0].get("person_id"), roles
+
+def error_line(n: int, source: str, payload: Any, e: BaseException) -> str:
+    return json.dumps({
+        "record": n,
+        "source": source,
+        "error": f"{type(e).__name__}: {e}",
+        "input": payload,
+    }, ensure_ascii=False)
+
+def _run_chunk(chunk: List[Record]) -> List[Tuple[bool, str]]:
+    # (ok, JSON line) per record, in input order
+    out: List[Tuple[bool, str]] = []
+    for n, source, payload in chunk:
+        try:
+            if isinstance(payload, str):
+                hist_id, roles = _history_from_json(payload)
+            else:
+                hist_id, roles = _history_from_rows(payload)
+            if not roles:
+                raise ValueError("history has no roles")
+            result = to_json(estimate_all([r if isinstance(r, Role) else Role.from_dict(r) for r in roles]))
+        except (ValueError, TypeError, KeyError, AttributeError, OverflowError) as e:
+            # OverflowError: int() of an infinite year (1e400, Infinity)
+            out.append((False, error_line(n, source, payload, e)))
+            continue
+        out.append((True, json.dumps({"id": hist_id, **result}, ensure_ascii=False)))
+    return out
+
+def read_jsonl(f: TextIO) -> Iterator[Record]:
+    for lineno, line in enumerate(f, start=1):
+        if line.strip():
+            yield lineno, f"line {lineno}", line.rstrip("\r\n")
+
+def read_csv(f: TextIO) -> Iterator[Record]:
+    # One role per row; consecutive rows with the same person_id make up one
+    # history (a file without person_id is one row per history).
+    reader = csv.DictReader(f)
+    by_person = "person_id" in (reader.fieldnames or ())
+    key = (lambda row: row["person_id"]) if by_person else id
+    for n, (person, rows) in enumerate(groupby(reader, key=key), start=1):
+        yield n, f"person_id {person}" if by_person else f"row {n}", list(rows)
+
+def _chunks(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    it = iter(records)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+class _Inline(Executor):
+    # workers=1: run chunks in-process, handy for debugging and tiny inputs.
+    def submit(self, fn, *args, **kwargs):
+        fut: Future = Future()
+        fut.set_result(fn(*args, **kwargs))
+        return fut
+
+def run(src: TextIO, dst: TextIO, err: TextIO, fmt: str = "jsonl",
+        workers: Optional[int] = None, chunk_size: int = CHUNK_SIZE,
+        progress: Optional[TextIO] = None,
+        task: Callable[[List[Record]], List[Tuple[bool, str]]] = _run_chunk) -> Dict[str, Any]:
+    # `task` turns a chunk into (ok, JSON line) results; narrative.run reuses
+    # this pipeline with its own.
+    workers = workers or os.cpu_count() or 1
+    records = read_csv(src) if fmt == "csv" else read_jsonl(src)
+    max_inflight = workers * INFLIGHT_PER_WORKER
+    pending: Deque[Future] = deque()
+    n_ok = n_err = 0
+    t0 = time.perf_counter()
+
+    def drain_one() -> None:
+        nonlocal n_ok, n_err
+        results = pending.popleft().result()
+        out = [line for ok, line in results if ok]
+        errors = [line for ok, line in results if not ok]
+        if out:
+            dst.write("\n".join(out) + "\n")
+        if errors:
+            err.write("\n".join(errors) + "\n")
+        n_ok += len(out)
+        n_err += len(errors)
+        if progress is not None:
+            rate = (n_ok + n_err) / max(time.perf_counter() - t0, 1e-9)
+            progress.write(f"\r{n_ok} ok, {n_err} errors, {rate:,.0f} rec/s")
+            progress.flush()
+
+    pool = _Inline() if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+    with pool:
+        for chunk in _chunks(records, chunk_size):
+            # Bounded queue: results are written in submission order, and the
+            # reader stops pulling input while max_inflight chunks are queued.
+            if len(pending) >= max_inflight:
+                drain_one()
+            pending.append(pool.submit(task, chunk))
+        while pending:
+            drain_one()
+
+    elapsed = time.perf_counter() - t0
+    if progress is not None:
+        progress.write("\n")
+    return {
+        "records": n_ok + n_err,
+        "ok": n_ok,
+        "errors": n_err,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round((n_ok + n_err) / elapsed, 1) if elapsed else None,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(prog="python -m core batch",
+                                description="Estimate many histories from a JSONL or CSV file.")
+    p.add_argument("input", help="JSONL (one {'id', 'roles'} history per line) or CSV (one role per row)")
+    p.add_argument("output", help="JSONL results, one line per valid history, in input order")
+    p.add_argument("--errors", help="where malformed records go (default: <output>.errors.jsonl)")
+    p.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from extension)")
+    p.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    p.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = p.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    errors_path = args.errors or f"{args.output}.errors.jsonl"
+    with open(args.input, encoding="utf-8", newline="" if fmt == "csv" else None) as src, \
+            open(args.output, "w", encoding="utf-8") as dst, \
+            open(errors_path, "w", encoding="utf-8") as err:
+        stats = run(src, dst, err, fmt=fmt, workers=args.workers, chunk_size=args.chunk_size,
+                    progress=None if args.quiet else sys.stderr)
+    print(json.dumps(stats), file=sys.stderr)
+    return 0
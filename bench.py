@@ -0,0 +1,439 @@
+# bench.py
+# Micro-benchmarks for the estimator hot paths, on a seeded synthetic cohort,
+# with JSON baselines and a regression gate.
+#
+#   python bench.py run --out bench-baseline.json            # full suite
+#   python bench.py run --quick --only estimate_all           # <= 10k roles, one group
+#   python bench.py compare bench-baseline.json bench-new.json --threshold 0.15
+#   python bench.py speedup                                   # estimate_batch >= 50x estimate_all, 1M roles
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from core import ROLE_FIELDS, band_for, compute_role, estimate_all, roles_from_dicts
+
+SEED = 20240601
+REPEATS = 5
+MIN_TIME = 0.2              # seconds per repeat; `number` is scaled up to reach it
+THRESHOLD = 0.10            # compare: fail when median time grows by more than this
+
+# === Synthetic cohort ===
+
+# Rough occupational mix: (task, weight, P(RPE) before/after 1985, P(LEV) ditto)
+TASK_MIX = (
+    ("bystander", 0.35, (0.02, 0.10), (0.05, 0.20)),
+    ("maintenance/demolition", 0.20, (0.10, 0.60), (0.05, 0.30)),
+    ("garage/brakes", 0.15, (0.02, 0.20), (0.10, 0.50)),
+    ("cement/board cutting", 0.15, (0.05, 0.40), (0.05, 0.40)),
+    ("lagging/insulation", 0.15, (0.10, 0.70), (0.05, 0.30)),
+)
+
+def era_of(year: int) -> str:
+    return "pre-1980" if year < 1980 else "1980-1999" if year < 2000 else "2000+"
+
+def synthetic_role(rng: random.Random, start: int) -> Dict[str, Any]:
+    task, _, rpe_p, lev_p = rng.choices(TASK_MIX, weights=[t[1] for t in TASK_MIX])[0]
+    years = min(1 + int(rng.expovariate(1 / 5)), 40)
+    late = start >= 1985
+    return {
+        "task": task,
+        "era": era_of(start),
+        "start_year": start,
+        "end_year": start + years,
+        "days_per_week": rng.choices((5, 4, 3, 6, 2), weights=(70, 10, 8, 8, 4))[0],
+        "hours_per_day": rng.choices((8, 6, 10, 4, 7.5), weights=(55, 15, 12, 10, 8))[0],
+        "rpe": rng.random() < rpe_p[late],
+        "lev": rng.random() < lev_p[late],
+    }
+
+def synthetic_histories(n_people: int, seed: int = SEED) -> Iterator[Dict[str, Any]]:
+    """{"id", "roles"} per person: 1-6 consecutive roles starting 1950-2015."""
+    rng = random.Random(seed)
+    for pid in range(n_people):
+        year = rng.randint(1950, 2015)
+        roles = []
+        for _ in range(rng.choices((1, 2, 3, 4, 5, 6), weights=(30, 25, 20, 12, 8, 5))[0]):
+            role = synthetic_role(rng, year)
+            roles.append(role)
+            year = role["end_year"] + rng.randint(0, 3)
+            if year > 2024:
+                break
+        yield {"id": pid, "roles": roles}
+
+def synthetic_roles(n_roles: int, seed: int = SEED) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for h in synthetic_histories(n_roles, seed):
+        out.extend(h["roles"])
+        if len(out) >= n_roles:
+            break
+    return out[:n_roles]
+
+def synthetic_columns(n_roles: int, seed: int = SEED) -> Dict[str, List[Any]]:
+    # Columnar cohort (with person_id) for core.estimate_batch
+    cols: Dict[str, List[Any]] = {f: [] for f in ("person_id",) + ROLE_FIELDS}
+    n = 0
+    for h in synthetic_histories(n_roles, seed):
+        for r in h["roles"][:n_roles - n]:
+            cols["person_id"].append(h["id"])
+            for f in ROLE_FIELDS:
+                cols[f].append(r[f])
+        n = len(cols["person_id"])
+        if n >= n_roles:
+            break
+    return cols
+
+NARRATIVE_TASK_WORDS = {
+    "bystander": ("worked in an office on a building site", "was a storeman near the fitters"),
+    "maintenance/demolition": ("did maintenance on boiler houses", "worked on demolition jobs"),
+    "garage/brakes": ("fitted brakes in a garage", "was a mechanic at a garage doing brake linings"),
+    "cement/board cutting": ("was cutting cement sheets", "cut insulating board for partitions"),
+    "lagging/insulation": ("worked as a lagger on pipework", "stripped insulation in power stations"),
+}
+
+def synthetic_narrative(rng: random.Random, roles: List[Dict[str, Any]]) -> str:
+    parts = []
+    for i, r in enumerate(roles):
+        lead = "I" if i == 0 else rng.choice(("Then I", "Later I", "After that I"))
+        extra = []
+        if r["rpe"]:
+            extra.append("we had masks")
+        if r["lev"]:
+            extra.append("there was extraction")
+        tail = f", {' and '.join(extra)}" if extra else ""
+        parts.append(f"{lead} {rng.choice(NARRATIVE_TASK_WORDS[r['task']])} "
+                     f"from {r['start_year']} to {r['end_year']}{tail}.")
+    return " ".join(parts)
+
+def synthetic_narratives(n_docs: int, seed: int = SEED) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [synthetic_narrative(rng, h["roles"]) for h in synthetic_histories(n_docs, seed)]
+
+# === Timing ===
+
+def measure(fn: Callable[[], Any], repeats: int = REPEATS, min_time: float = MIN_TIME,
+            items: int = 1) -> Dict[str, Any]:
+    """Time fn(); `number` calls per repeat are chosen so each repeat takes at
+    least `min_time`. Times are per call; `items` is what one call processes."""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - t0
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= max(2, min(10, int(min_time / max(elapsed, 1e-9)) + 1))
+    times = [elapsed / number]
+    for _ in range(repeats - 1):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - t0) / number)
+    median = statistics.median(times)
+    return {
+        "median_s": median,
+        "min_s": min(times),
+        "stdev_s": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "number": number,
+        "repeats": len(times),
+        "items": items,
+        "items_per_sec": items / median if median else None,
+    }
+
+# === Benchmarks ===
+# Each group yields (name, fn, items); setup happens in the generator, outside
+# the timed region. Missing optional packages skip a group.
+
+def bench_band_for(quick: bool):
+    pairs = [(r["task"], r["era"]) for r in synthetic_roles(1000)]
+    yield "band_for", lambda: [band_for(t, e) for t, e in pairs], len(pairs)
+
+def bench_compute_role(quick: bool):
+    roles = synthetic_roles(1000)
+    yield "compute_role", lambda: [compute_role(r) for r in roles], len(roles)
+    typed = roles_from_dicts(roles)
+    yield "compute_role[Role]", lambda: [compute_role(r) for r in typed], len(typed)
+
+def bench_estimate_all(quick: bool):
+    for n in (1, 100, 10_000) if quick else (1, 100, 10_000, 1_000_000):
+        roles = synthetic_roles(n)
+        yield f"estimate_all[{n}]", lambda roles=roles: estimate_all(roles), n
+    typed = roles_from_dicts(synthetic_roles(10_000))
+    yield "estimate_all[10000,Role]", lambda: estimate_all(typed), len(typed)
+
+def bench_estimate_batch(quick: bool):
+    import numpy as np
+    for n in (100, 10_000) if quick else (100, 10_000, 1_000_000):
+        cols = {k: np.asarray(v) for k, v in synthetic_columns(n).items()}
+        from core import estimate_batch
+        yield f"estimate_batch[{n}]", lambda cols=cols: estimate_batch(cols), n
+
+def bench_timeline(quick: bool):
+    import numpy as np
+    from timeline import timeline, timeline_batch
+    history = next(h for h in synthetic_histories(100) if len(h["roles"]) >= 4)["roles"]
+    yield "timeline[history]", lambda: timeline(history), len(history)
+    for n in (10_000,) if quick else (10_000, 1_000_000):
+        cols = {k: np.asarray(v) for k, v in synthetic_columns(n).items()}
+        yield f"timeline_batch[{n}]", lambda cols=cols: timeline_batch(cols), n
+        yield f"timeline_batch[{n},totals]", lambda cols=cols: timeline_batch(cols, curves=False), n
+
+def bench_sweep(quick: bool):
+    from sweep import sweep
+    roles = synthetic_roles(50)
+    # 25 x 100 x 2 x 2 = 10,000 grid points
+    grid = {"days_per_week": [0.5 + 0.25 * i for i in range(25)], "hours_per_day": [0.5 + 0.1 * i for i in range(100)],
+            "rpe": [False, True], "lev": [False, True]}
+    yield "sweep[50,10000]", lambda: sweep(roles, grid), 10_000
+
+def bench_compare(quick: bool):
+    import numpy as np
+    from bands import BASE_BANDS, BandTable
+    from compare import compare_batch
+    # The current table plus three rescaled copies
+    tables = [BandTable.from_pairs({k: (lo * f, hi * f) for k, (lo, hi) in BASE_BANDS.items()}, name=f"x{f}")
+              for f in (1.0, 0.5, 2.0, 3.0)]
+    for n in (10_000,) if quick else (10_000, 1_000_000):
+        cols = {k: np.asarray(v) for k, v in synthetic_columns(n).items()}
+        yield f"compare_batch[{n},K=1]", lambda cols=cols: compare_batch(cols, tables[:1]), n
+        yield f"compare_batch[{n},K=4]", lambda cols=cols: compare_batch(cols, tables), n
+
+def bench_store(quick: bool):
+    import numpy as np
+    from store import CohortStore
+    n = 100_000 if quick else 1_000_000
+    cols = {k: np.asarray(v) for k, v in synthetic_columns(n).items()}
+    with tempfile.TemporaryDirectory(prefix="asbestos-bench-store-") as tmp:
+        store = CohortStore.create(tmp)
+        store.append(cols)
+        yield f"store.group_sum[{n},task+decade]", lambda: store.group_sum(("task", "decade")), n
+        yield f"store.count_over[{n}]", lambda: store.count_over(25), n
+        yield f"store.quantiles[{n},era]", lambda: store.quantiles("dose_high", (0.5, 0.95), by=("era",)), n
+
+def bench_df_to_roles(quick: bool):
+    import pandas as pd
+    from app import _df_to_roles
+    for n in (1_000, 10_000) if quick else (1_000, 10_000, 100_000):
+        df = pd.DataFrame(synthetic_roles(n))
+        yield f"df_to_roles[{n}]", lambda df=df: _df_to_roles(df), n
+    # What the grid hands over: every cell as text
+    df = pd.DataFrame(synthetic_roles(10_000)).astype(str)
+    yield "df_to_roles[10000,text]", lambda: _df_to_roles(df), len(df)
+
+def bench_edit(quick: bool):
+    import pandas as pd
+    from editor import EditSession
+    for n in (100, 10_000) if quick else (100, 10_000, 100_000):
+        # Alternate between two grids one cell apart: every update is a single-row edit
+        a = pd.DataFrame(synthetic_roles(n))
+        b = a.copy()
+        b.loc[n // 2, "hours_per_day"] = b.loc[n // 2, "hours_per_day"] % 10 + 1
+        session = EditSession()
+        session.update(a)
+        grids = [b, a]
+        yield f"edit_one[{n}]", lambda s=session, g=grids: [s.update(df) for df in g], 2
+
+def bench_make_pdf(quick: bool):
+    import report
+    # Renders and the cached lookup go to a scratch cache, not the live one
+    live = report.CACHE_DIR, report._cache, report._cache_pid, report._cache_lock_file
+    with tempfile.TemporaryDirectory(prefix="asbestos-bench-") as tmp:
+        path = os.path.join(tmp, "bench.pdf")
+        report.CACHE_DIR, report._cache = Path(tmp) / "cache", None
+        try:
+            for n in (1, 20) if quick else (1, 20, 50, 200):
+                roles = synthetic_roles(n)
+                result = estimate_all(roles)
+                content = report.report_content(roles, result["total_low"], result["total_high"],
+                                                f"Latency (years since first exposure): ~{result['latency_years']}")
+                # Cold render (what a cache miss costs), in this process
+                yield f"make_pdf[{n}]", lambda content=content: report.render(content, path), n
+            report.pdf_path(roles, result["total_low"], result["total_high"])
+            yield "make_pdf[cached]", lambda: report.pdf_path(roles, result["total_low"], result["total_high"]), 1
+        finally:
+            if report._cache_lock_file is not None and report._cache_lock_file is not live[3]:
+                report._cache_lock_file.close()
+            report.CACHE_DIR, report._cache, report._cache_pid, report._cache_lock_file = live
+
+def bench_parse_history(quick: bool):
+    from narrative import parse_history
+    docs = synthetic_narratives(200 if quick else 2000)
+    yield "parse_history", lambda: [parse_history(d) for d in docs], len(docs)
+
+GROUPS: Dict[str, Callable[[bool], Iterator[Tuple[str, Callable[[], Any], int]]]] = {
+    "band_for": bench_band_for,
+    "compute_role": bench_compute_role,
+    "estimate_all": bench_estimate_all,
+    "estimate_batch": bench_estimate_batch,
+    "timeline": bench_timeline,
+    "sweep": bench_sweep,
+    "compare": bench_compare,
+    "store": bench_store,
+    "df_to_roles": bench_df_to_roles,
+    "edit": bench_edit,
+    "make_pdf": bench_make_pdf,
+    "parse_history": bench_parse_history,
+}
+
+def run(groups: List[str], quick: bool = False, repeats: int = REPEATS,
+        min_time: float = MIN_TIME, log=sys.stderr) -> Dict[str, Any]:
+    results: Dict[str, Any] = {}
+    skipped: Dict[str, str] = {}
+    for group in groups:
+        try:
+            for name, fn, items in GROUPS[group](quick):
+                # One large call is already well above min_time; don't repeat it 5x.
+                r = measure(fn, repeats if items < 1_000_000 else min(repeats, 3), min_time, items)
+                results[name] = dict(r, group=group)
+                if log is not None:
+                    print(f"{name:<28} {r['median_s'] * 1e3:>10.3f} ms  {r['items_per_sec']:>14,.0f} items/s", file=log)
+        except ImportError as e:
+            skipped[group] = str(e)
+            if log is not None:
+                print(f"{group:<28} skipped: {e}", file=log)
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": SEED,
+            "quick": quick,
+        },
+        "results": results,
+        "skipped": skipped,
+    }
+
+def _group(name: str, result: Dict[str, Any]) -> str:
+    # Results record their group; older files only have the name to go by
+    return result.get("group", name.split("[")[0])
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = THRESHOLD,
+            overrides: Optional[Dict[str, float]] = None) -> Tuple[List[Dict[str, Any]], bool]:
+    """Per-benchmark ratio of median times (current / baseline). A benchmark
+    regresses when the ratio exceeds 1 + threshold (or its override). One
+    absent from the current results fails too, unless its group was skipped
+    there for a missing package."""
+    overrides = overrides or {}
+    skipped = current.get("skipped", {})
+    rows, failed = [], False
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            status = "skipped" if _group(name, base) in skipped else "missing"
+            failed |= status == "missing"
+            rows.append({"name": name, "status": status})
+            continue
+        ratio = cur["median_s"] / base["median_s"]
+        limit = overrides.get(name, threshold)
+        status = "REGRESSED" if ratio > 1 + limit else "faster" if ratio < 1 - limit else "ok"
+        failed |= status == "REGRESSED"
+        rows.append({"name": name, "baseline_s": base["median_s"], "current_s": cur["median_s"],
+                     "ratio": ratio, "threshold": limit, "status": status})
+    for name in current["results"].keys() - baseline["results"].keys():
+        rows.append({"name": name, "status": "new"})
+    return rows, failed
+
+# === Speed-up gate ===
+
+SPEEDUP_MIN = 50.0          # estimate_batch (table codes) vs estimate_all per person, 1M roles
+
+def speedup(n_roles: int = 1_000_000, repeats: int = 3) -> Dict[str, Any]:
+    """estimate_batch against estimate_all called person by person on the
+    same synthetic cohort, with task/era given as table codes (what the
+    columnar API is for) and as names."""
+    import numpy as np
+    import bands
+    from core import estimate_batch
+    table = bands.current()
+    people, n = [], 0
+    for h in synthetic_histories(n_roles):
+        people.append(h["roles"][:n_roles - n])
+        n += len(people[-1])
+        if n >= n_roles:
+            break
+    names = {k: np.asarray(v) for k, v in synthetic_columns(n_roles).items()}
+    codes = dict(names, task=table.encode_tasks(names["task"].tolist()), era=table.encode_eras(names["era"].tolist()))
+    base = measure(lambda: [estimate_all(roles) for roles in people], 1, 0.0, n)["median_s"]
+    out = {"roles": n, "people": len(people), "estimate_all_s": base}
+    for label, data in (("codes", codes), ("names", names)):
+        t = measure(lambda data=data: estimate_batch(data, table=table), repeats, MIN_TIME, n)["median_s"]
+        out[f"{label}_s"] = t
+        out[f"{label}_x"] = base / t
+    return out
+
+def main(argv: List[str] = None) -> int:
+    p = argparse.ArgumentParser(description="Estimator micro-benchmarks.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run", help="run the suite and write a JSON result")
+    r.add_argument("--out", help="write results here (default: stdout)")
+    r.add_argument("--only", action="append", choices=list(GROUPS), help="benchmark group(s) to run")
+    r.add_argument("--quick", action="store_true", help="skip the 1M-role and largest cases")
+    r.add_argument("--repeats", type=int, default=REPEATS)
+    r.add_argument("--min-time", type=float, default=MIN_TIME)
+    c = sub.add_parser("compare", help="fail if CURRENT regressed against BASELINE")
+    c.add_argument("baseline")
+    c.add_argument("current", nargs="?", help="results file (default: run the suite now)")
+    c.add_argument("--threshold", type=float, default=THRESHOLD,
+                   help="allowed slowdown as a fraction (default: %(default)s)")
+    c.add_argument("--limit", action="append", default=[], metavar="NAME=FRACTION",
+                   help="per-benchmark threshold, e.g. make_pdf[200]=0.3")
+    c.add_argument("--quick", action="store_true")
+    g = sub.add_parser("speedup", help="fail if estimate_batch is not SPEEDUP_MIN times estimate_all")
+    g.add_argument("--roles", type=int, default=1_000_000)
+    g.add_argument("--min", type=float, default=SPEEDUP_MIN, help="required speed-up with table codes")
+    args = p.parse_args(argv)
+
+    if args.cmd == "speedup":
+        res = speedup(args.roles)
+        print(f"estimate_all, per person: {res['estimate_all_s']:.2f} s for {res['roles']:,} roles "
+              f"({res['people']:,} people)")
+        for label in ("codes", "names"):
+            print(f"estimate_batch, task/era as {label}: {res[label + '_s'] * 1e3:.0f} ms  x{res[label + '_x']:.0f}")
+        ok = res["codes_x"] >= args.min
+        print(f"speed-up with codes x{res['codes_x']:.0f} {'>=' if ok else '<'} x{args.min:.0f}")
+        return 0 if ok else 1
+
+    if args.cmd == "run":
+        res = run(args.only or list(GROUPS), args.quick, args.repeats, args.min_time)
+        text = json.dumps(res, indent=2)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current, encoding="utf-8") as f:
+            current = json.load(f)
+    else:
+        groups = sorted({_group(name, base) for name, base in baseline["results"].items()} & GROUPS.keys())
+        current = run(groups, args.quick or baseline["meta"].get("quick", False))
+    overrides = {}
+    for spec in args.limit:
+        name, _, frac = spec.rpartition("=")
+        overrides[name] = float(frac)
+    rows, failed = compare(baseline, current, args.threshold, overrides)
+    for row in rows:
+        if "ratio" in row:
+            print(f"{row['name']:<28} {row['baseline_s'] * 1e3:>10.3f} -> {row['current_s'] * 1e3:>10.3f} ms"
+                  f"  x{row['ratio']:.2f}  {row['status']}")
+        else:
+            print(f"{row['name']:<28} {row['status']}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
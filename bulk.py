@@ -0,0 +1,347 @@
+# bulk.py
+# Bulk report export: one summary PDF per history (the `python -m core batch`
+# inputs), rendered on a process pool and streamed to disk in input order,
+# either into a ZIP or into one merged PDF with a contents page and bookmarks.
+from __future__ import annotations
+import csv
+import io
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, TextIO, Tuple
+from xml.sax.saxutils import escape
+
+import report
+from batch import Record, _Inline, _chunks, _history_from_json, _history_from_rows, read_csv, read_jsonl
+from core import Role, estimate_all
+
+CHUNK_SIZE = 16          # reports per task sent to a worker
+INFLIGHT_PER_WORKER = 2  # chunks queued per worker; bounds the spooled PDFs on disk
+
+def latency_note(latency: Optional[int]) -> str:
+    return f"Latency (years since first exposure): ~{latency}" if latency is not None else "Latency: n/a"
+
+def _render_chunk(chunk: List[Record], spool: str, with_timeline: bool) -> List[Dict[str, Any]]:
+    # One entry per record, in input order: the rendered file and its totals,
+    # or the error (same shape as the batch errors file).
+    out: List[Dict[str, Any]] = []
+    for n, source, payload in chunk:
+        try:
+            if isinstance(payload, str):
+                hist_id, roles = _history_from_json(payload)
+            else:
+                hist_id, roles = _history_from_rows(payload)
+            if not roles:
+                raise ValueError("history has no roles")
+            roles = [r if isinstance(r, Role) else Role.from_dict(r) for r in roles]
+            result = estimate_all(roles)
+            curves = None
+            if with_timeline:
+                from timeline import timeline
+                try:
+                    curves = timeline(roles)
+                except ValueError:      # e.g. a mistyped year spanning centuries
+                    pass
+            subject = source if hist_id is None else str(hist_id)
+            content = report.report_content(roles, result["total_low"], result["total_high"],
+                                            latency_note(result["latency_years"]), timeline=curves, subject=subject)
+            path = os.path.join(spool, f"{n}.pdf")
+            report.render(content, path)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            out.append({"record": n, "source": source, "error": f"{type(e).__name__}: {e}", "input": payload})
+            continue
+        out.append({"record": n, "id": hist_id, "subject": subject, "path": path, "roles": len(roles),
+                    "total_low": result["total_low"], "total_high": result["total_high"],
+                    "latency_years": result["latency_years"]})
+    return out
+
+# === Merging ReportLab PDFs ===
+# ReportLab writes classic PDFs: numbered objects, a plain xref table and
+# ASCII85 streams. That is all _objects() reads, so it handles this module's
+# own renders and nothing else.
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF = re.compile(rb"xref\s+0 (\d+)\s+")
+_OBJ = re.compile(rb"\d+ 0 obj")
+_REF = re.compile(rb"(\d+) 0 R\b")
+
+def _objects(data: bytes) -> Tuple[Dict[int, bytes], int]:
+    # {object number: body between "N 0 obj" and "endobj"}, and the catalog number.
+    xref = int(_STARTXREF.findall(data)[-1])
+    m = _XREF.match(data, xref)
+    if m is None:
+        raise ValueError("not a ReportLab PDF (no xref table)")
+    offsets = []
+    for i in range(int(m.group(1))):
+        entry = data[m.end() + 20 * i:m.end() + 20 * i + 18].split()
+        if entry[2] == b"n":
+            offsets.append((int(entry[0]), i))
+    offsets.sort()
+    objects = {}
+    for j, (start, num) in enumerate(offsets):
+        stop = offsets[j + 1][0] if j + 1 < len(offsets) else xref
+        body = data[start:stop]
+        objects[num] = body[_OBJ.match(body).end():body.rindex(b"endobj")]
+    root = int(re.search(rb"/Root (\d+) 0 R", data[xref:]).group(1))
+    return objects, root
+
+def _ref(body: bytes, key: bytes) -> int:
+    return int(_REF.match(body, body.index(key) + len(key) + 1).group(1))
+
+def _page_tree(objects: Dict[int, bytes], node: int, pages: List[int], tree: List[int]) -> None:
+    # Leaf pages in order; intermediate /Pages nodes go in `tree`.
+    body = objects[node]
+    if b"/Type /Pages" not in body:
+        pages.append(node)
+        return
+    tree.append(node)
+    kids = body[body.index(b"/Kids"):]
+    for m in _REF.finditer(kids[:kids.index(b"]")]):
+        _page_tree(objects, int(m.group(1)), pages, tree)
+
+def _text(s: str) -> bytes:
+    # PDF text string (UTF-16BE with BOM), safe for any subject name.
+    return b"<FEFF" + s.encode("utf-16-be").hex().upper().encode() + b">"
+
+class MergedPdf:
+    """Appends ReportLab PDFs page by page to one file on disk. Objects are
+    renumbered and written as they arrive; only their offsets, the page
+    numbers and the bookmarks are kept until close()."""
+
+    PAGES, CATALOG, OUTLINES = 1, 2, 3      # written last, numbered first
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp = f"{path}.{os.getpid()}.tmp"
+        self.f = open(self._tmp, "wb")
+        self.f.write(b"%PDF-1.4\n%\x93\x8c\x8b\x9e\n")
+        self.offsets: List[int] = [0, 0, 0]
+        self.front: List[int] = []          # pages placed before everything else (contents)
+        self.pages: List[int] = []
+        self.marks: List[Tuple[str, int]] = []
+
+    def _write(self, body: bytes, num: Optional[int] = None) -> int:
+        if num is None:
+            self.offsets.append(0)
+            num = len(self.offsets)
+        self.offsets[num - 1] = self.f.tell()
+        self.f.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+        return num
+
+    def add(self, data: bytes, title: Optional[str] = None, front: bool = False) -> int:
+        """Append the pages of `data` (bookmarked as `title`); returns the page count."""
+        objects, root = _objects(data)
+        pages: List[int] = []
+        tree: List[int] = []
+        _page_tree(objects, _ref(objects[root], b"/Pages"), pages, tree)
+        info = re.search(rb"/Info (\d+) 0 R", data[int(_STARTXREF.findall(data)[-1]):])
+        skip = {root, *tree, *([int(info.group(1))] if info else [])}
+        base = len(self.offsets)
+        kept = sorted(set(objects) - skip)
+        new = {old: base + 1 + i for i, old in enumerate(kept)}
+        new.update(dict.fromkeys(tree, self.PAGES))      # pages now hang off our tree
+        self.offsets.extend([0] * len(kept))
+
+        def renumber(m):
+            return b"%d 0 R" % new[int(m.group(1))]
+        for old in kept:
+            body = objects[old]
+            cut = body.find(b"stream")      # leave stream data alone
+            cut = len(body) if cut < 0 else cut
+            self._write(_REF.sub(renumber, body[:cut]) + body[cut:], new[old])
+        ids = [new[p] for p in pages]
+        (self.front if front else self.pages).extend(ids)
+        if title is not None and ids:
+            self.marks.insert(0 if front else len(self.marks), (title, ids[0]))
+        return len(ids)
+
+    def close(self) -> None:
+        kids = self.front + self.pages
+        self._write(b"<< /Type /Pages /Count %d /Kids [ %s ] >>" % (
+            len(kids), b" ".join(b"%d 0 R" % k for k in kids)), self.PAGES)
+        first = len(self.offsets) + 1
+        for i, (title, page) in enumerate(self.marks):
+            num = first + i
+            links = b"".join([b" /Prev %d 0 R" % (num - 1) if i else b"",
+                              b" /Next %d 0 R" % (num + 1) if i + 1 < len(self.marks) else b""])
+            self._write(b"<< /Title %s /Parent %d 0 R%s /Dest [ %d 0 R /Fit ] >>" % (
+                _text(title), self.OUTLINES, links, page))
+        if self.marks:
+            self._write(b"<< /Type /Outlines /First %d 0 R /Last %d 0 R /Count %d >>" % (
+                first, first + len(self.marks) - 1, len(self.marks)), self.OUTLINES)
+        else:
+            self._write(b"<< /Type /Outlines /Count 0 >>", self.OUTLINES)
+        self._write(b"<< /Type /Catalog /Pages %d 0 R /Outlines %d 0 R /PageMode /UseOutlines >>" % (
+            self.PAGES, self.OUTLINES), self.CATALOG)
+        xref = self.f.tell()
+        self.f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1))
+        self.f.write(b"".join(b"%010d 00000 n \n" % off for off in self.offsets))
+        self.f.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            len(self.offsets) + 1, self.CATALOG, xref))
+        self.f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self) -> None:
+        self.f.close()
+        os.unlink(self._tmp)
+
+def contents_pdf(entries: List[Tuple[str, int, str]], first_page: int = 1) -> bytes:
+    """Contents pages for (subject, page count, totals) entries, numbered
+    as if they came first and the reports followed from there."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    styles, _ = report._assets()
+    pages = 1
+    while True:
+        page = first_page + pages
+        rows = [["#", "Subject", "Cumulative (f/ml·years)", "Page"]]
+        for i, (subject, n_pages, totals) in enumerate(entries, start=1):
+            rows.append([str(i), Paragraph(escape(subject), styles["BodyText"]), totals, str(page)])
+            page += n_pages
+        table = Table(rows, colWidths=[40, 260, 120, 50], repeatRows=1)
+        table.setStyle(TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+            ("LINEBELOW", (0, 0), (-1, -1), 0.25, colors.grey),
+            ("VALIGN", (0, 0), (-1, -1), "TOP"),
+        ]))
+        buf = io.BytesIO()
+        doc = SimpleDocTemplate(buf, pagesize=A4, title="Contents")
+        doc.build([Paragraph("<b>Contents</b>", styles["Title"]), table])
+        # Page numbers in the table assume `pages` contents pages; redo if wrong
+        if doc.page == pages:
+            return buf.getvalue()
+        pages = doc.page
+
+# === Export ===
+
+class _ZipSink:
+    def __init__(self, path: str, spool: str):
+        self.zip = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)     # PDFs are compressed already
+        self._index_path = os.path.join(spool, "index.csv")
+        self._index = open(self._index_path, "w", encoding="utf-8", newline="")
+        self.index = csv.writer(self._index)
+        self.index.writerow(["record", "id", "file", "roles", "total_low", "total_high", "latency_years"])
+
+    def add(self, item: Dict[str, Any]) -> None:
+        name = f"{item['record']:06d}-{re.sub(r'[^A-Za-z0-9._-]+', '_', item['subject'])[:60]}.pdf"
+        self.zip.write(item["path"], name)
+        self.index.writerow([item["record"], item["id"], name, item["roles"], item["total_low"],
+                             item["total_high"], item["latency_years"]])
+
+    def close(self) -> None:
+        self._index.close()
+        self.zip.write(self._index_path, "index.csv")
+        self.zip.close()
+
+    def abort(self) -> None:
+        self._index.close()
+        self.zip.close()
+        os.unlink(self.zip.filename)
+
+class _PdfSink:
+    def __init__(self, path: str, spool: str):
+        self.pdf = MergedPdf(path)
+        self.entries: List[Tuple[str, int, str]] = []
+
+    def add(self, item: Dict[str, Any]) -> None:
+        with open(item["path"], "rb") as f:
+            pages = self.pdf.add(f.read(), item["subject"])
+        self.entries.append((item["subject"], pages, f"{item['total_low']}–{item['total_high']}"))
+
+    def close(self) -> None:
+        self.pdf.add(contents_pdf(self.entries), "Contents", front=True)
+        self.pdf.close()
+
+    def abort(self) -> None:
+        self.pdf.abort()
+
+def export(src: TextIO, out: str, err: TextIO, fmt: str = "jsonl", workers: Optional[int] = None,
+           chunk_size: int = CHUNK_SIZE, with_timeline: bool = False,
+           progress: Optional[TextIO] = None) -> Dict[str, Any]:
+    """Render a report per history in `src` and write them to `out`: a ZIP
+    (one PDF per subject plus index.csv) or, for a .pdf path, one merged PDF
+    with a contents page and a bookmark per subject. Reports are spooled to
+    a temporary directory and moved into `out` in input order as they
+    finish, so memory and spool space are bounded by the chunks in flight."""
+    workers = workers or os.cpu_count() or 1
+    records = read_csv(src) if fmt == "csv" else read_jsonl(src)
+    spool = tempfile.mkdtemp(prefix="asbestos-bulk-")
+    sink = _PdfSink(out, spool) if out.lower().endswith(".pdf") else _ZipSink(out, spool)
+    max_inflight = workers * INFLIGHT_PER_WORKER
+    pending: Deque[Future] = deque()
+    n_ok = n_err = 0
+    t0 = time.perf_counter()
+
+    def drain_one() -> None:
+        nonlocal n_ok, n_err
+        for item in pending.popleft().result():
+            if "error" in item:
+                err.write(json.dumps(item, ensure_ascii=False) + "\n")
+                n_err += 1
+                continue
+            sink.add(item)
+            os.unlink(item["path"])
+            n_ok += 1
+        if progress is not None:
+            rate = (n_ok + n_err) / max(time.perf_counter() - t0, 1e-9)
+            progress.write(f"\r{n_ok} reports, {n_err} errors, {rate:,.1f} reports/s")
+            progress.flush()
+
+    pool = _Inline() if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+    try:
+        with pool:
+            for chunk in _chunks(records, chunk_size):
+                if len(pending) >= max_inflight:
+                    drain_one()
+                pending.append(pool.submit(_render_chunk, chunk, spool, with_timeline))
+            while pending:
+                drain_one()
+        sink.close()
+    except BaseException:
+        sink.abort()
+        raise
+    finally:
+        shutil.rmtree(spool, ignore_errors=True)
+
+    elapsed = time.perf_counter() - t0
+    if progress is not None:
+        progress.write("\n")
+    return {
+        "reports": n_ok,
+        "errors": n_err,
+        "bytes": os.path.getsize(out),
+        "seconds": round(elapsed, 3),
+        "reports_per_sec": round(n_ok / elapsed, 1) if elapsed else None,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(prog="python -m core reports",
+                                description="Render a summary PDF per history into a ZIP or one merged PDF.")
+    p.add_argument("input", help="JSONL (one {'id', 'roles'} history per line) or CSV (one role per row)")
+    p.add_argument("output", help="OUT.zip (one PDF per subject plus index.csv) or OUT.pdf (merged, with contents)")
+    p.add_argument("--errors", help="where malformed records go (default: <output>.errors.jsonl)")
+    p.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from extension)")
+    p.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    p.add_argument("--timeline", action="store_true", help="add the cumulative exposure chart to each report")
+    p.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = p.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+    errors_path = args.errors or f"{args.output}.errors.jsonl"
+    with open(args.input, encoding="utf-8", newline="" if fmt == "csv" else None) as src, \
+            open(errors_path, "w", encoding="utf-8") as err:
+        stats = export(src, args.output, err, fmt=fmt, workers=args.workers, chunk_size=args.chunk_size,
+                       with_timeline=args.timeline, progress=None if args.quiet else sys.stderr)
+    print(json.dumps(stats), file=sys.stderr)
+    return 0
@@ -0,0 +1,196 @@
+# cohort.py
+# Columnar (NumPy) engine behind core.estimate_batch / core.role_arrays.
+# Kept out of core so that importing core doesn't pull in NumPy.
+from __future__ import annotations
+from datetime import datetime
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+import bands
+from bands import BandTable
+from core import DISCLAIMER, ROLE_FIELDS, Role, control_multiplier
+
+# Compact storage for roles: 26 bytes each instead of a dict of Python
+# objects. task/era are codes into the BandTable the records were built with.
+ROLE_DTYPE = np.dtype([
+    ("task", "<i2"),
+    ("era", "<i2"),
+    ("start_year", "<i2"),
+    ("end_year", "<i2"),
+    ("days_per_week", "<f8"),
+    ("hours_per_day", "<f8"),
+    ("rpe", "?"),
+    ("lev", "?"),
+])
+COHORT_DTYPE = np.dtype([("person_id", "<i8")] + ROLE_DTYPE.descr)
+UNKNOWN = "unknown"     # label for codes outside the table's vocabulary
+
+def role_records(roles, person_ids=None, table: BandTable = None) -> np.ndarray:
+    """Structured array (ROLE_DTYPE, or COHORT_DTYPE with `person_ids`) for
+    Role objects or role dicts. Values are cast as compute_role casts them."""
+    table = table or bands.current()
+    rec = np.empty(len(roles), dtype=ROLE_DTYPE if person_ids is None else COHORT_DTYPE)
+    if person_ids is not None:
+        rec["person_id"] = person_ids
+    typed = [r if isinstance(r, Role) else Role.from_dict(r) for r in roles]
+    rec["task"] = table.encode_tasks([r.task for r in typed])
+    rec["era"] = table.encode_eras([r.era for r in typed])
+    for f in ROLE_FIELDS[2:]:
+        rec[f] = [getattr(r, f) for r in typed]
+    return rec
+
+def records_to_roles(rec: np.ndarray, table: BandTable = None) -> list:
+    # Back to Role objects (for the UI/JSON boundary or the scalar path).
+    table = table or bands.current()
+    tasks = table.tasks + (UNKNOWN,)
+    eras = table.eras + (UNKNOWN,)
+    return [
+        Role(tasks[t], eras[e], s, en, d, h, rp, lv)
+        for t, e, s, en, d, h, rp, lv in zip(*(rec[f].tolist() for f in ROLE_FIELDS))
+    ]
+
+def _codes(values: np.ndarray, names, code_of) -> np.ndarray:
+    # Names spelt exactly as in the table are matched a whole column at a
+    # time; the rest (other case or spacing, unknown names) are resolved
+    # once per distinct value.
+    codes = np.full(len(values), -1, dtype=np.intp)
+    for i, name in enumerate(names):
+        codes[values == name] = i
+    rest = np.flatnonzero(codes < 0)
+    if len(rest):
+        uniq, inverse = np.unique(values[rest].astype(str), return_inverse=True)
+        codes[rest] = np.array([code_of(v) for v in uniq.tolist()], dtype=np.intp)[inverse]
+    return codes
+
+def _band_codes(table: BandTable, task, era) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Returns a per-row index into small low/high band tables.
+    task = np.asarray(task)
+    era = np.asarray(era)
+    if not (task.dtype.kind in "iu" and era.dtype.kind in "iu"):
+        # Names (a lone code column is read as a name, as before)
+        task = _codes(task.astype(str) if task.dtype.kind in "iu" else task, table.tasks, table.task_code)
+        era = _codes(era.astype(str) if era.dtype.kind in "iu" else era, table.eras, table.era_code)
+    codes = task.astype(np.intp) * table.low.shape[1] + era
+    return codes, table.low.ravel(), table.high.ravel()
+
+def _round_exact(x: np.ndarray, ndigits: int) -> np.ndarray:
+    # Same result as the builtin round() element-wise. np.round scales then
+    # rints, which can land on the wrong side of a near-tie (0.0375 etc. are
+    # common here), so decide ties on the exact product x * 10**ndigits using
+    # Dekker's error-free multiplication, with round-half-even on exact ties.
+    p = 10.0 ** ndigits
+    scaled = x * p
+    c = 134217729.0 * x
+    x_hi = c - (c - x)
+    x_lo = x - x_hi
+    err = (x_hi * p - scaled) + x_lo * p
+    k = np.floor(scaled)
+    d = (scaled - (k + 0.5)) + err
+    up = (d > 0) | ((d == 0) & (np.floor(k * 0.5) != k * 0.5))
+    return (k + up) / p
+
+def _round(x: np.ndarray, ndigits: int) -> np.ndarray:
+    # _round_exact, paying for it only where it can differ from rint: the
+    # product x * 10**ndigits is off by at most half an ulp (under 1e-4 below
+    # 2**39), so a fraction further than that from .5 rounds the same way.
+    x = np.asarray(x)
+    scaled = x * 10.0 ** ndigits
+    r = np.rint(scaled)
+    near = (np.abs(scaled - r) >= 0.5 - 1e-4) | ~(np.abs(scaled) <= 2.0 ** 39)   # also NaN and inf
+    out = r / 10.0 ** ndigits
+    if near.any():
+        if out.ndim:
+            out[near] = _round_exact(x[near], ndigits)
+        else:
+            out = _round_exact(x, ndigits)
+    return out
+
+def _group(person: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Cohort files are usually sorted by person already; avoid the sort then.
+    if len(person) and np.all(person[1:] >= person[:-1]):
+        change = np.empty(len(person), dtype=bool)
+        change[0] = True
+        np.not_equal(person[1:], person[:-1], out=change[1:])
+        return person[change], np.cumsum(change) - 1
+    return np.unique(person, return_inverse=True)
+
+# control_multiplier(rpe, lev) at index rpe * 2 + lev
+_CONTROL = np.array([control_multiplier(rpe, lev) for rpe in (False, True) for lev in (False, True)])
+
+_BLOCK = 1 << 15  # rows per block; keeps the temporaries cache-resident
+
+def _role_block(out: Dict[str, np.ndarray], sl: slice, codes, lookup, start, end, days, hours, rpe, lev) -> None:
+    low_t, high_t, base_low_t, base_high_t = lookup
+    band = codes[sl]
+    low = low_t.take(band)
+    high = high_t.take(band)
+    f_mult = (days[sl] / 5.0) * (hours[sl] / 8.0)
+    c_mult = _CONTROL.take((rpe[sl].view(np.uint8) << 1) | lev[sl].view(np.uint8))
+    adj_low = low * f_mult * c_mult
+    adj_high = high * f_mult * c_mult
+    years = np.maximum(0, end[sl] - start[sl])
+    out["years"][sl] = years
+    out["base_band_low"][sl] = base_low_t.take(band)
+    out["base_band_high"][sl] = base_high_t.take(band)
+    out["adj_band_low"][sl] = _round(adj_low, 3)
+    out["adj_band_high"][sl] = _round(adj_high, 3)
+    out["dose_low"][sl] = _round(adj_low * years, 3)
+    out["dose_high"][sl] = _round(adj_high * years, 3)
+
+def _role_columns(data, person_col: str) -> Dict[str, Any]:
+    # Everything but the bands: numeric role fields and the person grouping.
+    cols = {
+        "start": np.asarray(data["start_year"]).astype(np.int64, copy=False),
+        "end": np.asarray(data["end_year"]).astype(np.int64, copy=False),
+        "days": np.asarray(data["days_per_week"], dtype=float),
+        "hours": np.asarray(data["hours_per_day"], dtype=float),
+        "rpe": np.asarray(data["rpe"]).astype(bool, copy=False),
+        "lev": np.asarray(data["lev"]).astype(bool, copy=False),
+    }
+    try:
+        person = np.asarray(data[person_col])
+    except (KeyError, ValueError):  # ValueError: structured array without that field
+        person = np.zeros(len(cols["start"]), dtype=np.int64)
+    cols["ids"], cols["inverse"] = _group(person)
+    return cols
+
+def role_arrays(data, person_col: str = "person_id", table: BandTable = None) -> Dict[str, Any]:
+    """Parse columnar role data into NumPy arrays. Band values are returned as
+    small tables (`low_t`/`high_t`) plus a per-row index into them (`codes`);
+    people come back as unique `ids` and a per-row `inverse` into `ids`."""
+    table = table or bands.current()
+    codes, low_t, high_t = _band_codes(table, data["task"], data["era"])
+    return {"codes": codes, "low_t": low_t, "high_t": high_t, **_role_columns(data, person_col)}
+
+def estimate_batch(data, person_col: str = "person_id", table: BandTable = None) -> Dict[str, Any]:
+    # See core.estimate_batch for the input layout.
+    cols = role_arrays(data, person_col, table)
+    low_t, high_t, start = cols["low_t"], cols["high_t"], cols["start"]
+    lookup = (low_t, high_t, _round(low_t, 3), _round(high_t, 3))
+
+    n_roles = len(start)
+    summaries = {"years": np.empty(n_roles, dtype=np.int64)}
+    for col in ("base_band_low", "base_band_high", "adj_band_low", "adj_band_high", "dose_low", "dose_high"):
+        summaries[col] = np.empty(n_roles)
+    for i in range(0, n_roles, _BLOCK):
+        _role_block(summaries, slice(i, i + _BLOCK), cols["codes"], lookup, start, cols["end"],
+                    cols["days"], cols["hours"], cols["rpe"], cols["lev"])
+
+    ids, inverse = cols["ids"], cols["inverse"]
+    n = len(ids)
+
+    first = np.full(n, np.iinfo(np.int64).max)
+    np.minimum.at(first, inverse, start)
+    latency = np.where(first != 0, datetime.now().year - first, np.nan)
+
+    return {
+        "summaries": summaries,
+        "person_id": ids,
+        # bincount adds in input order, matching estimate_all's running sum
+        "total_low": _round(np.bincount(inverse, weights=summaries["dose_low"], minlength=n), 2),
+        "total_high": _round(np.bincount(inverse, weights=summaries["dose_high"], minlength=n), 2),
+        "first_exposure_year": first,
+        "latency_years": latency,
+        "disclaimer": DISCLAIMER,
+    }
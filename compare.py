@@ -0,0 +1,104 @@
+# compare.py
+# One history, or a whole cohort, under several band tables at once: the
+# tables are stacked into (K, tasks, eras) arrays over a shared vocabulary,
+# so each role's band is a single gather for all K tables and the rest of
+# the arithmetic is done once.
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bands
+from bands import BandTable
+from cohort import _BLOCK, _role_columns, _round
+from core import roles_to_columns
+
+@dataclass(frozen=True)
+class BandStack:
+    tables: Tuple[BandTable, ...]
+    tasks: Tuple[str, ...]          # union of the tables' tasks; code len(tasks) is "unknown"
+    eras: Tuple[str, ...]
+    low: np.ndarray                 # (K, len(tasks) + 1, len(eras) + 1)
+    high: np.ndarray
+
+    @classmethod
+    def of(cls, tables: Sequence[BandTable]) -> "BandStack":
+        if not tables:
+            raise ValueError("no band tables to compare")
+        tasks = tuple(dict.fromkeys(t for table in tables for t in table.tasks))
+        eras = tuple(dict.fromkeys(e for table in tables for e in table.eras))
+        # Each cell is table.band() for that name, so a task or era one table
+        # lacks gets that table's own fallback. "\0" is never a real name.
+        grid = np.array([[[table.band(t, e) for e in (*eras, "\0")] for t in (*tasks, "\0")]
+                         for table in tables], dtype=float)
+        return cls(tuple(tables), tasks, eras, grid[..., 0].copy(), grid[..., 1].copy())
+
+    def _codes(self, values, names: Tuple[str, ...], clean) -> np.ndarray:
+        # Distinct strings are resolved once, with the same spelling
+        # tolerance as BandTable.task_code / era_code.
+        index = {n: i for i, n in enumerate(names)}
+        uniq, inverse = np.unique(np.asarray(values).astype(str), return_inverse=True)
+        codes = [index.get(v, index.get(clean(v), len(names))) for v in uniq.tolist()]
+        return np.array(codes, dtype=np.intp)[inverse]
+
+    def task_codes(self, values) -> np.ndarray:
+        return self._codes(values, self.tasks, lambda v: v.lower().strip())
+
+    def era_codes(self, values) -> np.ndarray:
+        return self._codes(values, self.eras, str.strip)
+
+def compare_batch(data, tables: Optional[Sequence[BandTable]] = None,
+                  person_col: str = "person_id") -> Dict[str, Any]:
+    """Per-person totals under each of K band tables (default: every table
+    in bands.band_sets()) for columnar role data as for core.estimate_batch,
+    with task/era as strings. `total_low`/`total_high` are (K, people); row
+    k equals estimate_batch(data, table=tables[k]) exactly."""
+    tables = list(bands.band_sets().values()) if tables is None else list(tables)
+    stack = BandStack.of(tables)
+    task, era = np.asarray(data["task"]), np.asarray(data["era"])
+    if task.dtype.kind in "iu" or era.dtype.kind in "iu":
+        raise ValueError("task and era must be names: integer codes differ between band tables")
+    cols = _role_columns(data, person_col)
+    # Row codes into the flattened (tasks, eras) plane of the stack
+    codes = stack.task_codes(task) * stack.low.shape[2] + stack.era_codes(era)
+    flat_low = stack.low.reshape(len(tables), -1)
+    flat_high = stack.high.reshape(len(tables), -1)
+
+    n_roles = len(codes)
+    dose_low = np.empty((len(tables), n_roles))
+    dose_high = np.empty((len(tables), n_roles))
+    step = max(1, _BLOCK // len(tables))
+    for i in range(0, n_roles, step):
+        sl = slice(i, i + step)
+        # Table-independent factors once; same operations and order as
+        # core.compute_role, so each row matches that table's estimate.
+        f_mult = (cols["days"][sl] / 5.0) * (cols["hours"][sl] / 8.0)
+        c_mult = np.where(cols["rpe"][sl], 0.5, 1.0) * np.where(cols["lev"][sl], 0.8, 1.0)
+        years = np.maximum(0, cols["end"][sl] - cols["start"][sl])
+        band = codes[sl]
+        dose_low[:, sl] = _round(flat_low[:, band] * f_mult * c_mult * years, 3)
+        dose_high[:, sl] = _round(flat_high[:, band] * f_mult * c_mult * years, 3)
+
+    inverse, n = cols["inverse"], len(cols["ids"])
+    # bincount adds in input order, matching estimate_all's running sum
+    return {
+        "tables": [t.label for t in tables],
+        "versions": [t.version for t in tables],
+        "digests": [t.digest for t in tables],
+        "person_id": cols["ids"],
+        "total_low": _round(np.stack([np.bincount(inverse, d, minlength=n) for d in dose_low]), 2),
+        "total_high": _round(np.stack([np.bincount(inverse, d, minlength=n) for d in dose_high]), 2),
+    }
+
+def compare(roles: List[Any], tables: Optional[Sequence[BandTable]] = None) -> List[Dict[str, Any]]:
+    """One history's totals under each table: [{"table", "version",
+    "digest", "total_low", "total_high"}], the current table first."""
+    if not roles:
+        raise ValueError("history has no roles")
+    res = compare_batch(roles_to_columns(roles), tables)
+    return [
+        {"table": name, "version": version, "digest": digest, "total_low": float(low), "total_high": float(high)}
+        for name, version, digest, low, high in zip(res["tables"], res["versions"], res["digests"],
+                                                    res["total_low"][:, 0], res["total_high"][:, 0])
+    ]
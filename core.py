@@ -1,21 +1,23 @@
 # core.py
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import List, Dict, Any, Tuple
+import math
+from typing import List, Dict, Any, Iterable, Mapping, Tuple
 from datetime import datetime
 
-# === Your existing constants ===
-BASE_BANDS: Dict[Tuple[str, str], Tuple[float, float]] = {
-    ("lagging/insulation", "pre-1980"): (5.0, 10.0),
-    ("maintenance/demolition", "pre-1980"): (0.5, 2.0),
-    ("cement/board cutting", "pre-1980"): (1.0, 5.0),
-    ("garage/brakes", "pre-1980"): (0.2, 1.0),
-    ("bystander", "pre-1980"): (0.1, 0.5),
-    ("lagging/insulation", "1980-1999"): (0.5, 2.0),
-    ("maintenance/demolition", "1980-1999"): (0.2, 0.8),
-    ("bystander", "1980-1999"): (0.05, 0.2),
-    ("any", "2000+"): (0.01, 0.05),
-}
+import bands
+from bands import BandTable
+
+# Task/era choices offered in the UI. Integer codes for estimate_batch come
+# from the band table (bands.current().encode_tasks / encode_eras).
+TASKS: Tuple[str, ...] = (
+    "lagging/insulation",
+    "maintenance/demolition",
+    "cement/board cutting",
+    "garage/brakes",
+    "bystander",
+)
+ERAS: Tuple[str, ...] = ("pre-1980", "1980-1999", "2000+")
 
 DISCLAIMER = (
     "Educational use only. This estimator provides a non-diagnostic approximation of cumulative exposure "
@@ -24,13 +26,97 @@ DISCLAIMER = (
     "© 2025 Dr W. Kent. Independent of sponsors; no editorial input from any funder."
 )
 
+# === Typed records ===
+
+ROLE_FIELDS: Tuple[str, ...] = ("task", "era", "start_year", "end_year", "days_per_week", "hours_per_day", "rpe", "lev")
+RESULT_FIELDS: Tuple[str, ...] = ("task", "era", "years", "base_band_low", "base_band_high",
+                                  "adj_band_low", "adj_band_high", "dose_low", "dose_high")
+
+_shared: Dict[Tuple[type, Any], Any] = {}
+
+def _share(value):
+    # Years, frequencies and task/era labels repeat endlessly across a
+    # cohort; keep one object per distinct value (bounded, in case of junk).
+    key = (type(value), value)
+    v = _shared.get(key)
+    if v is None:
+        if len(_shared) >= 65536:
+            return value
+        v = _shared[key] = value
+    return v
+
+@dataclass(frozen=True, slots=True)
+class Role:
+    """One exposure role, cast and checked once. Reads like the dict shape
+    (role["task"]) so code written for dicts accepts it unchanged."""
+    task: str
+    era: str
+    start_year: int
+    end_year: int
+    days_per_week: float
+    hours_per_day: float
+    rpe: bool
+    lev: bool
+
+    @classmethod
+    def from_dict(cls, d: Mapping[str, Any]) -> "Role":
+        days = float(d["days_per_week"])
+        hours = float(d["hours_per_day"])
+        if not (math.isfinite(days) and math.isfinite(hours)):
+            raise ValueError("days_per_week and hours_per_day must be finite numbers")
+        return cls(
+            _share(str(d["task"])), _share(str(d["era"])),
+            _share(int(d["start_year"])), _share(int(d["end_year"])),
+            _share(days), _share(hours),
+            bool(d["rpe"]), bool(d["lev"]),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task, "era": self.era,
+            "start_year": self.start_year, "end_year": self.end_year,
+            "days_per_week": self.days_per_week, "hours_per_day": self.hours_per_day,
+            "rpe": self.rpe, "lev": self.lev,
+        }
+
+    def __getitem__(self, key: str):
+        if key not in ROLE_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+@dataclass(frozen=True, slots=True)
+class RoleResult:
+    """compute_role output for a Role; to_dict() gives the JSON shape."""
+    task: str
+    era: str
+    years: int
+    base_band_low: float
+    base_band_high: float
+    adj_band_low: float
+    adj_band_high: float
+    dose_low: float
+    dose_high: float
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task": self.task, "era": self.era, "years": self.years,
+            "base_band_low": self.base_band_low, "base_band_high": self.base_band_high,
+            "adj_band_low": self.adj_band_low, "adj_band_high": self.adj_band_high,
+            "dose_low": self.dose_low, "dose_high": self.dose_high,
+        }
+
+    def __getitem__(self, key: str):
+        if key not in RESULT_FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+def roles_from_dicts(roles: Iterable[Mapping[str, Any]]) -> List[Role]:
+    return [Role.from_dict(r) for r in roles]
+
+# === Estimation ===
+
 def band_for(task: str, era: str) -> Tuple[float, float]:
-    key = (task.lower().strip(), era.strip())
-    if key in BASE_BANDS:
-        return BASE_BANDS[key]
-    if era == "2000+":
-        return BASE_BANDS[("any", "2000+")]
-    return (0.05, 0.2)
+    return bands.current().band(task, era)
 
 def control_multiplier(rpe_consistent: bool, lev: bool) -> float:
     mult = 1.0
@@ -43,18 +129,32 @@ def control_multiplier(rpe_consistent: bool, lev: bool) -> float:
 def freq_multiplier(days_per_week: float, hours_per_day: float) -> float:
     return (days_per_week / 5.0) * (hours_per_day / 8.0)
 
-def compute_role(role: Dict[str, Any]) -> Dict[str, Any]:
-    low, high = band_for(role["task"], role["era"])
-    f_mult = freq_multiplier(float(role["days_per_week"]), float(role["hours_per_day"]))
-    c_mult = control_multiplier(bool(role["rpe"]), bool(role["lev"]))
+def compute_role(role):
+    """Estimate one role. A Role gives a RoleResult; a dict (the JSON/UI
+    shape) is cast field by field and gives the equivalent dict."""
+    typed = isinstance(role, Role)
+    if typed:
+        task, era = role.task, role.era
+        low, high = band_for(task, era)
+        f_mult = freq_multiplier(role.days_per_week, role.hours_per_day)
+        c_mult = control_multiplier(role.rpe, role.lev)
+        years = max(0, role.end_year - role.start_year)
+    else:
+        task, era = role["task"], role["era"]
+        low, high = band_for(task, era)
+        f_mult = freq_multiplier(float(role["days_per_week"]), float(role["hours_per_day"]))
+        c_mult = control_multiplier(bool(role["rpe"]), bool(role["lev"]))
+        years = max(0, int(role["end_year"]) - int(role["start_year"]))
     adj_low = low * f_mult * c_mult
     adj_high = high * f_mult * c_mult
-    years = max(0, int(role["end_year"]) - int(role["start_year"]))
     dose_low = adj_low * years
     dose_high = adj_high * years
+    if typed:
+        return RoleResult(task, era, years, round(low, 3), round(high, 3), round(adj_low, 3),
+                          round(adj_high, 3), round(dose_low, 3), round(dose_high, 3))
     return {
-        "task": role["task"],
-        "era": role["era"],
+        "task": task,
+        "era": era,
         "years": years,
         "base_band_low": round(low, 3),
         "base_band_high": round(high, 3),
@@ -64,18 +164,18 @@ def compute_role(role: Dict[str, Any]) -> Dict[str, Any]:
         "dose_high": round(dose_high, 3),
     }
 
-def estimate_all(roles: List[Dict[str, Any]]) -> Dict[str, Any]:
+def estimate_all(roles: List[Any], compute=compute_role) -> Dict[str, Any]:
     summaries = []
     total_low = 0.0
     total_high = 0.0
     first_exposure_year = None
 
     for r in roles:
-        res = compute_role(r)
+        res = compute(r)
         summaries.append(res)
         total_low += res["dose_low"]
         total_high += res["dose_high"]
-        sy = int(r["start_year"])
+        sy = r.start_year if isinstance(r, Role) else int(r["start_year"])
         if first_exposure_year is None or sy < first_exposure_year:
             first_exposure_year = sy
 
@@ -90,3 +190,57 @@ def estimate_all(roles: List[Dict[str, Any]]) -> Dict[str, Any]:
         "latency_years": latency,
         "disclaimer": DISCLAIMER,
     }
+
+def to_json(result: Dict[str, Any]) -> Dict[str, Any]:
+    # estimate_all output with RoleResult summaries -> plain dicts
+    return {**result, "summaries": [s.to_dict() if isinstance(s, RoleResult) else s for s in result["summaries"]]}
+
+# === Columnar / cohort engine (NumPy, imported on first use) ===
+
+def roles_to_columns(roles: List[Any]) -> Dict[str, List[Any]]:
+    return {f: [r[f] for r in roles] for f in ROLE_FIELDS}
+
+def role_records(roles, person_ids=None, table: BandTable = None):
+    """Roles (Role objects or dicts) as a NumPy structured array of
+    cohort.ROLE_DTYPE, 26 bytes a role; see cohort.role_records."""
+    import cohort
+    return cohort.role_records(roles, person_ids, table)
+
+def role_arrays(data, person_col: str = "person_id", table: BandTable = None) -> Dict[str, Any]:
+    """Parse columnar role data into NumPy arrays; see cohort.role_arrays."""
+    import cohort
+    return cohort.role_arrays(data, person_col, table)
+
+def estimate_batch(data, person_col: str = "person_id", table: BandTable = None) -> Dict[str, Any]:
+    """Columnar estimate_all: `data` is a DataFrame, a dict of equal-length
+    arrays with the role fields (task/era as raw strings, or as codes from
+    `table.encode_tasks`/`encode_eras` -- pass that same `table`), or a
+    role_records() structured array. Rows are
+    grouped into people by `person_col`; without that column the whole batch
+    is treated as one history."""
+    import cohort
+    return cohort.estimate_batch(data, person_col, table)
+
+def main(argv: List[str] = None) -> int:
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["batch"]:
+        import batch
+        return batch.main(argv[1:])
+    if argv[:1] == ["parse"]:
+        import narrative
+        return narrative.main(argv[1:])
+    if argv[:1] == ["reports"]:
+        import bulk
+        return bulk.main(argv[1:])
+    if argv[:1] == ["store"]:
+        import store
+        return store.main(argv[1:])
+    print("usage: python -m core batch INPUT OUTPUT [--workers N] [--errors PATH]\n"
+          "       python -m core parse NARRATIVES OUTPUT [--workers N]\n"
+          "       python -m core reports INPUT OUT.zip|OUT.pdf [--workers N] [--timeline]\n"
+          "       python -m core store {append,query} STORE ...", file=sys.stderr)
+    return 2
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,189 @@
+# editor.py
+# Live estimates for the Gradio role grid. An EditSession keeps, per browser
+# session, the last grid it saw with each row's parsed Role and result; a new
+# submission is diffed against it and only rows that changed are parsed and
+# estimated; the earliest start year moves by delta and the totals are re-added
+# from the per-row doses in one vectorised pass.
+from __future__ import annotations
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import bands
+import memo
+from core import RESULT_FIELDS, RoleResult
+from ingest import ingest_frame
+
+class _Row:
+    # One grid row as last seen: its result or parse errors (rows with
+    # neither are blank).
+    __slots__ = ("result", "start_year", "errors")
+
+    def __init__(self):
+        self.result: Optional[RoleResult] = None
+        self.start_year: Optional[int] = None
+        self.errors: List[Dict[str, Any]] = []
+
+def _columns(df: pd.DataFrame) -> List[np.ndarray]:
+    # Copies: a view would follow later in-place edits of the same frame.
+    return [df[c].to_numpy(copy=True) for c in df.columns]
+
+def _changed(new: List[np.ndarray], old: List[np.ndarray]) -> List[int]:
+    # Rows where any cell differs, one vectorised comparison per column.
+    # Missing cells never compare equal, so candidates that are missing on
+    # both sides are dropped afterwards (there are few).
+    n = len(new[0]) if new else 0
+    diff = np.zeros(n, dtype=bool)
+    for a, b in zip(new, old):
+        ne = a != b
+        diff |= ne if isinstance(ne, np.ndarray) else np.ones(n, dtype=bool)
+    rows = np.flatnonzero(diff)
+    if not len(rows):
+        return []
+    same = np.ones(len(rows), dtype=bool)
+    for a, b in zip(new, old):
+        x, y = a[rows], b[rows]
+        same &= (x == y) | (pd.isna(x) & pd.isna(y))
+    return rows[~same].tolist()
+
+def _fingerprints(cols: List[np.ndarray]) -> List[tuple]:
+    return list(zip(*(c.tolist() for c in cols)))
+
+def _total(doses: np.ndarray) -> float:
+    # Added row after row, like estimate_all's running total (cumsum is
+    # sequential; sum() would add pairwise and can differ in the last place).
+    return round(float(np.cumsum(doses)[-1]), 2) if len(doses) else 0.0
+
+class EditSession:
+    """Incremental estimate_all for a grid edited a row at a time. update()
+    costs one vectorised comparison of the grid plus parsing and estimating
+    the changed rows; the totals equal estimate_all's on the same rows."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self) -> None:
+        self.table: Optional[bands.BandTable] = None
+        self.columns: tuple = ()
+        self.cols: Optional[List[np.ndarray]] = None     # the grid as last seen, by column
+        self.rows: List[_Row] = []
+        self.low = np.zeros(0)          # dose per grid row, 0.0 where the row has no result
+        self.high = np.zeros(0)
+        self.start_years: Counter = Counter()
+        self.summaries: Optional[pd.DataFrame] = None
+        self.errors: Optional[pd.DataFrame] = None
+        self._summary_row: Optional[np.ndarray] = None   # grid row -> summaries row
+        self.recomputed = 0             # rows parsed by the last update
+
+    def _add(self, row: _Row) -> None:
+        if row.result is not None:
+            self.start_years[row.start_year] += 1
+
+    def _remove(self, row: _Row) -> None:
+        if row.result is not None:
+            self.start_years[row.start_year] -= 1
+            if not self.start_years[row.start_year]:
+                del self.start_years[row.start_year]
+
+    def _parse(self, df: pd.DataFrame, positions: List[int]) -> List[_Row]:
+        # Same coercion and validation as the Estimate button (ingest_frame),
+        # on just these rows.
+        rows = [_Row() for _ in positions]
+        if not positions:
+            return rows
+        ingested = ingest_frame(df.iloc[positions], self.table)
+        for i, role in zip(ingested.rows.tolist(), ingested.roles()):
+            rows[i].result = memo.compute_role(role)
+            rows[i].start_year = role.start_year
+        for e in ingested.errors:
+            rows[e["row"] - 1].errors.append({k: v for k, v in e.items() if k != "row"})
+        return rows
+
+    def update(self, df: pd.DataFrame) -> Dict[str, Any]:
+        """Bring the state in line with `df` (the whole grid) and return an
+        estimate_all-style result plus `errors` (the Skipped rows frame)."""
+        table = bands.current()
+        cols = _columns(df)
+        columns = tuple(df.columns)
+        old = self.rows
+        if table is not self.table or columns != self.columns or self.cols is None:
+            # First call, a reloaded band table or a different grid layout
+            self._reset()
+            self.table, self.columns = table, columns
+            changed = list(range(len(df)))
+            rows = self._parse(df, changed)
+            for r in rows:
+                self._add(r)
+            in_place = False
+        elif len(df) == len(old):
+            # Edited in place: compare position by position
+            changed = _changed(cols, self.cols)
+            fresh = self._parse(df, changed)
+            rows = list(old)
+            for p, r in zip(changed, fresh):
+                self._remove(old[p])
+                self._add(r)
+                rows[p] = r
+            in_place = all((old[p].result is None) == (rows[p].result is None) for p in changed) and \
+                all(not old[p].errors and not rows[p].errors for p in changed)
+        else:
+            # Rows added or deleted: reuse every row whose cells are unchanged
+            pool: Dict[tuple, List[_Row]] = {}
+            for key, r in zip(_fingerprints(self.cols), old):
+                pool.setdefault(key, []).append(r)
+            rows: List[Optional[_Row]] = []
+            missing = []
+            for p, c in enumerate(_fingerprints(cols)):
+                stack = pool.get(c)
+                rows.append(stack.pop() if stack else None)
+                if rows[-1] is None:
+                    missing.append(p)
+            for stack in pool.values():
+                for r in stack:
+                    self._remove(r)
+            for p, r in zip(missing, self._parse(df, missing)):
+                rows[p] = r
+                self._add(r)
+            changed = missing
+            in_place = False
+        self.cols = cols
+        self.rows = rows
+        self.recomputed = len(changed)
+        self._refresh_doses(changed)
+        self._refresh_frames(changed, in_place)
+        first = min(self.start_years, default=None)
+        return {
+            "summaries": self.summaries,
+            "total_low": _total(self.low),
+            "total_high": _total(self.high),
+            "latency_years": datetime.now().year - first if first else None,
+            "errors": self.errors,
+            "valid": sum(self.start_years.values()),
+        }
+
+    def _refresh_doses(self, changed: List[int]) -> None:
+        if len(self.low) == len(self.rows):
+            # Same rows, edited in place
+            for p in changed:
+                r = self.rows[p].result
+                self.low[p], self.high[p] = (r.dose_low, r.dose_high) if r is not None else (0.0, 0.0)
+            return
+        self.low = np.array([r.result.dose_low if r.result is not None else 0.0 for r in self.rows], dtype=float)
+        self.high = np.array([r.result.dose_high if r.result is not None else 0.0 for r in self.rows], dtype=float)
+
+    def _refresh_frames(self, changed: List[int], in_place: bool) -> None:
+        if in_place and self.summaries is not None:
+            # Same rows valid as before: overwrite just the changed summaries
+            for p in changed:
+                self.summaries.iloc[self._summary_row[p]] = list(self.rows[p].result.to_dict().values())
+            return
+        self._summary_row = np.cumsum([r.result is not None for r in self.rows]) - 1
+        self.summaries = pd.DataFrame([r.result.to_dict() for r in self.rows if r.result is not None],
+                                      columns=list(RESULT_FIELDS))
+        self.errors = pd.DataFrame(
+            [{"row": p + 1, **e} for p, r in enumerate(self.rows) for e in r.errors],
+            columns=["row", "field", "value", "error"],
+        )
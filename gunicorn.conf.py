@@ -0,0 +1,28 @@
+# gunicorn.conf.py
+# Production server settings (used by the Dockerfile). Unless
+# ASBESTOS_PRELOAD=0, the app is imported and preload.preload() run once in
+# the master, so workers fork with the band tables, ReportLab assets and the
+# lazily imported modules already built, shared copy-on-write.
+import os
+
+import preload
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '7860')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+# Read by report.py: the workers split the PDF cache limits between them
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 120
+preload_app = preload.ENABLED
+
+def when_ready(server):
+    # After the app is loaded in the master, before the first fork
+    if preload_app:
+        rep = preload.preload()
+        server.log.info("Preloaded in %.0f ms (%d objects frozen)", rep["seconds"] * 1e3, rep["frozen"])
+
+def post_fork(server, worker):
+    preload.mark_fork()
+
+def post_worker_init(worker):
+    preload.worker_booted(preload_app)
@@ -0,0 +1,98 @@
+# importtime.py
+# Reproducible import-time report for the app's entry modules, built on
+# `python -X importtime`. Each module is imported in a fresh interpreter
+# several times and the median is reported, along with the heaviest
+# third-party packages it pulled in.
+#
+#   python importtime.py                       # table for the default modules
+#   python importtime.py core server --runs 7
+#   python importtime.py --json importtime.json --budget core=30 --budget server=400
+from __future__ import annotations
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+MODULES = ["core", "bands", "memo", "batch", "narrative", "report", "server", "app"]
+# Packages that must not show up on the headless path
+HEAVY = ("gradio", "pandas", "numpy", "reportlab", "matplotlib")
+
+def _parse(stderr: str) -> List[Tuple[int, int, str]]:
+    # "import time: self [us] | cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((depth, int(cum_us), name.strip()))
+    return rows
+
+def measure(module: str, runs: int = 5) -> Dict[str, object]:
+    totals = []
+    packages: Dict[str, List[int]] = {}
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="")
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        if proc.returncode != 0:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1]}
+        rows = _parse(proc.stderr)
+        # Children are printed before their parent: the module's subtree is
+        # everything between the previous top-level line and its own line.
+        end = max(i for i, (depth, _, name) in enumerate(rows) if depth == 0 and name == module)
+        start = max((i for i in range(end) if rows[i][0] == 0), default=-1) + 1
+        totals.append(rows[end][1])
+        for _, cum, name in rows[start:end]:
+            top = name.split(".")[0]
+            if name == top and top != module:
+                packages.setdefault(top, []).append(cum)
+    heaviest = sorted(((statistics.median(v) / 1000, k) for k, v in packages.items()), reverse=True)[:8]
+    return {
+        "module": module,
+        "median_ms": round(statistics.median(totals) / 1000, 1),
+        "min_ms": round(min(totals) / 1000, 1),
+        "heavy_imports": sorted(k for k in packages if k in HEAVY),
+        "top": [{"package": k, "ms": round(ms, 1)} for ms, k in heaviest],
+    }
+
+def main(argv: List[str] = None) -> int:
+    p = argparse.ArgumentParser(description=__doc__)
+    p.add_argument("modules", nargs="*", default=MODULES)
+    p.add_argument("--runs", type=int, default=5)
+    p.add_argument("--json", help="also write the report to this file")
+    p.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                   help="fail if MODULE's median import time exceeds MS")
+    args = p.parse_args(argv)
+
+    report = [measure(m, args.runs) for m in args.modules]
+    for r in report:
+        if "error" in r:
+            print(f"{r['module']:<10} failed: {r['error']}")
+            continue
+        heavy = ", ".join(r["heavy_imports"]) or "-"
+        top = ", ".join(f"{t['package']} {t['ms']:.0f}" for t in r["top"][:4])
+        print(f"{r['module']:<10} {r['median_ms']:>8.1f} ms   heavy: {heavy:<30} top: {top}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "runs": args.runs, "modules": report}, f, indent=2)
+
+    failed = False
+    by_name = {r["module"]: r for r in report}
+    for spec in args.budget:
+        name, _, limit = spec.partition("=")
+        r = by_name.get(name)
+        if r is None or "error" in r or r["median_ms"] > float(limit):
+            got = r.get("median_ms", r.get("error")) if r else "not measured"
+            print(f"budget exceeded: {name} {got} > {limit} ms", file=sys.stderr)
+            failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+# ingest.py
+# Column-at-a-time conversion of a role table (the Gradio grid, a pasted
+# spreadsheet) into clean arrays for the estimators, plus a per-row report of
+# what was rejected and why.
+from __future__ import annotations
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import bands
+from bands import BandTable
+from core import ROLE_FIELDS, Role
+
+TRUE_WORDS = frozenset({"true", "t", "yes", "y", "1", "x", "on"})
+FALSE_WORDS = frozenset({"false", "f", "no", "n", "0", "off", "", "nan", "none"})
+
+@dataclass
+class Ingested:
+    # ROLE_FIELDS as arrays for the valid rows only; task/era are codes into
+    # `table` (core.estimate_batch(columns, table=table) reads them as-is).
+    columns: Dict[str, np.ndarray]
+    # Stripped task/era text for the same rows, for display and dict output
+    labels: Dict[str, np.ndarray]
+    # Original row positions of the valid rows
+    rows: np.ndarray
+    # One entry per rejected row problem: {"row", "field", "value", "error"}
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+    table: BandTable = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def roles(self) -> List[Role]:
+        c = self.columns
+        return [
+            Role(task, era, start, end, days, hours, rpe, lev)
+            for task, era, start, end, days, hours, rpe, lev in zip(
+                self.labels["task"].tolist(), self.labels["era"].tolist(),
+                c["start_year"].tolist(), c["end_year"].tolist(),
+                c["days_per_week"].tolist(), c["hours_per_day"].tolist(),
+                c["rpe"].tolist(), c["lev"].tolist(),
+            )
+        ]
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name].reset_index(drop=True)
+    return pd.Series([None] * len(df), dtype=object)
+
+def _boolean(value) -> int:
+    # 1/0 for true/false, -1 if unparseable; an empty cell is False (an unticked box)
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    word = str(value).strip().lower()
+    if word in TRUE_WORDS:
+        return 1
+    if word in FALSE_WORDS:
+        return 0
+    try:
+        return int(float(word) != 0)
+    except ValueError:
+        return -1
+
+class _Column:
+    """One input column. Text columns (what the grid and CSV pastes produce)
+    repeat a handful of values, so they are factorized once and every parse
+    below works on the distinct values only."""
+
+    def __init__(self, col: pd.Series):
+        self.col = col
+        self.text = col.dtype.kind not in "biufc"
+        if self.text:
+            self.codes, uniques = pd.factorize(col, use_na_sentinel=True)
+            self.uniques = pd.Series(uniques, dtype=object)
+            # index -1 (missing) picks the trailing ""
+            self.stripped = np.array([str(u).strip() for u in uniques] + [""], dtype=object)
+
+    def _take(self, values: np.ndarray, missing) -> np.ndarray:
+        return np.append(values, missing)[self.codes]
+
+    def blank(self) -> np.ndarray:
+        if not self.text:
+            return self.col.isna().to_numpy()
+        return self._take(self.stripped[:-1] == "", True)
+
+    def strings(self) -> Tuple[np.ndarray, np.ndarray]:
+        # (per-row index, stripped distinct values)
+        if not self.text:
+            return np.arange(len(self.col)), self.col.astype(str).str.strip().to_numpy(dtype=object)
+        return self.codes, self.stripped
+
+    def numbers(self) -> np.ndarray:
+        if not self.text:
+            return pd.to_numeric(self.col, errors="coerce").to_numpy(dtype=float)
+        parsed = pd.to_numeric(pd.Series(self.stripped[:-1], dtype=object), errors="coerce")
+        return self._take(parsed.to_numpy(dtype=float), np.nan)
+
+    def booleans(self) -> Tuple[np.ndarray, np.ndarray]:
+        # -> (values, ok)
+        if self.col.dtype == bool:
+            return self.col.to_numpy(), np.ones(len(self.col), dtype=bool)
+        if not self.text:
+            return np.nan_to_num(self.col.to_numpy(dtype=float)) != 0, np.ones(len(self.col), dtype=bool)
+        parsed = self._take(np.array([_boolean(u) for u in self.uniques], dtype=np.int8), 0)
+        return parsed == 1, parsed >= 0
+
+def ingest_frame(df: pd.DataFrame, table: BandTable = None) -> Ingested:
+    """Coerce a role table to clean columns. Completely empty rows are
+    ignored; any other row with a missing or unparseable field is dropped and
+    reported in `errors`."""
+    table = table or bands.current()
+    n = len(df)
+    cols = {f: _Column(_column(df, f)) for f in ROLE_FIELDS}
+    blank = {f: c.blank() for f, c in cols.items()}
+    empty_row = np.logical_and.reduce([blank[f] for f in ROLE_FIELDS]) if n else np.zeros(0, dtype=bool)
+
+    problems: Dict[str, np.ndarray] = {}   # field -> rows that fail it
+    messages: Dict[str, str] = {}
+
+    def check(name: str, bad: np.ndarray, message: str) -> None:
+        bad = bad & ~empty_row
+        if bad.any():
+            problems[name] = bad
+            messages[name] = message
+
+    task_idx, task_text = cols["task"].strings()
+    era_idx, era_text = cols["era"].strings()
+    check("task", blank["task"], "missing task")
+    check("era", blank["era"], "missing era")
+
+    numbers = {}
+    for f in ("start_year", "end_year", "days_per_week", "hours_per_day"):
+        numbers[f] = cols[f].numbers()
+        check(f, ~np.isfinite(numbers[f]), f"{f} is missing or not a number")
+
+    flags = {}
+    for f in ("rpe", "lev"):
+        flags[f], ok = cols[f].booleans()
+        check(f, ~ok, f"{f} must be true/false")
+
+    valid = ~empty_row
+    for bad in problems.values():
+        valid &= ~bad
+    keep = np.flatnonzero(valid)
+
+    errors = []
+    if problems:
+        for name, bad in problems.items():
+            for i in np.flatnonzero(bad).tolist():
+                value = cols[name].col.iat[i]
+                errors.append({
+                    "row": i + 1,
+                    "field": name,
+                    "value": None if pd.isna(value) else str(value),
+                    "error": messages[name],
+                })
+        errors.sort(key=lambda e: (e["row"], ROLE_FIELDS.index(e["field"])))
+
+    # Map the (few) distinct task/era strings to band-table codes.
+    task_codes = np.array([table.task_code(t) for t in task_text], dtype=np.int16)
+    era_codes = np.array([table.era_code(e) for e in era_text], dtype=np.int16)
+    columns = {
+        "task": task_codes[task_idx[keep]],
+        "era": era_codes[era_idx[keep]],
+        # int() semantics: truncate towards zero
+        "start_year": numbers["start_year"][keep].astype(np.int64),
+        "end_year": numbers["end_year"][keep].astype(np.int64),
+        "days_per_week": numbers["days_per_week"][keep],
+        "hours_per_day": numbers["hours_per_day"][keep],
+        "rpe": flags["rpe"][keep].astype(bool),
+        "lev": flags["lev"][keep].astype(bool),
+    }
+    labels = {"task": task_text[task_idx[keep]], "era": era_text[era_idx[keep]]}
+    return Ingested(columns=columns, labels=labels, rows=keep, errors=errors, table=table)
+
+def errors_frame(ingested: Ingested) -> pd.DataFrame:
+    return pd.DataFrame(ingested.errors, columns=["row", "field", "value", "error"])
@@ -0,0 +1,380 @@
+# loadtest.py
+# Load test for the web endpoints. Starts server.py locally (gunicorn with the
+# deployed gunicorn.conf.py, or uvicorn) or targets --url, sends recorded or
+# synthetic traffic to /estimate, /export_pdf and /ai/parse_history, and
+# reports throughput, latency percentiles and error rates per endpoint.
+#
+#   python loadtest.py --concurrency 16 --duration 30                  # closed loop
+#   python loadtest.py --rate 40 --duration 60 --workers 2 --out w2.json   # open loop
+#   python loadtest.py --replay traffic.jsonl --url http://127.0.0.1:7860
+#
+# --replay takes JSONL, one request per line:
+#   {"path": "/estimate", "body": {...}, "t": 12.5}
+# ("method" defaults to POST; "t", seconds from the start of the recording,
+# is only used with --speed to replay at the recorded pace). Lines in the
+# batch input format (a history, {"id", "roles"} or a bare list of roles) are
+# sent to /estimate, so a batch file replays as-is.
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from batch import _history_from_json
+from bench import SEED, synthetic_histories, synthetic_narratives
+
+ENDPOINTS = ("/estimate", "/export_pdf", "/ai/parse_history")
+MIX = {"/estimate": 0.7, "/export_pdf": 0.2, "/ai/parse_history": 0.1}
+POOL = 1000                 # distinct synthetic bodies per endpoint
+TIMEOUT = 130.0             # client timeout; above gunicorn's 120 s worker timeout
+STARTUP_TIMEOUT = 60.0
+
+# Request = (method, path, JSON body, recorded offset or None)
+Request = Tuple[str, str, Any, Optional[float]]
+
+# === Traffic ===
+
+def read_log(path: str) -> List[Request]:
+    out = []
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                rec = json.loads(line)
+                if isinstance(rec, dict) and "path" in rec:
+                    out.append((rec.get("method", "POST").upper(), rec["path"], rec.get("body"), rec.get("t")))
+                else:
+                    _, roles = _history_from_json(line)
+                    out.append(("POST", "/estimate", {"roles": roles}, None))
+            except (ValueError, KeyError, AttributeError) as e:
+                raise ValueError(f"{path}:{lineno}: {type(e).__name__}: {e}") from None
+    if not out:
+        raise ValueError(f"{path}: no requests")
+    return out
+
+def replay(log: List[Request]) -> Iterator[Request]:
+    # The log in order, over and over (offsets shift by the log's span each pass).
+    span = max((r[3] or 0.0) for r in log) + 1.0
+    n = 0
+    while True:
+        for method, path, body, t in log:
+            yield method, path, body, None if t is None else t + n * span
+        n += 1
+
+def synthetic(mix: Dict[str, float], cold_pdf: bool = False, seed: int = SEED) -> Iterator[Request]:
+    """Requests drawn from `mix` (path -> weight), bodies from bench's
+    seeded synthetic cohort. Repeated PDF bodies are served from the
+    report cache; cold_pdf makes every one distinct (a fresh render)."""
+    rng = random.Random(seed)
+    histories = [h["roles"] for h in synthetic_histories(POOL, seed)]
+    texts = synthetic_narratives(POOL, seed)
+    paths = list(mix)
+    weights = [mix[p] for p in paths]
+    n = 0
+    while True:
+        n += 1
+        path = rng.choices(paths, weights)[0]
+        roles = histories[rng.randrange(POOL)]
+        if path == "/estimate":
+            body = {"roles": roles}
+        elif path == "/export_pdf":
+            body = {"roles": roles, "totals": {"low": 1.0, "high": 2.0, "latency": n if cold_pdf else 40}}
+        elif path == "/ai/parse_history":
+            body = {"text": texts[rng.randrange(POOL)]}
+        else:
+            raise ValueError(f"no synthetic body for {path}")
+        yield "POST", path, body, None
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    # "estimate=7,export_pdf=2,parse_history=1"
+    names = {p.rsplit("/", 1)[-1]: p for p in ENDPOINTS}
+    mix = {}
+    for part in filter(None, spec.split(",")):
+        name, _, weight = part.partition("=")
+        if name.strip() not in names:
+            raise ValueError(f"unknown endpoint {name!r}; choose from {', '.join(names)}")
+        mix[names[name.strip()]] = float(weight or 1)
+    return mix
+
+# === Server ===
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(kind: str, workers: int, port: int) -> Tuple[subprocess.Popen, List[str]]:
+    here = os.path.dirname(os.path.abspath(__file__))
+    if kind == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "-w", str(workers),
+               "server:app", "--bind", f"127.0.0.1:{port}"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    proc = subprocess.Popen(cmd, cwd=here, stdout=subprocess.DEVNULL, start_new_session=True)
+    return proc, cmd
+
+def stop_server(proc: subprocess.Popen) -> None:
+    # The master stops its workers; whatever is left of the group after that goes.
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        pass
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+async def wait_ready(client, url: str, proc: Optional[subprocess.Popen]) -> float:
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < STARTUP_TIMEOUT:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"server exited with status {proc.returncode}")
+        try:
+            if (await client.get(f"{url}/health")).status_code == 200:
+                return time.perf_counter() - t0
+        except Exception:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"server not ready after {STARTUP_TIMEOUT:.0f} s")
+
+# === Load ===
+
+class Recorder:
+    def __init__(self, warmup_until: float):
+        self.warmup_until = warmup_until
+        self.latency: Dict[str, List[float]] = {}
+        self.status: Dict[str, Dict[str, int]] = {}
+
+    def add(self, path: str, started: float, seconds: float, outcome: str) -> None:
+        if started < self.warmup_until:
+            return
+        by = self.status.setdefault(path, {})
+        by[outcome] = by.get(outcome, 0) + 1
+        if outcome.startswith("2"):
+            self.latency.setdefault(path, []).append(seconds)
+
+async def _send(client, url: str, req: Request, scheduled: float, rec: Recorder) -> None:
+    method, path, body, _ = req
+    try:
+        r = await client.request(method, url + path, json=body)
+        await r.aread()
+        outcome = str(r.status_code)
+    except Exception as e:     # timeouts, refused/reset connections
+        outcome = type(e).__name__
+    # Measured from when the request was due, not when it went out, so a
+    # backed-up client doesn't hide server queueing (coordinated omission).
+    rec.add(path, scheduled, time.perf_counter() - scheduled, outcome)
+
+async def closed_loop(client, url: str, traffic: Iterator[Request], concurrency: int,
+                      until: float, rec: Recorder) -> None:
+    async def user() -> None:
+        while time.perf_counter() < until:
+            await _send(client, url, next(traffic), time.perf_counter(), rec)
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+
+async def open_loop(client, url: str, traffic: Iterator[Request], rate: Optional[float], speed: Optional[float],
+                    max_inflight: int, until: float, rec: Recorder, poisson: bool = True, seed: int = SEED) -> int:
+    # Arrivals at `rate` per second (or at the log's recorded offsets / speed)
+    # whatever the responses do. Returns the arrivals skipped because
+    # max_inflight requests were already outstanding.
+    rng = random.Random(seed)
+    inflight: set = set()
+    skipped = 0
+    t0 = due = time.perf_counter()
+    while True:
+        req = next(traffic)
+        if speed:
+            due = t0 + (req[3] or 0.0) / speed
+        else:
+            due += rng.expovariate(rate) if poisson else 1.0 / rate
+        if due >= until:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(inflight) >= max_inflight:
+            skipped += 1
+            rec.add(req[1], due, 0.0, "skipped")
+            continue
+        task = asyncio.create_task(_send(client, url, req, due, rec))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.wait(inflight)
+    return skipped
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1e3, 1)
+
+def _percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    # Nearest rank; None (null in the report) when nothing succeeded
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+def summarise(rec: Recorder, seconds: float) -> Dict[str, Any]:
+    out = {}
+    for path in sorted(set(rec.status) | set(rec.latency)):
+        lat = sorted(rec.latency.get(path, []))
+        status = rec.status.get(path, {})
+        total = sum(status.values())
+        errors = total - len(lat)
+        out[path] = {
+            "requests": total,
+            "ok": len(lat),
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(len(lat) / seconds, 2),
+            **{f"p{q}_ms": _ms(_percentile(lat, q)) for q in (50, 95, 99)},
+            "max_ms": _ms(lat[-1] if lat else None),
+            "mean_ms": _ms(sum(lat) / len(lat) if lat else None),
+            "status": dict(sorted(status.items())),
+        }
+    return out
+
+async def run(args) -> Dict[str, Any]:
+    import httpx
+    if args.replay:
+        log = read_log(args.replay)
+        if args.speed and any(r[3] is None for r in log):
+            raise ValueError(f"{args.replay}: --speed needs a recorded \"t\" on every line")
+        traffic = replay(log)
+    else:
+        traffic = synthetic(parse_mix(args.mix), args.cold_pdf)
+    proc = None
+    cmd = None
+    url = args.url.rstrip("/") if args.url else None
+    if url is None:
+        port = _free_port()
+        proc, cmd = start_server(args.server, args.workers, port)
+        url = f"http://127.0.0.1:{port}"
+    open_ = bool(args.rate or args.speed)
+    limit = args.max_inflight if open_ else args.concurrency
+    limits = httpx.Limits(max_connections=limit, max_keepalive_connections=limit)
+    try:
+        async with httpx.AsyncClient(timeout=TIMEOUT, limits=limits) as client:
+            startup = await wait_ready(client, url, proc)
+            t0 = time.perf_counter()
+            rec = Recorder(t0 + args.warmup)
+            until = t0 + args.warmup + args.duration
+            skipped = 0
+            if open_:
+                skipped = await open_loop(client, url, traffic, args.rate, args.speed, args.max_inflight, until, rec,
+                                          poisson=args.arrivals == "poisson")
+            else:
+                await closed_loop(client, url, traffic, args.concurrency, until, rec)
+            # Open loop waits for stragglers; they count against the window they arrived in.
+            measured = max(until, time.perf_counter()) - rec.warmup_until
+            server_metrics = None
+            try:
+                r = await client.get(f"{url}/metrics")
+                server_metrics = r.text if r.status_code == 200 else None
+            except Exception:
+                pass
+    finally:
+        if proc is not None:
+            stop_server(proc)
+
+    endpoints = summarise(rec, measured)
+    totals = {"requests": sum(e["requests"] for e in endpoints.values()),
+              "ok": sum(e["ok"] for e in endpoints.values())}
+    totals["errors"] = totals["requests"] - totals["ok"]
+    totals["error_rate"] = round(totals["errors"] / totals["requests"], 4) if totals["requests"] else 0.0
+    totals["throughput_rps"] = round(totals["ok"] / measured, 2)
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "url": url,
+            "server_cmd": cmd,
+            "server_startup_s": round(startup, 2),
+            "env": {k: v for k, v in os.environ.items() if k.startswith("ASBESTOS_")},
+        },
+        "config": {
+            "mode": "open" if open_ else "closed",
+            "concurrency": None if open_ else args.concurrency,
+            "rate": args.rate, "speed": args.speed, "arrivals": args.arrivals if args.rate else None,
+            "max_inflight": args.max_inflight if open_ else None,
+            "duration_s": args.duration, "warmup_s": args.warmup,
+            "workers": None if args.url else args.workers, "server": None if args.url else args.server,
+            "traffic": args.replay or f"synthetic {args.mix}" + (" cold-pdf" if args.cold_pdf else ""),
+        },
+        "measured_s": round(measured, 2),
+        "skipped_arrivals": skipped,
+        "total": totals,
+        "endpoints": endpoints,
+        "server_metrics": server_metrics,
+    }
+
+def _default_server() -> str:
+    try:
+        import gunicorn  # noqa: F401
+        return "gunicorn"
+    except ImportError:
+        return "uvicorn"
+
+def main(argv: List[str] = None) -> int:
+    p = argparse.ArgumentParser(description="Load test /estimate, /export_pdf and /ai/parse_history.")
+    p.add_argument("--url", help="test a running server (default: start one on a free port)")
+    p.add_argument("--server", choices=("gunicorn", "uvicorn"), default=_default_server(),
+                   help="how to start it (default: gunicorn with gunicorn.conf.py if installed, as in the Dockerfile)")
+    p.add_argument("--workers", type=int, default=2, help="server worker processes (default: %(default)s)")
+    p.add_argument("--replay", metavar="LOG", help="JSONL request log to replay (default: synthetic traffic)")
+    p.add_argument("--mix", default="estimate=7,export_pdf=2,parse_history=1",
+                   help="synthetic endpoint weights (default: %(default)s)")
+    p.add_argument("--cold-pdf", action="store_true", help="make every synthetic PDF distinct (no cache hits)")
+    p.add_argument("--concurrency", type=int, default=8, help="closed loop: simultaneous users")
+    p.add_argument("--rate", type=float, help="open loop: arrivals per second")
+    p.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    p.add_argument("--speed", type=float, help="open loop: replay at the log's recorded offsets, this many times faster")
+    p.add_argument("--max-inflight", type=int, default=256, help="open loop: outstanding requests before arrivals are skipped")
+    p.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    p.add_argument("--warmup", type=float, default=3.0, help="seconds of load before measuring")
+    p.add_argument("--out", help="write the JSON report here")
+    args = p.parse_args(argv)
+    if args.speed and not args.replay:
+        p.error("--speed needs --replay")
+    if args.rate is not None and args.rate <= 0:
+        p.error("--rate must be positive")
+
+    try:
+        report = asyncio.run(run(args))
+    except ImportError as e:
+        print(f"loadtest: {e.name or e} is not installed (pip install -r requirements.txt)", file=sys.stderr)
+        return 1
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"loadtest: {e}", file=sys.stderr)
+        return 1
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    t = report["total"]
+    print(f"{report['config']['mode']} loop, {report['measured_s']} s: {t['ok']} ok, {t['errors']} errors "
+          f"({t['error_rate']:.1%}), {t['throughput_rps']} req/s")
+    for path, e in report["endpoints"].items():
+        p = "  ".join(f"{q} {'-' if e[q + '_ms'] is None else e[q + '_ms']:>8}" for q in ("p50", "p95", "p99"))
+        print(f"{path:<20} {e['requests']:>7} req {e['throughput_rps']:>8.2f}/s  {p} ms  "
+              f"errors {e['error_rate']:.1%} {e['status']}")
+    if report["skipped_arrivals"]:
+        print(f"{report['skipped_arrivals']} arrivals skipped at --max-inflight {args.max_inflight}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
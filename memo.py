@@ -0,0 +1,116 @@
+# memo.py
+# Memoised estimate_all / compute_role for repeated submissions.
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional
+
+import bands
+import core
+import metrics
+
+ROLE_CACHE_SIZE = 65536
+HISTORY_CACHE_SIZE = 4096
+
+class LRUCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data), "maxsize": self.maxsize}
+
+_roles = LRUCache(ROLE_CACHE_SIZE)
+_histories = LRUCache(HISTORY_CACHE_SIZE)
+_table: Optional[bands.BandTable] = None
+
+def _check_table() -> None:
+    # Cached doses are only valid for the band table they were computed with.
+    global _table
+    table = bands.current()
+    if table is not _table:
+        _roles.clear()
+        _histories.clear()
+        _table = table
+
+def role_key(role) -> core.Role:
+    # The validated Role is the key: same casts compute_role applies, so
+    # 5 / 5.0 / "5" share an entry.
+    return role if isinstance(role, core.Role) else core.Role.from_dict(role)
+
+def _compute(key: core.Role) -> core.RoleResult:
+    res = _roles.get(key)
+    if res is None:
+        res = core.compute_role(key)
+        _roles.put(key, res)
+    return res
+
+def compute_role(role):
+    """core.compute_role with a cache; Role in -> RoleResult, dict in -> dict."""
+    _check_table()
+    res = _compute(role_key(role))
+    return res if isinstance(role, core.Role) else res.to_dict()
+
+def estimate_all(roles: List[Any]) -> Dict[str, Any]:
+    """core.estimate_all with a cache. Summaries are RoleResults (shared,
+    immutable) for a list of Roles, fresh dicts for a list of dicts."""
+    _check_table()
+    keys = tuple(role_key(r) for r in roles)
+    cached = _histories.get(keys)
+    if cached is None:
+        cached = core.estimate_all(keys, compute=_compute)
+        _histories.put(keys, cached)
+    first_exposure_year = min((k.start_year for k in keys), default=None)
+    # latency_years moves with the calendar, so it is never served from cache
+    latency = datetime.now().year - first_exposure_year if first_exposure_year else None
+    typed = all(isinstance(r, core.Role) for r in roles)
+    return {
+        **cached,
+        "summaries": list(cached["summaries"]) if typed else [s.to_dict() for s in cached["summaries"]],
+        "latency_years": latency,
+    }
+
+def stats() -> Dict[str, Dict[str, int]]:
+    return {"roles": _roles.stats(), "histories": _histories.stats()}
+
+def clear() -> None:
+    _roles.clear()
+    _histories.clear()
+
+def _collect():
+    s = stats()
+    return [
+        ("asbestos_memo_requests_total", "counter", "Estimate cache lookups.",
+         [({"cache": c, "result": r}, s[c][key]) for c in s for r, key in (("hit", "hits"), ("miss", "misses"))]),
+        ("asbestos_memo_entries", "gauge", "Entries in the estimate caches.",
+         [({"cache": c}, s[c]["size"]) for c in s]),
+    ]
+
+metrics.register_collector(_collect)
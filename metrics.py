@@ -0,0 +1,336 @@
+# metrics.py
+# In-process counters and latency histograms per pipeline stage, rendered in
+# the Prometheus text format, plus an opt-in profiler for sampled requests.
+# Stdlib only; with ASBESTOS_METRICS=0 every hook is a shared no-op.
+from __future__ import annotations
+import cProfile
+import os
+import sys
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Tuple
+
+ENABLED = os.environ.get("ASBESTOS_METRICS", "1") != "0"
+# Latency buckets (seconds)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Profiling: every Nth profiled scope (0 = never), and/or on request when the
+# caller asks for it (X-Asbestos-Profile header) and ASBESTOS_PROFILE_HEADER=1.
+PROFILE_EVERY = int(os.environ.get("ASBESTOS_PROFILE_EVERY", 0))
+PROFILE_HEADER = os.environ.get("ASBESTOS_PROFILE_HEADER", "0") == "1"
+PROFILE_MODE = os.environ.get("ASBESTOS_PROFILE_MODE", "sample")     # "sample" | "cprofile"
+PROFILE_INTERVAL = float(os.environ.get("ASBESTOS_PROFILE_INTERVAL", 0.001))
+PROFILE_DIR = Path(os.environ.get("ASBESTOS_PROFILE_DIR", Path(tempfile.gettempdir()) / "asbestos-profiles"))
+
+Labels = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Labels, values: Labels, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Labels = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def lines(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            yield f"{self.name}{_label_text(self.labels, labels)} {v:g}"
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        # per label set: [count per bucket..., +Inf count, sum]
+        self._series: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def count(self, *labels: str) -> int:
+        s = self._series.get(labels)
+        return int(sum(s[:-1])) if s else 0
+
+    def lines(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for labels, s in items:
+            cum = 0
+            for bound, n in zip(self.buckets + (float("inf"),), s[:-1]):
+                cum += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                yield f"{self.name}_bucket{_label_text(self.labels, labels, le)} {cum}"
+            yield f"{self.name}_sum{_label_text(self.labels, labels)} {s[-1]:.6f}"
+            yield f"{self.name}_count{_label_text(self.labels, labels)} {cum}"
+
+# Callbacks returning (name, type, help, [(labels dict, value)]) at scrape time,
+# for state that lives elsewhere (cache sizes, hit counts).
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]
+
+_metrics: List[object] = []
+_collectors: List[Collector] = []
+
+def counter(name: str, help: str, labels: Labels = ()) -> Counter:
+    c = Counter(name, help, labels)
+    _metrics.append(c)
+    return c
+
+def histogram(name: str, help: str, labels: Labels = (), buckets: Tuple[float, ...] = BUCKETS) -> Histogram:
+    h = Histogram(name, help, labels, buckets)
+    _metrics.append(h)
+    return h
+
+def register_collector(fn: Collector) -> None:
+    _collectors.append(fn)
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    out: List[str] = []
+    for m in _metrics:
+        out.extend(m.lines())
+    for fn in _collectors:
+        for name, kind, help, samples in fn():
+            out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                names = tuple(labels)
+                out.append(f"{name}{_label_text(names, tuple(labels[n] for n in names))} {value:g}")
+    return "\n".join(out) + "\n"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# === Stages ===
+
+STAGE_SECONDS = histogram("asbestos_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+STAGE_ERRORS = counter("asbestos_stage_errors_total", "Pipeline stages that raised.", ("stage",))
+
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self) -> "_Stage":
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        STAGE_SECONDS.observe(time.perf_counter() - self.t0, self.name)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.name)
+
+class _NoOp:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoOp":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+_NOOP = _NoOp()
+
+def stage(name: str):
+    """`with stage("estimate_all"): ...` records the block's latency."""
+    return _Stage(name) if ENABLED else _NOOP
+
+def observe(name: str, seconds: float, error: bool = False) -> None:
+    # For stages timed across callbacks (e.g. a render finishing on a pool).
+    if ENABLED:
+        STAGE_SECONDS.observe(seconds, name)
+        if error:
+            STAGE_ERRORS.inc(name)
+
+# === Profiling ===
+
+class StackSampler:
+    """Statistical profiler: a thread that records the target thread's stack
+    every `interval` seconds (under an ASGI server that is the event loop, so
+    concurrent requests show up too). `folded()` gives one
+    "outer;...;inner count" line per distinct stack, the input format of
+    flamegraph.pl / speedscope."""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: _Tally = _Tally()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="asbestos-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+PROFILES = counter("asbestos_profiles_total", "Profiles written.", ("scope",))
+_profile_lock = threading.Lock()    # one profile at a time (cProfile can't nest)
+_profile_tick = 0
+
+def should_profile(requested: bool = False) -> bool:
+    global _profile_tick
+    if requested and PROFILE_HEADER:
+        return True
+    if PROFILE_EVERY <= 0:
+        return False
+    _profile_tick += 1
+    return _profile_tick % PROFILE_EVERY == 0
+
+class _Profile:
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.active = False
+
+    def __enter__(self) -> "_Profile":
+        self.active = _profile_lock.acquire(blocking=False)
+        if self.active:
+            if PROFILE_MODE == "cprofile":
+                self.profiler = cProfile.Profile()
+                self.profiler.enable()
+            else:
+                self.profiler = StackSampler(threading.get_ident()).start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self.active:
+            return
+        try:
+            PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+            safe = "".join(ch if ch.isalnum() else "_" for ch in self.scope).strip("_") or "root"
+            stem = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{safe}"
+            if isinstance(self.profiler, cProfile.Profile):
+                self.profiler.disable()
+                self.profiler.dump_stats(f"{stem}.prof")
+            else:
+                self.profiler.stop()
+                Path(f"{stem}.folded").write_text(self.profiler.folded(), encoding="utf-8")
+            PROFILES.inc(self.scope)
+        finally:
+            _profile_lock.release()
+
+def profile(scope: str, requested: bool = False):
+    """Context manager that profiles its block when this call is picked
+    (every ASBESTOS_PROFILE_EVERY-th call, or `requested` with header
+    profiling allowed). Output goes to ASBESTOS_PROFILE_DIR as .folded
+    (sampling) or .prof (cProfile) files."""
+    if not should_profile(requested):
+        return _NOOP
+    return _Profile(scope)
+
+# === HTTP ===
+
+REQUEST_SECONDS = histogram("asbestos_http_request_seconds", "HTTP request latency.", ("route", "method"))
+REQUESTS = counter("asbestos_http_requests_total", "HTTP requests by status.", ("route", "method", "status"))
+
+class ASGIMiddleware:
+    """Request count/latency per route, and opt-in profiling, for an ASGI
+    app. `routes` are the exact paths to label (anything else is "other");
+    `prefixes` label sub-trees such as "/static"."""
+
+    def __init__(self, app, routes: Iterable[str] = (), prefixes: Iterable[str] = ()):
+        self.app = app
+        self.routes = frozenset(routes)
+        self.prefixes = tuple(prefixes)
+
+    def _route(self, path: str) -> str:
+        if path in self.routes:
+            return path
+        for p in self.prefixes:
+            if path.startswith(p):
+                return p
+        return "other"
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        route = self._route(scope["path"])
+        method = scope["method"]
+        status = "500"
+
+        async def send_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        requested = PROFILE_HEADER and any(k == b"x-asbestos-profile" and v not in (b"", b"0")
+                                           for k, v in scope.get("headers", ()))
+        t0 = time.perf_counter()
+        try:
+            with profile(f"{method} {route}", requested):
+                await self.app(scope, receive, send_status)
+        finally:
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, route, method)
+            REQUESTS.inc(route, method, status)
+
+def serve(port: int, host: str = "127.0.0.1") -> threading.Thread:
+    """Serve /metrics from a background thread, for processes without a web
+    app of their own (the Gradio UI)."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    t = threading.Thread(target=httpd.serve_forever, name="asbestos-metrics", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,222 @@
+# narrative.py
+# Free-text occupational history -> role dicts. One precompiled pattern finds
+# every keyword, year and sentence break in a single pass; sentences are then
+# grouped into dated role spans. parse_corpus / run do the same for large
+# archives on a process pool.
+from __future__ import annotations
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, TextIO, Tuple
+
+from batch import CHUNK_SIZE, Record
+
+# Priority order: the first task with a keyword in a role's text wins.
+TASK_KEYWORDS: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("lagging/insulation", ("lagger", "lagging", "insulation")),
+    ("maintenance/demolition", ("demolition", "maintenance")),
+    ("cement/board cutting", ("cement", "board", "cutting")),
+    ("garage/brakes", ("garage", "brake")),
+)
+RPE_KEYWORDS = ("mask", "respirat")
+LEV_KEYWORDS = ("ventilation", "lev", "extract")
+# Sentence ends (not decimal points) start a new clause; so do connectives,
+# which also close a dated role even when the next clause names no task.
+BREAKS = r"[;!?\n]|(?<!\d)\.|\.(?!\d)"
+CONNECTIVES = ("then", "later", "afterwards", "subsequently", "after that")
+
+DEFAULT_TASK = "bystander"
+DEFAULT_START = 1980
+DEFAULT_SPAN = 5            # end year when only one year is given
+DAYS_PER_WEEK = 5
+HOURS_PER_DAY = 6
+
+def _alternation(words: Iterable[str]) -> str:
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+# Every alternative sits in a lookahead, so matches are zero-width and
+# overlapping: the result is the same as testing each keyword with `in`.
+_PATTERN = re.compile(
+    "(?=(?:"
+    + "|".join(f"(?P<t{i}>{_alternation(words)})" for i, (_, words) in enumerate(TASK_KEYWORDS))
+    + f"|(?P<rpe>{_alternation(RPE_KEYWORDS)})"
+    + f"|(?P<lev>{_alternation(LEV_KEYWORDS)})"
+    + r"|(?P<year>\b(?:19[5-9]\d|20[0-2]\d)\b)"
+    + r"|(?P<early>(?<!\S)19[56])"      # a word starting 195x/196x
+    + r"|(?P<late>19[89])"              # 198/199 anywhere
+    + f"|(?P<brk>{BREAKS})"
+    + rf"|(?P<next>\b(?:{_alternation(CONNECTIVES)})\b)"
+    + "))"
+)
+
+def _era_of(year: int) -> str:
+    return "pre-1980" if year < 1980 else "1980-1999" if year < 2000 else "2000+"
+
+class _Span:
+    # Features of one clause, or of a role made of several clauses.
+    __slots__ = ("tasks", "years", "rpe", "lev", "early", "late", "follows")
+
+    def __init__(self):
+        self.follows = False    # clause opened by a connective ("then ...")
+        self.tasks = 0          # bit i set: a keyword of TASK_KEYWORDS[i] was seen
+        self.years: List[int] = []
+        self.rpe = self.lev = self.early = self.late = False
+
+    def merge(self, other: "_Span") -> "_Span":
+        self.tasks |= other.tasks
+        self.years += other.years
+        self.rpe |= other.rpe
+        self.lev |= other.lev
+        self.early |= other.early
+        self.late |= other.late
+        return self
+
+    def role(self) -> Dict[str, Any]:
+        task = DEFAULT_TASK
+        for i, (name, _) in enumerate(TASK_KEYWORDS):
+            if self.tasks >> i & 1:
+                task = name
+                break
+        start_year = min(self.years) if self.years else DEFAULT_START
+        if self.years:
+            # Like the split into roles, from the years themselves: the
+            # 195x/196x probes miss the 1970s, which would fall to 2000+.
+            era = _era_of(start_year)
+        else:
+            era = "pre-1980" if self.early else "1980-1999" if self.late else "2000+"
+        end_year = max(self.years) if self.years else start_year + DEFAULT_SPAN
+        return {
+            "task": task, "era": era,
+            "start_year": start_year, "end_year": end_year,
+            "days_per_week": DAYS_PER_WEEK, "hours_per_day": HOURS_PER_DAY,
+            "rpe": self.rpe, "lev": self.lev,
+        }
+
+def _clauses(text: str) -> List[_Span]:
+    clauses = [_Span()]
+    cur = clauses[0]
+    for m in _PATTERN.finditer(text):
+        kind = m.lastgroup
+        if kind == "brk" or kind == "next":
+            if kind == "brk" or cur.tasks or cur.years:
+                cur = _Span()
+                clauses.append(cur)
+            cur.follows |= kind == "next"
+        elif kind == "year":
+            # A year also stands in for the era probes that start at the same place.
+            y = m.group(kind)
+            cur.years.append(int(y))
+            if y[:3] in ("198", "199"):
+                cur.late = True
+            elif y[:3] in ("195", "196") and (m.start() == 0 or text[m.start() - 1].isspace()):
+                cur.early = True
+        elif kind[0] == "t":
+            cur.tasks |= 1 << int(kind[1:])
+        else:
+            setattr(cur, kind, True)
+    return clauses
+
+def _segment(clauses: List[_Span]) -> List[_Span]:
+    # A clause naming a task starts a new role once the current one has a
+    # task, as does "then ..." after a dated role; roles that end up with no
+    # year are folded into a dated neighbour.
+    roles = [_Span()]
+    for c in clauses:
+        if (c.tasks and roles[-1].tasks) or (c.follows and roles[-1].years):
+            roles.append(_Span())
+        roles[-1].merge(c)
+    dated: List[_Span] = []
+    undated = _Span()
+    for r in roles:
+        if not r.years:
+            (dated[-1] if dated else undated).merge(r)
+            continue
+        if not dated:
+            r = undated.merge(r)
+        dated.append(r)
+    return dated or [undated]
+
+def parse_history(text: str) -> List[Dict[str, Any]]:
+    """Role dicts for a free-text history, one per dated job described. A
+    narrative that describes one job gives the old keyword parser's task,
+    years and controls. A dated role takes its era from its start year; only
+    undated text falls back to the old era probes."""
+    return [r.role() for r in _segment(_clauses((text or "").lower()))]
+
+# === Bulk parsing ===
+
+def _parse_texts(texts: List[str]) -> List[List[Dict[str, Any]]]:
+    return [parse_history(t) for t in texts]
+
+def parse_corpus(texts: List[str], workers: Optional[int] = None,
+                 chunk_size: int = CHUNK_SIZE) -> Tuple[List[List[Dict[str, Any]]], Dict[str, Any]]:
+    """parse_history over many narratives, in order, on `workers` processes
+    (default: all cores; small corpora are parsed in-process). Returns the
+    roles per text and throughput stats."""
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    if workers == 1 or len(chunks) <= 1:
+        results = _parse_texts(texts)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = [roles for part in pool.map(_parse_texts, chunks) for roles in part]
+    elapsed = time.perf_counter() - t0
+    return results, {
+        "documents": len(texts),
+        "roles": sum(len(r) for r in results),
+        "seconds": round(elapsed, 3),
+        "docs_per_sec": round(len(texts) / elapsed, 1) if elapsed else None,
+    }
+
+def _run_chunk(chunk: List[Record]) -> List[Tuple[bool, str]]:
+    # JSONL lines: {"id": ..., "text": "..."} or a bare JSON string. Output
+    # lines are {"id", "roles"}, ready for `python -m core batch`.
+    out: List[Tuple[bool, str]] = []
+    for n, source, line in chunk:
+        try:
+            data = json.loads(line)
+            doc_id, text = (None, data) if isinstance(data, str) else (data.get("id"), data["text"])
+            if not isinstance(text, str):
+                raise TypeError("'text' must be a string")
+            out.append((True, json.dumps({"id": doc_id, "roles": parse_history(text)}, ensure_ascii=False)))
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            out.append((False, json.dumps({
+                "record": n,
+                "source": source,
+                "error": f"{type(e).__name__}: {e}",
+                "input": line,
+            }, ensure_ascii=False)))
+    return out
+
+def run(src: TextIO, dst: TextIO, err: TextIO, workers: Optional[int] = None,
+        chunk_size: int = CHUNK_SIZE, progress: Optional[TextIO] = None) -> Dict[str, Any]:
+    import batch
+    stats = batch.run(src, dst, err, fmt="jsonl", workers=workers, chunk_size=chunk_size,
+                      progress=progress, task=_run_chunk)
+    stats["docs_per_sec"] = stats.pop("records_per_sec")
+    return stats
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(prog="python -m core parse",
+                                description="Parse free-text histories into roles.")
+    p.add_argument("input", help="JSONL, one {'id', 'text'} narrative (or a JSON string) per line")
+    p.add_argument("output", help="JSONL {'id', 'roles'} per narrative, in input order")
+    p.add_argument("--errors", help="where unreadable lines go (default: <output>.errors.jsonl)")
+    p.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    p.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    p.add_argument("--quiet", action="store_true", help="no progress on stderr")
+    args = p.parse_args(argv)
+
+    errors_path = args.errors or f"{args.output}.errors.jsonl"
+    with open(args.input, encoding="utf-8") as src, \
+            open(args.output, "w", encoding="utf-8") as dst, \
+            open(errors_path, "w", encoding="utf-8") as err:
+        stats = run(src, dst, err, workers=args.workers, chunk_size=args.chunk_size,
+                    progress=None if args.quiet else sys.stderr)
+    print(json.dumps(stats), file=sys.stderr)
+    return 0
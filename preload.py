@@ -0,0 +1,264 @@
+# preload.py
+# Startup work done once per deployment rather than once per process: run in
+# the gunicorn master before it forks the workers (gunicorn.conf.py), or
+# before the Gradio UI starts serving. It builds the band tables and their
+# arrays, imports what the endpoints otherwise import on first use, builds
+# ReportLab's stylesheet and font metrics by rendering a throwaway report,
+# then moves every object made so far out of the collector's reach with
+# gc.freeze(): collections in a worker never write to those objects, so the
+# pages the workers share with the master stay shared (copy-on-write).
+#
+#   python preload.py                                      # what preloading builds, and how long it takes
+#   python preload.py report --workers 2 --out startup.json  # gunicorn with and without it: memory, first requests
+from __future__ import annotations
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+log = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("ASBESTOS_PRELOAD", "1") != "0"
+STARTUP_LOG = os.environ.get("ASBESTOS_STARTUP_LOG")     # workers append a JSON line here once booted
+
+SAMPLE = [
+    {"task": "lagging/insulation", "era": "pre-1980", "start_year": 1968, "end_year": 1979,
+     "days_per_week": 5, "hours_per_day": 6, "rpe": False, "lev": False},
+    {"task": "maintenance/demolition", "era": "1980-1999", "start_year": 1980, "end_year": 1986,
+     "days_per_week": 3, "hours_per_day": 4, "rpe": True, "lev": True},
+]
+
+report: Optional[Dict[str, Any]] = None     # what the last preload() did
+
+def _bands() -> None:
+    import bands
+    # Every table the endpoints can use, with the arrays and digest that are
+    # otherwise built on first use
+    for table in bands.band_sets().values():
+        table.low, table.high, table.digest
+
+def _modules() -> None:
+    # What server.py and report.py import on first use
+    import compare, simulate, sweep, timeline  # noqa: F401
+    import reportlab.graphics.charts.legends, reportlab.graphics.charts.lineplots  # noqa: F401
+    import reportlab.platypus  # noqa: F401
+
+def _pdf() -> None:
+    # A full report with a chart and a comparison table: the stylesheet,
+    # table style, font metrics and width caches all end up built.
+    import report as report_mod
+    from compare import compare
+    from core import estimate_all
+    from timeline import timeline
+
+    totals = estimate_all(SAMPLE)
+    content = report_mod.report_content(SAMPLE, totals["total_low"], totals["total_high"],
+                                        "Latency (years since first exposure): ~58", timeline=timeline(SAMPLE),
+                                        subject="preload", comparison=compare(SAMPLE))
+    with tempfile.TemporaryDirectory() as tmp:
+        report_mod.render(content, os.path.join(tmp, "preload.pdf"))
+
+def _narrative() -> None:
+    from narrative import parse_history
+    parse_history("Lagging pipes 1968-1979, then maintenance work 1980-1986 with a mask.")
+
+STEPS: Dict[str, Callable[[], None]] = {
+    "bands": _bands,
+    "modules": _modules,
+    "pdf": _pdf,
+    "narrative": _narrative,
+}
+
+def preload(freeze: bool = True) -> Dict[str, Any]:
+    """Run every step, then (by default) collect and gc.freeze() what is
+    left. Returns {"steps": {name: seconds}, "seconds", "frozen"}; a step
+    that fails (ReportLab not installed, a broken band set) is logged and
+    left to happen on first use as before."""
+    global report
+    t0 = time.perf_counter()
+    steps = {}
+    for name, step in STEPS.items():
+        t = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            log.warning("preload: %s failed (%s: %s)", name, type(e).__name__, e)
+            steps[name] = None
+            continue
+        steps[name] = round(time.perf_counter() - t, 4)
+    frozen = 0
+    if freeze:
+        gc.collect()
+        gc.freeze()
+        frozen = gc.get_freeze_count()
+    report = {"steps": steps, "seconds": round(time.perf_counter() - t0, 4), "frozen": frozen}
+    log.info("preload: %.0f ms, %d objects frozen", report["seconds"] * 1e3, frozen)
+    return report
+
+# === Worker bookkeeping (gunicorn.conf.py) ===
+
+_forked_at: Optional[float] = None
+
+def mark_fork() -> None:
+    global _forked_at
+    _forked_at = time.perf_counter()
+
+def worker_booted(preloaded: bool) -> None:
+    # Time from fork until the worker can take requests (importing the app,
+    # when it was not preloaded); appended to STARTUP_LOG for `report`.
+    if STARTUP_LOG is None or _forked_at is None:
+        return
+    line = {"pid": os.getpid(), "boot_s": round(time.perf_counter() - _forked_at, 4), "preloaded": preloaded}
+    with open(STARTUP_LOG, "a", encoding="utf-8") as f:
+        f.write(json.dumps(line) + "\n")
+
+# === Startup report ===
+
+def memory(pid: int) -> Dict[str, int]:
+    """rss, pss (shared pages split between the processes sharing them) and
+    uss (pages only this process has) in bytes, from /proc (Linux)."""
+    out = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                out[key] = int(rest.split()[0]) * 1024
+    return {"rss": out["Rss"], "pss": out["Pss"], "uss": out["Private_Clean"] + out["Private_Dirty"]}
+
+def _children(pid: int) -> List[int]:
+    kids = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children", encoding="ascii") as f:
+            kids.extend(int(p) for p in f.read().split())
+    return kids
+
+def _measure(preload_on: bool, workers: int) -> Dict[str, Any]:
+    import subprocess
+
+    import httpx
+    from loadtest import _free_port, stop_server
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    port = _free_port()
+    fd, startup_log = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    env = dict(os.environ, ASBESTOS_PRELOAD="1" if preload_on else "0", ASBESTOS_STARTUP_LOG=startup_log,
+               PORT=str(port), WEB_CONCURRENCY=str(workers))
+    cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "server:app", "--bind", f"127.0.0.1:{port}"]
+    url = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+    try:
+        with httpx.Client(timeout=120) as client:
+            while True:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+                if time.perf_counter() - t0 > 60:
+                    raise RuntimeError("gunicorn not ready after 60 s")
+                try:
+                    # Every worker booted, not just the first to answer
+                    with open(startup_log, encoding="utf-8") as f:
+                        booted = len(f.readlines())
+                    if booted >= workers and client.get(f"{url}/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.05)
+            ready = time.perf_counter() - t0
+            # First request of each kind after startup: cold paths, fresh PDF
+            first = {}
+            totals = {"low": 1.0, "high": 2.0, "latency": None}
+            for path, body in (("/estimate", {"roles": SAMPLE}),
+                               ("/export_pdf", {"roles": SAMPLE, "totals": totals, "disclaimer": str(time.time())}),
+                               ("/ai/parse_history", {"text": "Brake work 1990-1995."})):
+                t = time.perf_counter()
+                r = client.post(url + path, json=body)
+                first[path] = {"status": r.status_code, "ms": round((time.perf_counter() - t) * 1e3, 1)}
+            # Then traffic on every lazily loaded path (charts, comparisons,
+            # Monte Carlo, fresh PDFs), on new connections so that every
+            # worker gets some, before memory is measured.
+            extras = {"timeline": True, "compare_bands": True, "uncertainty": {"draws": 1000}}
+            for i in range(8 * workers):
+                client.post(f"{url}/estimate", json={"roles": SAMPLE, **extras}, headers={"Connection": "close"})
+                client.post(f"{url}/export_pdf", headers={"Connection": "close"},
+                            json={"roles": SAMPLE, "totals": totals, "disclaimer": f"{t0} {i}", "timeline": True})
+        pids = _children(proc.pid)
+        per_worker = []
+        with open(startup_log, encoding="utf-8") as f:
+            boot = {rec["pid"]: rec["boot_s"] for rec in map(json.loads, f)}
+        for pid in pids:
+            tree = [pid, *_children(pid)]
+            mem = [memory(p) for p in tree]
+            per_worker.append({"pid": pid, "boot_s": boot.get(pid), **mem[0],
+                               "pdf_pool_pss": sum(m["pss"] for m in mem[1:])})
+        master = memory(proc.pid)
+        total_pss = master["pss"] + sum(w["pss"] + w["pdf_pool_pss"] for w in per_worker)
+    finally:
+        stop_server(proc)
+        os.unlink(startup_log)
+    return {
+        "preload": preload_on,
+        "ready_s": round(ready, 3),
+        "first_request": first,
+        "master": master,
+        "workers": per_worker,
+        "total_pss": total_pss,
+    }
+
+def startup_report(workers: int = 2) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workers": workers,
+        },
+        "runs": [_measure(False, workers), _measure(True, workers)],
+    }
+
+def _mb(n: Optional[int]) -> str:
+    return "-" if n is None else f"{n / 2**20:.1f}"
+
+def _print_report(rep: Dict[str, Any]) -> None:
+    for run in rep["runs"]:
+        print(f"preload {'on' if run['preload'] else 'off'}: ready in {run['ready_s']:.2f} s, "
+              f"total PSS {_mb(run['total_pss'])} MB (master {_mb(run['master']['pss'])})")
+        print("  first requests: " + ", ".join(f"{p} {f['ms']:.0f} ms" for p, f in run["first_request"].items()))
+        for w in run["workers"]:
+            boot = "-" if w["boot_s"] is None else f"{w['boot_s'] * 1e3:.0f} ms"
+            print(f"  worker {w['pid']}: boot {boot}, RSS {_mb(w['rss'])} MB, PSS {_mb(w['pss'])} MB, "
+                  f"USS {_mb(w['uss'])} MB, PDF pool PSS {_mb(w['pdf_pool_pss'])} MB")
+
+def main(argv: List[str] = None) -> int:
+    p = argparse.ArgumentParser(description="Preload shared state, or report its effect on startup.")
+    sub = p.add_subparsers(dest="cmd")
+    r = sub.add_parser("report", help="start gunicorn with and without preloading and compare")
+    r.add_argument("--workers", type=int, default=2)
+    r.add_argument("--out", help="write the JSON report here")
+    args = p.parse_args(argv)
+    if args.cmd is None:
+        print(json.dumps(preload(), indent=2))
+        return 0
+    try:
+        rep = startup_report(args.workers)
+    except (OSError, RuntimeError, ImportError) as e:
+        print(f"preload report: {e}", file=sys.stderr)
+        return 1
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rep, f, indent=2)
+            f.write("\n")
+    _print_report(rep)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
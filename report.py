@@ -0,0 +1,438 @@
+# report.py
+# PDF summaries: cached by content hash, rendered on a worker pool.
+from __future__ import annotations
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, Future, ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import metrics
+from core import DISCLAIMER
+
+FILENAME = "asbestos_estimate_summary.pdf"
+CACHE_DIR = Path(os.environ.get("ASBESTOS_PDF_CACHE", Path(tempfile.gettempdir()) / "asbestos-pdf-cache"))
+CACHE_MAX_BYTES = int(os.environ.get("ASBESTOS_PDF_CACHE_BYTES", 200 * 1024 * 1024))
+CACHE_MAX_FILES = int(os.environ.get("ASBESTOS_PDF_CACHE_FILES", 1000))
+CACHE_MAX_AGE = float(os.environ.get("ASBESTOS_PDF_CACHE_AGE", 24 * 3600))
+# Server processes sharing CACHE_DIR (gunicorn workers); each gets its own
+# subdirectory and this share of the byte and file limits.
+CACHE_PROCESSES = max(1, int(os.environ.get("WEB_CONCURRENCY", 1)))
+# 0 renders in the calling process (serialised by a lock)
+PDF_WORKERS = int(os.environ.get("ASBESTOS_PDF_WORKERS", 2))
+RENDER_TIMEOUT = 60.0
+
+INTERPRETATION = [
+    ["Educational context (not diagnostic)"],
+    ["• Asbestosis/Diffuse pleural thickening often associated with ~10–25+ f/ml·years."],
+    ["• Lung cancer without asbestosis: typically very high cumulative exposures."],
+    ["• Mesothelioma: no safe threshold; qualitative exposure history remains important."],
+]
+
+# === Document content ===
+
+def report_content(roles: List[Dict[str, Any]], totals_low, totals_high,
+                   latency_note: Optional[str] = None, disclaimer: str = DISCLAIMER,
+                   timeline: Optional[Dict[str, Any]] = None, subject: Optional[str] = None,
+                   comparison: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    # Exactly the text (and chart data) that ends up in the PDF; this is also
+    # what the cache key is computed from, so equal-looking reports share one file.
+    content = {
+        "roles": [
+            [
+                f"<b>Role {i}:</b> {r['task']} ({r['era']}) {r['start_year']}–{r['end_year']}",
+                f"Days/week: {r['days_per_week']}, Hours/day: {r['hours_per_day']}, "
+                f"RPE: {bool(r['rpe'])}, LEV: {bool(r['lev'])}",
+            ]
+            for i, r in enumerate(roles, start=1)
+        ],
+        "totals": f"<b>Cumulative exposure (f/ml·years):</b> {totals_low}–{totals_high}",
+        "latency": f"<b>{latency_note}</b>" if latency_note else None,
+        "disclaimer": disclaimer,
+    }
+    if timeline and timeline.get("years"):
+        # timeline.timeline() output: only the plotted curves go in
+        content["timeline"] = {
+            "years": timeline["years"],
+            "low": timeline["cumulative_low"],
+            "high": timeline["cumulative_high"],
+            "note": f"Each role is banded by calendar year across era boundaries; overlapping roles "
+                    f"are capped at {timeline['max_hours_per_week']:g} hours a week"
+                    + (f" (applied in {len(timeline['capped_years'])} years)." if timeline["capped_years"] else "."),
+        }
+    if comparison:
+        # compare.compare() output: the same history under each band table
+        content["comparison"] = [
+            [c["table"], c["version"] or "—", c["digest"], f"{c['total_low']}–{c['total_high']}"]
+            for c in comparison
+        ]
+    if subject is not None:
+        # Bulk exports (bulk.py) name the subject under the title
+        content["subject"] = subject
+    return content
+
+def content_key(content: Dict[str, Any]) -> str:
+    blob = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+@lru_cache(maxsize=None)
+def _assets():
+    # Built once per process: the stylesheet and the interpretation table's
+    # style. The Table itself is made per build: one that was split or
+    # pushed to a new page keeps that layout and fails the next build.
+    from reportlab.platypus import TableStyle
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib import colors
+
+    styles = getSampleStyleSheet()
+    table_style = TableStyle([
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("BOX", (0, 0), (-1, -1), 0.5, colors.black),
+        ("INNERGRID", (0, 0), (-1, -1), 0.25, colors.grey),
+    ])
+    return styles, table_style
+
+def timeline_chart(data: Dict[str, Any], width: float = 480, height: float = 200):
+    # Cumulative dose by year, low and high bounds as two lines.
+    from reportlab.graphics.charts.legends import LineLegend
+    from reportlab.graphics.charts.lineplots import LinePlot
+    from reportlab.graphics.shapes import Drawing, String
+    from reportlab.lib import colors
+
+    drawing = Drawing(width, height)
+    plot = LinePlot()
+    plot.x, plot.y = 45, 35
+    plot.width, plot.height = width - 60, height - 60
+    plot.data = [list(zip(data["years"], data["low"])), list(zip(data["years"], data["high"]))]
+    plot.lines[0].strokeColor = colors.steelblue
+    plot.lines[1].strokeColor = colors.firebrick
+    plot.xValueAxis.valueMin = data["years"][0]
+    plot.xValueAxis.valueMax = data["years"][-1]
+    plot.xValueAxis.labelTextFormat = "%d"
+    plot.yValueAxis.valueMin = 0
+    drawing.add(plot)
+    legend = LineLegend()
+    legend.x, legend.y = 55, height - 12
+    legend.colorNamePairs = [(colors.steelblue, "low"), (colors.firebrick, "high")]
+    legend.columnMaximum = 1
+    drawing.add(legend)
+    drawing.add(String(width / 2, 5, "Year", textAnchor="middle", fontSize=8))
+    return drawing
+
+def build_story(content: Dict[str, Any]) -> List[Any]:
+    from reportlab.platypus import Paragraph, Spacer, Table
+
+    styles, table_style = _assets()
+    elems = [
+        Paragraph("<b>Asbestos Exposure Educational Estimator — Summary</b>", styles["Title"]),
+        Spacer(1, 12),
+    ]
+    if content.get("subject") is not None:
+        elems[-1:-1] = [Paragraph(escape(f"Subject: {content['subject']}"), styles["Heading2"])]
+    for heading, detail in content["roles"]:
+        elems.append(Paragraph(heading, styles["BodyText"]))
+        elems.append(Paragraph(detail, styles["BodyText"]))
+        elems.append(Spacer(1, 6))
+    elems.append(Spacer(1, 6))
+    elems.append(Paragraph(content["totals"], styles["Heading2"]))
+    if content["latency"]:
+        elems.append(Paragraph(content["latency"], styles["BodyText"]))
+    if content.get("timeline"):
+        elems.append(Spacer(1, 6))
+        elems.append(Paragraph("<b>Cumulative exposure by year (f/ml·years)</b>", styles["Heading3"]))
+        elems.append(timeline_chart(content["timeline"]))
+        elems.append(Paragraph(content["timeline"]["note"], styles["BodyText"]))
+    if content.get("comparison"):
+        elems.append(Spacer(1, 6))
+        elems.append(Paragraph("<b>Band table comparison</b>", styles["Heading3"]))
+        elems.append(Table([["Band table", "Version", "Digest", "Cumulative (f/ml·years)"], *content["comparison"]],
+                           colWidths=[150, 90, 100, 140], style=table_style))
+        elems.append(Paragraph(f"The estimate above uses the first table ({escape(content['comparison'][0][0])}).",
+                               styles["BodyText"]))
+    elems.append(Spacer(1, 12))
+    elems.append(Table(INTERPRETATION, colWidths=[480], style=table_style))
+    elems.append(Spacer(1, 12))
+    elems.append(Paragraph("<b>Disclaimer</b>", styles["Heading3"]))
+    elems.append(Paragraph(content["disclaimer"], styles["BodyText"]))
+    return elems
+
+def render(content: Dict[str, Any], path: str) -> int:
+    """Write the PDF for `content` to `path` atomically; returns its size."""
+    from reportlab.platypus import SimpleDocTemplate
+    from reportlab.lib.pagesizes import A4
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    SimpleDocTemplate(tmp, pagesize=A4).build(build_story(content))
+    os.replace(tmp, path)
+    return os.path.getsize(path)
+
+# === File cache ===
+
+class ReportCache:
+    """Size/count/age bounded LRU of rendered PDFs on disk, one directory per
+    content hash (so downloads keep a readable file name)."""
+
+    def __init__(self, directory: Path, max_bytes: int, max_files: int, max_age: float):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()  # key -> (size, created)
+        self._bytes = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._adopt_existing()
+
+    def path_for(self, key: str) -> Path:
+        return self.directory / key / FILENAME
+
+    def _adopt_existing(self) -> None:
+        # Files left by an earlier run count towards the limits.
+        found = []
+        for p in self.directory.glob(f"*/{FILENAME}"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            found.append((st.st_mtime, p.parent.name, st.st_size))
+        for mtime, key, size in sorted(found):
+            self._entries[key] = (size, mtime)
+            self._bytes += size
+        with self._lock:
+            self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            path = self.path_for(key)
+            if entry is None or time.time() - entry[1] > self.max_age or not path.exists():
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return str(path)
+
+    def put(self, key: str, size: int) -> str:
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries[key][0]
+            self._entries[key] = (size, time.time())
+            self._bytes += size
+            self._evict(keep=key)
+        return str(self.path_for(key))
+
+    def _drop(self, key: str) -> None:
+        size, _ = self._entries.pop(key)
+        self._bytes -= size
+        shutil.rmtree(self.directory / key, ignore_errors=True)
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        now = time.time()
+        for key in [k for k, (_, created) in self._entries.items() if now - created > self.max_age]:
+            self._drop(key)
+        while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_files):
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._drop(oldest)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"files": len(self._entries), "bytes": self._bytes, "hits": self.hits, "misses": self.misses}
+
+def _lock(f, wait: bool) -> bool:
+    # Exclusive lock on an open file, released when the process exits
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if wait else msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if wait else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+def _process_dir(root: Path):
+    """A subdirectory of `root` for this process alone, so that no other
+    process evicts (deletes) a PDF this one is serving. It is held by a lock
+    on `<name>.lock` next to it; the directories of processes that have
+    exited (their lock can be taken) are merged into it, keeping their PDFs.
+    Returns (directory, open lock file)."""
+    root.mkdir(parents=True, exist_ok=True)
+    while True:
+        lock_path = root / f"{os.getpid()}-{os.urandom(4).hex()}.lock"
+        f = open(lock_path, "a+b")
+        _lock(f, wait=True)
+        try:
+            # A process cleaning up may have taken the lock first and removed it
+            if os.path.samestat(os.fstat(f.fileno()), os.stat(lock_path)):
+                break
+        except OSError:
+            pass
+        f.close()
+    own = lock_path.with_suffix("")
+    own.mkdir(exist_ok=True)
+    # PDFs cached directly under root by earlier versions
+    for entry in root.glob(f"*/{FILENAME}"):
+        try:
+            os.replace(entry.parent, own / entry.parent.name)
+        except OSError:
+            pass
+    for other in root.glob("*.lock"):
+        if other == lock_path:
+            continue
+        try:
+            g = open(other, "a+b")
+        except OSError:
+            continue
+        with g:
+            if not _lock(g, wait=False):
+                continue            # still running
+            stale = other.with_suffix("")
+            for entry in stale.glob(f"*/{FILENAME}"):
+                try:
+                    os.replace(entry.parent, own / entry.parent.name)
+                except OSError:
+                    pass
+            shutil.rmtree(stale, ignore_errors=True)
+            try:
+                os.unlink(other)
+            except OSError:
+                pass
+    return own, f
+
+# === Rendering service ===
+
+_cache: Optional[ReportCache] = None
+_cache_pid: Optional[int] = None
+_cache_lock_file = None
+_pool: Optional[ProcessPoolExecutor] = None
+_inflight: Dict[str, Future] = {}
+_state_lock = threading.Lock()
+_inline_lock = threading.Lock()
+
+def cache() -> ReportCache:
+    global _cache, _cache_pid, _cache_lock_file
+    with _state_lock:
+        # A forked child does not inherit the cache (nor its directory)
+        if _cache is None or _cache_pid != os.getpid():
+            directory, _cache_lock_file = _process_dir(CACHE_DIR)
+            _cache = ReportCache(directory, CACHE_MAX_BYTES // CACHE_PROCESSES,
+                                 max(1, CACHE_MAX_FILES // CACHE_PROCESSES), CACHE_MAX_AGE)
+            _cache_pid = os.getpid()
+        return _cache
+
+def _executor() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if PDF_WORKERS <= 0:
+        return None
+    with _state_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+def _discard(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    with _state_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _render_inline(content: Dict[str, Any], path: str) -> int:
+    # ReportLab builds are not thread-safe: one at a time in this process.
+    with _inline_lock:
+        return render(content, path)
+
+def _finish(key: str, fut: Future, size: Optional[int], error: Optional[BaseException], t0: float) -> None:
+    # Timed here rather than in render(): pool workers keep their own metrics.
+    metrics.observe("pdf_build", time.perf_counter() - t0, error is not None)
+    with _state_lock:
+        _inflight.pop(key, None)
+    if error is not None:
+        fut.set_exception(error)
+    else:
+        fut.set_result(cache().put(key, size))
+
+def pdf_future(roles: List[Dict[str, Any]], totals_low, totals_high,
+               latency_note: Optional[str] = None, disclaimer: str = DISCLAIMER,
+               timeline: Optional[Dict[str, Any]] = None,
+               comparison: Optional[List[Dict[str, Any]]] = None) -> Future:
+    """Future resolving to the summary PDF path for these inputs (plus a
+    cumulative-dose chart when given a timeline.timeline() result, and a
+    band table comparison when given a compare.compare() result). A cached
+    identical report resolves immediately; concurrent requests for the same
+    report share one render."""
+    content = report_content(roles, totals_low, totals_high, latency_note, disclaimer, timeline,
+                             comparison=comparison)
+    key = content_key(content)
+    store = cache()
+    hit = store.get(key)
+    if hit:
+        done: Future = Future()
+        done.set_result(hit)
+        return done
+
+    with _state_lock:
+        fut = _inflight.get(key)
+        if fut is not None:
+            return fut
+        fut = _inflight[key] = Future()
+    path = store.path_for(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    pool = _executor()
+    t0 = time.perf_counter()
+    if pool is None:
+        try:
+            size = _render_inline(content, str(path))
+        except Exception as e:
+            _finish(key, fut, None, e, t0)
+        else:
+            _finish(key, fut, size, None, t0)
+    else:
+        try:
+            job = pool.submit(render, content, str(path))
+        except Exception as e:
+            # e.g. BrokenProcessPool: fail this report (and its waiters) now
+            # rather than at their timeout, and start a new pool next time.
+            if isinstance(e, BrokenExecutor):
+                _discard(pool)
+            _finish(key, fut, None, e, t0)
+        else:
+            job.add_done_callback(lambda j: _finish(key, fut, None if j.exception() else j.result(), j.exception(), t0))
+    return fut
+
+def _collect():
+    if _cache is None:
+        return []
+    s = _cache.stats()
+    return [
+        ("asbestos_pdf_cache_requests_total", "counter", "PDF cache lookups.",
+         [({"result": "hit"}, s["hits"]), ({"result": "miss"}, s["misses"])]),
+        ("asbestos_pdf_cache_files", "gauge", "PDFs in the cache.", [({}, s["files"])]),
+        ("asbestos_pdf_cache_bytes", "gauge", "Size of the PDF cache.", [({}, s["bytes"])]),
+    ]
+
+metrics.register_collector(_collect)
+
+def pdf_path(roles: List[Dict[str, Any]], totals_low, totals_high,
+             latency_note: Optional[str] = None, disclaimer: str = DISCLAIMER,
+             timeout: float = RENDER_TIMEOUT, timeline: Optional[Dict[str, Any]] = None,
+             comparison: Optional[List[Dict[str, Any]]] = None) -> str:
+    return pdf_future(roles, totals_low, totals_high, latency_note, disclaimer, timeline,
+                      comparison).result(timeout)
@@ -0,0 +1,327 @@
+# server.py
+# ASGI service (Starlette) on top of core: the web UI, /estimate,
+# /estimate/batch (NDJSON in, NDJSON out), /estimate/sweep, /export_pdf,
+# /ai/parse_history and /metrics (Prometheus text format).
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Deque, Dict, List, Tuple
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import batch
+import metrics
+from core import DISCLAIMER, band_for, control_multiplier, freq_multiplier
+from narrative import parse_history
+from report import FILENAME, pdf_future
+
+log = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent
+BATCH_WORKERS = int(os.environ.get("ASBESTOS_BATCH_WORKERS", os.cpu_count() or 1))
+BATCH_CHUNK = 100            # NDJSON lines per executor task
+BATCH_INFLIGHT = BATCH_WORKERS * 4
+
+_pool: ProcessPoolExecutor = None
+
+@asynccontextmanager
+async def lifespan(app):
+    global _pool
+    _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+    try:
+        yield
+    finally:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+def _legacy_estimate(roles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """The /estimate response the web UI (templates/index.html) was written
+    against, exactly as the original Flask route gave it: bands and doses
+    unrounded, and the totals summed unrounded and rounded once, to 1 dp.
+    (estimate_all's totals are sums of doses rounded to 3 dp, themselves
+    rounded to 2 dp; rounding those again can move the last digit.)"""
+    summaries = []
+    total_low = 0.0
+    total_high = 0.0
+    first_exposure_year = None
+    for r in roles:
+        low, high = band_for(r["task"], r["era"])
+        f_mult = freq_multiplier(float(r["days_per_week"]), float(r["hours_per_day"]))
+        c_mult = control_multiplier(bool(r["rpe"]), bool(r["lev"]))
+        adj_low = low * f_mult * c_mult
+        adj_high = high * f_mult * c_mult
+        years = max(0, int(r["end_year"]) - int(r["start_year"]))
+        dose_low = adj_low * years
+        dose_high = adj_high * years
+        summaries.append({
+            "task": r["task"],
+            "era": r["era"],
+            "years": years,
+            "base_band": [low, high],
+            "adjusted_band": [adj_low, adj_high],
+            "dose_range": [dose_low, dose_high],
+        })
+        total_low += dose_low
+        total_high += dose_high
+        sy = int(r["start_year"])
+        if first_exposure_year is None or sy < first_exposure_year:
+            first_exposure_year = sy
+    return {
+        "summaries": summaries,
+        "total_range": [round(total_low, 1), round(total_high, 1)],
+        "latency_years": datetime.now().year - first_exposure_year if first_exposure_year else None,
+        "disclaimer": DISCLAIMER,
+    }
+
+async def home(request: Request) -> Response:
+    if request.method == "HEAD":
+        return Response(status_code=200)
+    return FileResponse(BASE_DIR / "templates" / "index.html", media_type="text/html")
+
+async def health(request: Request) -> Response:
+    return PlainTextResponse("ok")
+
+async def estimate(request: Request) -> Response:
+    with metrics.stage("parse_request"):
+        data = await request.json()
+    roles = data.get("roles", [])
+    try:
+        with metrics.stage("estimate_all"):
+            context = _legacy_estimate(roles)
+    except (ValueError, TypeError, KeyError) as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    # Optional Monte Carlo: {"uncertainty": {"draws": 10000, "seed": 1,
+    # "distribution": "loguniform"|"lognormal", "jitter": 0.1}}
+    opts = data.get("uncertainty")
+    if opts and roles:
+        from simulate import MAX_DRAWS, simulate  # NumPy only when asked for
+        try:
+            with metrics.stage("simulate"):
+                context["uncertainty"] = await asyncio.to_thread(
+                    simulate,
+                    roles,
+                    n_draws=min(int(opts.get("draws", 10000)), MAX_DRAWS),
+                    seed=opts.get("seed"),
+                    distribution=opts.get("distribution", "loguniform"),
+                    jitter=float(opts.get("jitter", 0.0)),
+                )
+        except (ValueError, TypeError) as e:
+            return JSONResponse({"error": str(e)}, status_code=400)
+    # Optional year-by-year curves: {"timeline": true} or
+    # {"timeline": {"max_hours_per_week": 48}}
+    if data.get("timeline") and roles:
+        try:
+            context["timeline"] = await _timeline(roles, data["timeline"])
+        except (ValueError, TypeError, KeyError) as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    # Optional {"compare_bands": true}: totals under every band set (compare.py)
+    if data.get("compare_bands") and roles:
+        try:
+            context["band_comparison"] = await _compare(roles)
+        except (ValueError, TypeError, KeyError) as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    return JSONResponse(context)
+
+async def _compare(roles) -> List[Dict[str, Any]]:
+    from compare import compare  # NumPy only when asked for
+    with metrics.stage("compare_bands"):
+        return await asyncio.to_thread(compare, roles)
+
+async def _timeline(roles, opts) -> Dict[str, Any]:
+    from timeline import timeline  # NumPy only when asked for
+    max_hours = opts.get("max_hours_per_week") if isinstance(opts, dict) else None
+    with metrics.stage("timeline"):
+        return await asyncio.to_thread(timeline, roles, None if max_hours is None else float(max_hours))
+
+async def estimate_sweep(request: Request) -> Response:
+    # {"roles": [...], "grid": {"days_per_week": [1, 2, 3], "rpe": [false, true], ...},
+    #  "apply_to": [0, 2]}  (role indices; default all)
+    from sweep import MAX_POINTS, rows, sweep  # NumPy only when asked for
+    with metrics.stage("parse_request"):
+        data = await request.json()
+    grid = data.get("grid") or {}
+    try:
+        points = 1
+        for values in grid.values():
+            points *= len(values)
+        if points > MAX_POINTS:
+            raise ValueError(f"grid has {points} points; at most {MAX_POINTS} are allowed")
+        with metrics.stage("sweep"):
+            result = await asyncio.to_thread(sweep, data.get("roles", []), grid, data.get("apply_to"))
+    except (ValueError, TypeError, KeyError) as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    return JSONResponse({
+        "params": result["params"],
+        "values": result["values"],
+        "rows": rows(result),
+        "baseline": result["baseline"],
+    })
+
+BATCH_RECORDS = metrics.counter("asbestos_batch_records_total", "/estimate/batch records by outcome.", ("outcome",))
+
+async def _record_chunks(body: AsyncIterator[bytes]) -> AsyncIterator[List[batch.Record]]:
+    # Split the request stream into NDJSON lines without buffering the body.
+    buf = b""
+    n = 0
+    chunk: List[batch.Record] = []
+    async for part in body:
+        buf += part
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            n += 1
+            if line.strip():
+                chunk.append((n, f"line {n}", line.decode("utf-8", "replace").rstrip("\r")))
+            if len(chunk) >= BATCH_CHUNK:
+                yield chunk
+                chunk = []
+    if buf.strip():
+        chunk.append((n + 1, f"line {n + 1}", buf.decode("utf-8", "replace").rstrip("\r")))
+    if chunk:
+        yield chunk
+
+async def _request_body(receive) -> AsyncIterator[bytes]:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        yield message.get("body", b"")
+        if not message.get("more_body", False):
+            return
+
+def _run_chunk(chunk: List[batch.Record]) -> List[Tuple[bool, str]]:
+    # batch._run_chunk turns malformed records into error lines; should it
+    # raise anyway, retry record by record so that only the record at fault
+    # becomes an error line, rather than the whole chunk being lost.
+    try:
+        return batch._run_chunk(chunk)
+    except Exception:
+        log.exception("/estimate/batch: chunk at record %d failed; retrying record by record", chunk[0][0])
+    out = []
+    for record in chunk:
+        try:
+            out.extend(batch._run_chunk([record]))
+        except Exception as e:
+            out.append((False, batch.error_line(*record, e)))
+    return out
+
+async def _batch_results(body: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    pending: Deque[asyncio.Future] = deque()
+
+    def lines(results) -> bytes:
+        for ok, _ in results:
+            BATCH_RECORDS.inc("ok" if ok else "error")
+        return "".join(line + "\n" for _, line in results).encode("utf-8")
+
+    async for chunk in _record_chunks(body):
+        # Results go out in input order as soon as the head of the queue is
+        # done; reading pauses while BATCH_INFLIGHT chunks are outstanding.
+        if len(pending) >= BATCH_INFLIGHT:
+            yield lines(await pending.popleft())
+        pending.append(loop.run_in_executor(_pool, _run_chunk, chunk))
+        while pending and pending[0].done():
+            yield lines(pending.popleft().result())
+    while pending:
+        yield lines(await pending.popleft())
+
+class EstimateBatch:
+    """POST /estimate/batch: NDJSON body, one {"id": ..., "roles": [...]}
+    history per line; streams back one estimate per line in the same order
+    (or {"record", "error", ...} for lines that could not be estimated).
+
+    A plain ASGI app rather than a Starlette endpoint because the response
+    starts streaming while the request body is still being read."""
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/x-ndjson")],
+        })
+        try:
+            async for data in _batch_results(_request_body(receive)):
+                await send({"type": "http.response.body", "body": data, "more_body": True})
+        except Exception as e:
+            # The status has gone out already: end with a line saying so
+            log.exception("/estimate/batch failed mid-stream")
+            line = json.dumps({"error": f"{type(e).__name__}: {e}", "truncated": True}) + "\n"
+            await send({"type": "http.response.body", "body": line.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+async def export_pdf(request: Request) -> Response:
+    with metrics.stage("parse_request"):
+        payload = await request.json()
+    roles = payload.get("roles", [])
+    totals = payload.get("totals", {"low": 0, "high": 0, "latency": None})
+    latency_note = None
+    if totals.get("latency") is not None:
+        latency_note = f"Latency (years since first exposure): ~{totals['latency']}"
+    curves = None
+    if payload.get("timeline") and roles:
+        try:
+            curves = await _timeline(roles, payload["timeline"])
+        except (ValueError, TypeError, KeyError) as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    comparison = None
+    if payload.get("compare_bands") and roles:
+        try:
+            comparison = await _compare(roles)
+        except (ValueError, TypeError, KeyError) as e:
+            return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=400)
+    path = await asyncio.wrap_future(
+        pdf_future(roles, totals["low"], totals["high"], latency_note, payload.get("disclaimer", ""), curves,
+                   comparison)
+    )
+    return FileResponse(path, media_type="application/pdf", filename=FILENAME)
+
+async def ai_parse_history(request: Request) -> Response:
+    with metrics.stage("parse_request"):
+        data = await request.json()
+    with metrics.stage("parse_history"):
+        roles = parse_history((data or {}).get("text", ""))
+    return JSONResponse({"roles": roles})
+
+async def metrics_text(request: Request) -> Response:
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+async def handle_any(request: Request, exc: Exception) -> Response:
+    log.exception("Unhandled error on %s %s", request.method, request.url.path)
+    return PlainTextResponse("Internal Server Error", status_code=500)
+
+routes = [
+    Route("/", home, methods=["GET", "HEAD"]),
+    Route("/health", health, methods=["GET", "HEAD"]),
+    Route("/estimate", estimate, methods=["POST"]),
+    Route("/estimate/batch", EstimateBatch(), methods=["POST"]),
+    Route("/estimate/sweep", estimate_sweep, methods=["POST"]),
+    Route("/export_pdf", export_pdf, methods=["POST"]),
+    Route("/ai/parse_history", ai_parse_history, methods=["POST"]),
+    Route("/metrics", metrics_text, methods=["GET"]),
+    Mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static"),
+]
+
+app = Starlette(
+    routes=routes,
+    lifespan=lifespan,
+    exception_handlers={Exception: handle_any},
+    middleware=[Middleware(metrics.ASGIMiddleware, routes=[r.path for r in routes if isinstance(r, Route)],
+                           prefixes=["/static"])],
+)
+
+if __name__ == "__main__":
+    import multiprocessing
+    import uvicorn
+    multiprocessing.freeze_support()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("PORT", 5000)))
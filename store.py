@@ -0,0 +1,500 @@
+# store.py
+# On-disk cohort store: role columns plus their computed doses as fixed-dtype
+# .npy files, memory-mapped for queries. Each append writes a new segment
+# (one .npy per column) and then atomically replaces manifest.json, so a
+# reader never sees half an append. Queries stream over the segments a block
+# of rows at a time; only the values a query keeps (group sums, per-person
+# totals, the values being ranked for quantiles) are held in memory.
+#
+#   python -m core store append cohort/ roles.csv          # creates cohort/ if needed
+#   python -m core store query cohort/ --by task,decade --value dose_high
+#   python -m core store query cohort/ --over 25 --where task=lagging/insulation
+from __future__ import annotations
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bands
+from bands import BandTable
+from cohort import COHORT_DTYPE, UNKNOWN, _group, _round, estimate_batch
+from core import ROLE_FIELDS, Role
+
+MANIFEST = "manifest.json"
+FORMAT = 1
+BLOCK_ROWS = 1 << 20     # rows per query step
+APPEND_ROWS = 1 << 20    # rows per segment when appending from a file
+
+# Role fields as in cohort.COHORT_DTYPE (task/era are codes into the store's
+# own vocabulary, not a band table's), then what estimate_batch computed.
+COLUMNS: Dict[str, str] = {
+    **{name: COHORT_DTYPE.fields[name][0].str for name in COHORT_DTYPE.names},
+    "years": "<i2",
+    "dose_low": "<f8",
+    "dose_high": "<f8",
+}
+# Group-by keys besides plain columns: decade of the role's start year.
+DERIVED = {"decade": "start_year"}
+GROUP_KEYS = ("task", "era", "decade", "start_year", "end_year", "rpe", "lev")
+PERSON_VALUES = ("total_low", "total_high")
+
+class CohortStore:
+    """A directory of segments plus manifest.json. Open an existing store
+    with CohortStore(path) or make one with CohortStore.create(path). One
+    writer at a time; any number of readers."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT:
+            raise ValueError(f"{self.path}: unsupported store format {self.manifest.get('format')!r}")
+
+    @classmethod
+    def create(cls, path, exist_ok: bool = True) -> "CohortStore":
+        path = Path(path)
+        if (path / MANIFEST).exists():
+            if not exist_ok:
+                raise FileExistsError(path / MANIFEST)
+            return cls(path)
+        path.mkdir(parents=True, exist_ok=True)
+        _write_manifest(path, {"format": FORMAT, "rows": 0, "tasks": [], "eras": [],
+                               "columns": COLUMNS, "years": None, "segments": []})
+        return cls(path)
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    @property
+    def tasks(self) -> List[str]:
+        return self.manifest["tasks"]
+
+    @property
+    def eras(self) -> List[str]:
+        return self.manifest["eras"]
+
+    # === Writing ===
+
+    def append(self, data, person_col: str = "person_id", table: BandTable = None) -> int:
+        """Estimate and store a batch of roles: the inputs core.estimate_batch
+        takes (task/era as labels, or as codes of `table`). Doses are computed
+        once, with the band table current now; returns the rows added."""
+        table = table or bands.current()
+        n = len(np.asarray(data["start_year"]))
+        if not n:
+            return 0
+        _check_years(data["start_year"], data["end_year"])
+        res = estimate_batch(data, person_col, table)
+        try:
+            person = np.asarray(data[person_col])
+        except (KeyError, ValueError):
+            person = np.zeros(n, dtype=np.int64)
+        manifest = json.loads(json.dumps(self.manifest))   # a copy, committed at the end
+        cols = {
+            "person_id": person,
+            "task": _codes(data["task"], manifest["tasks"], table.tasks, table.task_code),
+            "era": _codes(data["era"], manifest["eras"], table.eras, table.era_code),
+            **{f: np.asarray(data[f]) for f in ROLE_FIELDS[2:]},
+            "years": res["summaries"]["years"],
+            "dose_low": res["summaries"]["dose_low"],
+            "dose_high": res["summaries"]["dose_high"],
+        }
+        start = np.asarray(cols["start_year"])
+        lo, hi = int(start.min()), int(start.max())
+        if manifest["years"]:
+            lo, hi = min(lo, manifest["years"][0]), max(hi, manifest["years"][1])
+        manifest["years"] = [lo, hi]
+
+        name = f"seg-{len(manifest['segments']):06d}"
+        tmp = self.path / f".{name}.{os.getpid()}.tmp"
+        tmp.mkdir()
+        try:
+            for col, dtype in COLUMNS.items():
+                np.save(tmp / f"{col}.npy", np.ascontiguousarray(cols[col], dtype=dtype))
+            os.replace(tmp, self.path / name)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        manifest["segments"].append({
+            "name": name,
+            "rows": n,
+            "bands": {"path": str(table.path) if table.path else None, "mtime": table.mtime,
+                      "name": table.label, "version": table.version, "digest": table.digest},
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        })
+        manifest["rows"] += n
+        _write_manifest(self.path, manifest)
+        self.manifest = manifest
+        return n
+
+    # === Reading ===
+
+    def segment(self, name: str, col: str) -> np.ndarray:
+        return np.load(self.path / name / f"{col}.npy", mmap_mode="r")
+
+    def blocks(self, columns: Sequence[str], where: Optional[Mapping[str, Any]] = None,
+               block_rows: int = BLOCK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+        """The requested columns (plus "decade") a block of rows at a time,
+        with `where` applied; see mask() for the filter syntax."""
+        where = dict(where or {})
+        wanted = set(columns) | set(where)
+        stored = {DERIVED.get(c, c) for c in wanted}
+        unknown = stored - set(COLUMNS)
+        if unknown:
+            raise KeyError(f"unknown column(s): {', '.join(sorted(unknown))}")
+        for seg in self.manifest["segments"]:
+            maps = {c: self.segment(seg["name"], c) for c in stored}
+            for i in range(0, seg["rows"], block_rows):
+                block = {c: np.asarray(m[i:i + block_rows]) for c, m in maps.items()}
+                if "decade" in wanted:
+                    block["decade"] = block["start_year"] // 10 * 10
+                if where:
+                    keep = self.mask(block, where)
+                    block = {c: v[keep] for c, v in block.items()}
+                yield block
+
+    def mask(self, block: Dict[str, np.ndarray], where: Mapping[str, Any]) -> np.ndarray:
+        # {column: value}, {column: [values]} or {column: (low, high)}, both
+        # ends inclusive; task/era are given as labels.
+        keep = np.ones(len(next(iter(block.values()))), dtype=bool)
+        for col, cond in where.items():
+            values = block[col]
+            if isinstance(cond, tuple):
+                low, high = cond
+                if low is not None:
+                    keep &= values >= low
+                if high is not None:
+                    keep &= values <= high
+            else:
+                wanted = cond if isinstance(cond, (list, set, frozenset)) else [cond]
+                if col in ("task", "era"):
+                    vocab = self.tasks if col == "task" else self.eras
+                    wanted = [vocab.index(w) for w in wanted if w in vocab]
+                keep &= np.isin(values, list(wanted))
+        return keep
+
+    def _labels(self, key: str, codes: np.ndarray) -> list:
+        if key == "task":
+            return [self.tasks[c] for c in codes.tolist()]
+        if key == "era":
+            return [self.eras[c] for c in codes.tolist()]
+        if key in ("rpe", "lev"):
+            return [bool(c) for c in codes.tolist()]
+        return codes.tolist()
+
+    def _radix(self, key: str, where) -> Tuple[int, int, int]:
+        # (offset, step, size): (value - offset) // step maps a group key onto 0..size-1
+        if key == "task":
+            return 0, 1, len(self.tasks)
+        if key == "era":
+            return 0, 1, len(self.eras)
+        if key in ("rpe", "lev"):
+            return 0, 1, 2
+        lo, hi = self.manifest["years"] or (0, 0)
+        if key == "decade":
+            return lo // 10 * 10, 10, hi // 10 - lo // 10 + 1
+        if key == "end_year":
+            lo, hi = self._span(key, where)
+        return lo, 1, hi - lo + 1
+
+    def group_sum(self, by: Sequence[str] = ("task",), values: Sequence[str] = ("dose_low", "dose_high"),
+                  where: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """Role count and sums of `values` per group of `by` keys (GROUP_KEYS),
+        as columns: {key: labels, ..., "roles": counts, value: sums, ...}.
+        Groups without roles are left out."""
+        by = list(by)
+        for key in by:
+            if key not in GROUP_KEYS:
+                raise KeyError(f"cannot group by {key!r}; use {', '.join(GROUP_KEYS)}")
+        radix = {k: self._radix(k, where) for k in by}
+        n_groups = int(np.prod([radix[k][2] for k in by])) if by else 1
+        counts = np.zeros(n_groups, dtype=np.int64)
+        sums = {v: np.zeros(n_groups) for v in values}
+        for block in self.blocks(by + list(values), where):
+            key = _group_key(block, by, radix)
+            counts += np.bincount(key, minlength=n_groups)
+            for v in values:
+                sums[v] += np.bincount(key, weights=block[v], minlength=n_groups)
+        present = np.flatnonzero(counts)
+        out: Dict[str, Any] = {}
+        rest = present
+        for k in reversed(by):
+            offset, step, size = radix[k]
+            out[k] = self._labels(k, rest % size * step + offset)
+            rest = rest // size
+        out = {k: out[k] for k in by}
+        out["roles"] = counts[present]
+        for v in values:
+            out[v] = sums[v][present]
+        return out
+
+    def _span(self, col: str, where) -> Tuple[int, int]:
+        lo, hi = None, None
+        for block in self.blocks([col], where):
+            if len(block[col]):
+                b_lo, b_hi = int(block[col].min()), int(block[col].max())
+                lo = b_lo if lo is None else min(lo, b_lo)
+                hi = b_hi if hi is None else max(hi, b_hi)
+        return (lo, hi) if lo is not None else (0, 0)
+
+    def person_totals(self, where: Optional[Mapping[str, Any]] = None) -> Dict[str, np.ndarray]:
+        """Per person: cumulative dose over the roles matching `where` (all
+        roles by default), rounded like estimate_all, and the role count.
+        People whose roles span several appends are combined."""
+        parts = []
+        for block in self.blocks(("person_id", "dose_low", "dose_high"), where):
+            if not len(block["person_id"]):
+                continue
+            ids, inverse = _group(block["person_id"])
+            parts.append((ids, np.bincount(inverse, block["dose_low"], len(ids)),
+                          np.bincount(inverse, block["dose_high"], len(ids)),
+                          np.bincount(inverse, minlength=len(ids))))
+        if not parts:
+            empty = np.zeros(0)
+            return {"person_id": np.zeros(0, dtype=np.int64), "total_low": empty,
+                    "total_high": empty, "roles": np.zeros(0, dtype=np.int64)}
+        n_parts = len(parts)
+        ids, low, high, roles = (np.concatenate(p) for p in zip(*parts))
+        del parts
+        if n_parts > 1:
+            ids, inverse = _group(ids)
+            low = np.bincount(inverse, low, len(ids))
+            high = np.bincount(inverse, high, len(ids))
+            roles = np.bincount(inverse, roles, len(ids)).astype(np.int64)
+        return {"person_id": ids, "total_low": _round(low, 2), "total_high": _round(high, 2), "roles": roles}
+
+    def _values(self, value: str, by: Sequence[str], where) -> Tuple[np.ndarray, Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        # Values to rank, with a group index per value when grouping.
+        if value in PERSON_VALUES:
+            if by:
+                raise ValueError(f"{value} is per person; it cannot be grouped by role fields")
+            return self.person_totals(where)[value], None, None
+        by = list(by)
+        radix = {k: self._radix(k, where) for k in by}
+        vals, keys = [], []
+        for block in self.blocks(by + [value], where):
+            vals.append(np.asarray(block[value], dtype=float))
+            if by:
+                keys.append(_group_key(block, by, radix))
+        vals = np.concatenate(vals) if vals else np.zeros(0)
+        if not by:
+            return vals, None, None
+        return vals, radix, np.concatenate(keys) if keys else np.zeros(0, dtype=np.intp)
+
+    def quantiles(self, value: str = "total_high", q: Sequence[float] = (0.05, 0.25, 0.5, 0.75, 0.95),
+                  by: Sequence[str] = (), where: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """Quantiles of a role column (dose_low, dose_high, years, ...) or of
+        per-person totals (total_low, total_high), optionally per group of
+        role fields. Returns columns: group keys, "n", then one per quantile
+        ("p5", "p50", ...)."""
+        q = [float(x) for x in q]
+        names = [f"p{x * 100:g}" for x in q]
+        vals, radix, keys = self._values(value, by, where)
+        if radix is None:
+            res = np.quantile(vals, q) if len(vals) else np.full(len(q), np.nan)
+            return {"n": len(vals), **{n: float(r) for n, r in zip(names, res)}}
+        order = np.lexsort((vals, keys))
+        keys, vals = keys[order], vals[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.intp)
+        stops = np.r_[starts[1:], len(keys)]
+        out: Dict[str, Any] = {}
+        rest = keys[starts]
+        for k in reversed(list(by)):
+            offset, step, size = radix[k]
+            out[k] = self._labels(k, rest % size * step + offset)
+            rest = rest // size
+        out = {k: out[k] for k in by}
+        out["n"] = stops - starts
+        table = np.array([np.quantile(vals[a:b], q) for a, b in zip(starts, stops)]).reshape(-1, len(q))
+        for i, n in enumerate(names):
+            out[n] = table[:, i]
+        return out
+
+    def count_over(self, threshold: float, value: str = "total_high",
+                   where: Optional[Mapping[str, Any]] = None) -> Dict[str, Any]:
+        """How many people (for total_low/total_high) or roles (for a role
+        column) have `value` above `threshold`, e.g. count_over(25) for the
+        asbestosis range in the PDF's interpretation table."""
+        if value in PERSON_VALUES:
+            vals = self.person_totals(where)[value]
+            n, over = len(vals), int((vals > threshold).sum())
+        else:
+            n = over = 0
+            for block in self.blocks([value], where):
+                n += len(block[value])
+                over += int((block[value] > threshold).sum())
+        return {"value": value, "threshold": threshold, "n": n, "over": over,
+                "share": over / n if n else None}
+
+def _write_manifest(path: Path, manifest: Dict[str, Any]) -> None:
+    tmp = path / f".{MANIFEST}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path / MANIFEST)
+
+def _check_years(start, end) -> None:
+    # Years, and the role lengths between them, are stored as int16: a value
+    # outside its range would wrap silently in the cast
+    limits = np.iinfo(np.int16)
+    start, end = np.asarray(start), np.asarray(end)
+    for col, v in (("start_year", start), ("end_year", end)):
+        bad = np.flatnonzero(~((v >= limits.min) & (v <= limits.max)))
+        if bad.size:
+            raise ValueError(f"{col} {v[bad[0]]} (row {bad[0]}) is outside {limits.min}..{limits.max}")
+    bad = np.flatnonzero(end.astype(np.int64) - start.astype(np.int64) > limits.max)
+    if bad.size:
+        raise ValueError(f"role {start[bad[0]]}-{end[bad[0]]} (row {bad[0]}) is longer than {limits.max} years")
+
+def _codes(values, vocab: List[str], table_labels: Tuple[str, ...], table_code) -> np.ndarray:
+    # Labels (or band-table codes) -> codes into the store's vocabulary,
+    # which grows as new labels arrive. Labels the table knows are stored
+    # in its spelling, so "Lagging/Insulation " groups with the rest.
+    values = np.asarray(values)
+    known = tuple(table_labels) + (UNKNOWN,)
+    if values.dtype.kind in "iu":
+        uniq, inverse = np.unique(values, return_inverse=True)
+        labels = [known[min(int(u), len(known) - 1)] for u in uniq]
+    else:
+        uniq, inverse = np.unique(values.astype(str), return_inverse=True)
+        labels = []
+        for u in uniq.tolist():
+            code = table_code(u)
+            labels.append(table_labels[code] if code < len(table_labels) else u.strip())
+    index = {label: i for i, label in enumerate(vocab)}
+    mapped = []
+    for label in labels:
+        if label not in index:
+            index[label] = len(vocab)
+            vocab.append(label)
+        mapped.append(index[label])
+    if len(vocab) > np.iinfo(np.int16).max:
+        raise ValueError("too many distinct task/era labels for the store")
+    return np.array(mapped, dtype=np.int16)[inverse]
+
+def _group_key(block: Dict[str, np.ndarray], by: Sequence[str], radix: Dict[str, Tuple[int, int, int]]) -> np.ndarray:
+    # Mixed-radix combination of the group columns: one int per row.
+    key = np.zeros(len(next(iter(block.values()))) if block else 0, dtype=np.intp)
+    for k in by:
+        offset, step, size = radix[k]
+        key = key * size + (block[k].astype(np.intp) - offset) // step
+    return key
+
+# === Loading files ===
+
+def _csv_chunks(path: str, rows: int, errors: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    import pandas as pd
+    from ingest import ingest_frame
+    offset = 0
+    for df in pd.read_csv(path, chunksize=rows, dtype=str, keep_default_na=False):
+        ingested = ingest_frame(df)
+        for e in ingested.errors:
+            errors.append({**e, "row": e["row"] + offset})
+        offset += len(df)
+        if "person_id" in df:
+            person = pd.to_numeric(df["person_id"], errors="coerce").to_numpy()[ingested.rows]
+        else:
+            person = ingested.rows + offset - len(df)      # one role per person
+        ok = np.isfinite(person.astype(float))
+        for i in np.flatnonzero(~ok).tolist():
+            errors.append({"row": int(ingested.rows[i]) + offset - len(df) + 1, "field": "person_id",
+                           "value": None, "error": "person_id must be an integer"})
+        yield {
+            "person_id": person[ok].astype(np.int64),
+            "task": ingested.labels["task"][ok], "era": ingested.labels["era"][ok],
+            **{f: ingested.columns[f][ok] for f in ROLE_FIELDS[2:]},
+        }
+
+def _jsonl_chunks(path: str, rows: int, errors: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    # {"id": <int>, "roles": [...]} per line, as for `python -m core batch`
+    cols: Dict[str, list] = {f: [] for f in ("person_id",) + ROLE_FIELDS}
+    with open(path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                person = int(data.get("id", lineno))
+                roles = [Role.from_dict(r) for r in data["roles"]]
+            except (ValueError, TypeError, KeyError, AttributeError) as e:
+                errors.append({"row": lineno, "field": None, "value": None, "error": f"{type(e).__name__}: {e}"})
+                continue
+            for r in roles:
+                cols["person_id"].append(person)
+                for name in ROLE_FIELDS:
+                    cols[name].append(getattr(r, name))
+            if len(cols["person_id"]) >= rows:
+                yield cols
+                cols = {name: [] for name in cols}
+    if cols["person_id"]:
+        yield cols
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    p = argparse.ArgumentParser(prog="python -m core store", description="On-disk cohort store.")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    a = sub.add_parser("append", help="estimate roles from a file and add them to the store")
+    a.add_argument("store")
+    a.add_argument("input", help="CSV (one role per row, with person_id) or JSONL ({'id', 'roles'} per line)")
+    a.add_argument("--format", choices=("jsonl", "csv"), help="input format (default: from extension)")
+    a.add_argument("--rows", type=int, default=APPEND_ROWS, help="rows per segment")
+    a.add_argument("--errors", help="write skipped rows/lines here as JSONL")
+    q = sub.add_parser("query", help="print group sums, quantiles or a threshold count as JSON")
+    q.add_argument("store")
+    q.add_argument("--by", default="", help="comma-separated group keys: " + ", ".join(GROUP_KEYS))
+    q.add_argument("--value", default=None, help="column to sum/rank (default dose_high; total_high with --over)")
+    q.add_argument("--where", action="append", default=[],
+                   help="KEY=VALUE, KEY=A|B or KEY=LOW..HIGH (repeatable)")
+    q.add_argument("--quantiles", help="comma-separated, e.g. 0.05,0.5,0.95")
+    q.add_argument("--over", type=float, help="count people (or roles) above this value")
+    args = p.parse_args(argv)
+
+    if args.cmd == "append":
+        store = CohortStore.create(args.store)
+        fmt = args.format or ("csv" if args.input.lower().endswith(".csv") else "jsonl")
+        errors: List[Dict[str, Any]] = []
+        t0 = time.perf_counter()
+        added = 0
+        chunks = _csv_chunks if fmt == "csv" else _jsonl_chunks
+        for cols in chunks(args.input, args.rows, errors):
+            added += store.append(cols)
+        if args.errors:
+            with open(args.errors, "w", encoding="utf-8") as f:
+                f.writelines(json.dumps(e, ensure_ascii=False) + "\n" for e in errors)
+        print(json.dumps({"rows": added, "skipped": len(errors), "store_rows": len(store),
+                          "seconds": round(time.perf_counter() - t0, 3)}), file=sys.stderr)
+        return 0
+
+    store = CohortStore(args.store)
+    where = dict(_parse_where(w) for w in args.where)
+    by = [k for k in args.by.split(",") if k]
+    if args.over is not None:
+        result = store.count_over(args.over, args.value or "total_high", where)
+    elif args.quantiles:
+        result = store.quantiles(args.value or "total_high", [float(x) for x in args.quantiles.split(",")], by, where)
+    else:
+        result = store.group_sum(by, [args.value or "dose_high"], where)
+    print(json.dumps(result, default=lambda o: o.tolist() if hasattr(o, "tolist") else str(o)))
+    return 0
+
+def _parse_where(text: str) -> Tuple[str, Any]:
+    key, _, raw = text.partition("=")
+    def value(s: str):
+        if key in ("task", "era"):
+            return s
+        if key in ("rpe", "lev"):
+            return s.strip().lower() in ("1", "true", "yes", "y")
+        return float(s) if "." in s and ".." not in s else int(s)
+    if ".." in raw:
+        low, _, high = raw.partition("..")
+        return key, (value(low) if low else None, value(high) if high else None)
+    if "|" in raw:
+        return key, [value(s) for s in raw.split("|")]
+    return key, value(raw)
@@ -0,0 +1,110 @@
+# sweep.py
+# What-if sweeps: one history re-estimated over a grid of days/week,
+# hours/day, RPE and LEV values in a single broadcast evaluation.
+from __future__ import annotations
+from typing import Any, Dict, List, Mapping, Optional, Sequence
+
+import numpy as np
+
+import bands
+from bands import BandTable
+from cohort import _BLOCK, _round
+from core import Role, estimate_all
+
+# Sweepable fields, in grid axis order
+PARAMS = ("days_per_week", "hours_per_day", "rpe", "lev")
+MAX_POINTS = 100_000        # grid points accepted by the web endpoint
+
+def _values(name: str, values) -> np.ndarray:
+    if name in ("rpe", "lev"):
+        return np.array([bool(v) for v in values])
+    v = np.array([float(x) for x in values])
+    if not np.isfinite(v).all():
+        raise ValueError(f"{name} values must be finite numbers")
+    return v
+
+def sweep(roles: List[Any], grid: Mapping[str, Sequence[Any]], apply_to: Optional[Sequence[int]] = None,
+          table: BandTable = None) -> Dict[str, Any]:
+    """Cumulative totals for `roles` at every combination of the values in
+    `grid` ({field: values} for any of PARAMS). The values replace those of
+    the roles listed in `apply_to` (indices; default all roles); fields not
+    in the grid keep each role's own value. Every grid point gives exactly
+    what estimate_all gives for the roles edited that way.
+
+    Returns `params` (the swept fields, in PARAMS order), `values` (field ->
+    list), `total_low`/`total_high` arrays shaped by the grid, and the
+    unchanged history's `baseline` totals."""
+    unknown = set(grid) - set(PARAMS)
+    if unknown:
+        raise ValueError(f"cannot sweep {', '.join(sorted(unknown))}; choose from {', '.join(PARAMS)}")
+    if not roles:
+        raise ValueError("history has no roles")
+    table = table or bands.current()
+    roles = [r if isinstance(r, Role) else Role.from_dict(r) for r in roles]
+    n = len(roles)
+    if apply_to is None:
+        edited = np.ones(n, dtype=bool)
+    else:
+        edited = np.zeros(n, dtype=bool)
+        idx = [int(i) for i in apply_to]
+        if any(not 0 <= i < n for i in idx):
+            raise ValueError(f"apply_to indices must be in 0..{n - 1}")
+        edited[idx] = True
+    params = [p for p in PARAMS if p in grid]
+    values = {p: _values(p, grid[p]) for p in params}
+    if any(not len(v) for v in values.values()):
+        raise ValueError("every swept field needs at least one value")
+
+    band = np.array([table.band(r.task, r.era) for r in roles])
+    years = np.array([max(0, r.end_year - r.start_year) for r in roles], dtype=float)
+    # Each field as a (roles, 1, ..., 1) array, or for a swept field
+    # (roles, 1, .., k, .., 1) with its k values on its own grid axis for the
+    # edited roles, so the products below broadcast to (roles, *grid).
+    lead = (n,) + (1,) * len(params)
+    field = {}
+    for p in PARAMS:
+        own = np.array([getattr(r, p) for r in roles]).reshape(lead)
+        if p in values:
+            axis = params.index(p)
+            swept = values[p].reshape((1,) + (1,) * axis + (-1,) + (1,) * (len(params) - axis - 1))
+            own = np.where(edited.reshape(lead), swept, own)
+        field[p] = own
+    # Same operations, in the same order, as core.compute_role
+    f_mult = (field["days_per_week"] / 5.0) * (field["hours_per_day"] / 8.0)
+    c_mult = np.where(field["rpe"], 0.5, 1.0) * np.where(field["lev"], 0.8, 1.0)
+    years = years.reshape(lead)
+    shape = tuple(len(values[p]) for p in params)
+    totals = {"total_low": np.zeros(shape), "total_high": np.zeros(shape)}
+    # Roles a block at a time, so the temporaries of the exact rounding stay
+    # cache-resident (one pass over all roles x points is several times slower).
+    step = max(1, _BLOCK // max(1, int(np.prod(shape))))
+    for r0 in range(0, n, step):
+        sl = slice(r0, r0 + step)
+        for k, name in ((0, "total_low"), (1, "total_high")):
+            dose = _round(band[sl, k].reshape((-1,) + lead[1:]) * f_mult[sl] * c_mult[sl] * years[sl], 3)
+            # Role after role, like estimate_all's running total. Reducing axis
+            # 0 of a grid does that; with nothing swept dose is 1-D, which sum()
+            # would add pairwise, so that case takes the sequential cumsum.
+            dose[0] += totals[name]
+            totals[name] = dose.sum(axis=0) if dose.ndim > 1 else np.cumsum(dose)[-1]
+    totals = {name: _round(t, 2) for name, t in totals.items()}
+    base = estimate_all(roles)
+    return {
+        "params": params,
+        "values": {p: values[p].tolist() for p in params},
+        "total_low": totals["total_low"],
+        "total_high": totals["total_high"],
+        "baseline": {"total_low": base["total_low"], "total_high": base["total_high"]},
+    }
+
+def rows(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """A sweep as a tidy table: one row per grid point, the swept fields
+    then total_low/total_high."""
+    params = result["params"]
+    shape = result["total_low"].shape
+    grids = np.meshgrid(*(np.asarray(result["values"][p], dtype=object) for p in params), indexing="ij")
+    cols = [g.ravel().tolist() for g in grids]
+    return [dict(zip(params, point), total_low=lo, total_high=hi)
+            for point, lo, hi in zip(zip(*cols) if cols else [()] * int(np.prod(shape)),
+                                     result["total_low"].ravel().tolist(),
+                                     result["total_high"].ravel().tolist())]
@@ -0,0 +1,28 @@
+# tests/helpers.py
+# Seeded random histories with awkward values (fractional days and hours,
+# zero-year roles, misspelt and unknown tasks), for checking the faster
+# engines against core.estimate_all.
+from __future__ import annotations
+import random
+from typing import Any, Dict, List
+
+TASKS = ["lagging/insulation", "maintenance/demolition", "cement/board cutting", "garage/brakes", "bystander",
+         " Garage/Brakes ", "welding"]
+ERAS = ["pre-1980", "1980-1999", "2000+"]
+
+def random_role(rng: random.Random) -> Dict[str, Any]:
+    start = rng.randint(1950, 2020)
+    return {
+        "task": rng.choice(TASKS),
+        "era": rng.choice(ERAS),
+        "start_year": start,
+        "end_year": start + rng.choice([0, rng.randint(1, 35)]),
+        "days_per_week": rng.choice([5, 4, 2.5, round(rng.uniform(0.5, 7), 1)]),
+        "hours_per_day": rng.choice([8, 7.6, 6, round(rng.uniform(0.5, 12), 1)]),
+        "rpe": rng.random() < 0.3,
+        "lev": rng.random() < 0.3,
+    }
+
+def random_histories(n: int, seed: int = 1, max_roles: int = 8) -> List[List[Dict[str, Any]]]:
+    rng = random.Random(seed)
+    return [[random_role(rng) for _ in range(rng.randint(1, max_roles))] for _ in range(n)]
@@ -0,0 +1,16 @@
+# tests/test_app.py
+# Gradio resolves each event handler's type hints when the UI is wired
+# (build_ui); with pandas imported lazily, they must resolve without it.
+from __future__ import annotations
+import typing
+
+import pytest
+
+import app
+
+HANDLERS = [app.live, app.predict, app._predict, app.what_if, app.make_pdf, app._ingest, app._df_to_roles,
+            app._timeline_frame]
+
+@pytest.mark.parametrize("fn", HANDLERS, ids=lambda f: f.__name__)
+def test_handler_type_hints_resolve(fn):
+    typing.get_type_hints(fn)
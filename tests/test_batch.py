@@ -0,0 +1,39 @@
+# tests/test_batch.py
+# A malformed record goes to the error file with its record number; the
+# valid records around it are still estimated.
+from __future__ import annotations
+import io
+import json
+
+import pytest
+
+import batch
+from core import estimate_all
+from tests.helpers import random_histories
+
+BAD = [
+    '{"id": "big", "roles": [{"task": "bystander", "era": "2000+", "start_year": 1e400, "end_year": 2005,'
+    ' "days_per_week": 5, "hours_per_day": 8, "rpe": false, "lev": false}]}',
+    '{"id": "inf", "roles": [{"task": "bystander", "era": "2000+", "start_year": 2000, "end_year": Infinity,'
+    ' "days_per_week": 5, "hours_per_day": 8, "rpe": false, "lev": false}]}',
+    '{"id": "none", "roles": []}',
+    'not json',
+]
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_bad_records_go_to_the_error_file(workers):
+    histories = random_histories(50, seed=29)
+    lines = [json.dumps({"id": i, "roles": h}) for i, h in enumerate(histories)]
+    for k, bad in enumerate(BAD):
+        lines.insert(10 * k + 5, bad)
+    dst, err = io.StringIO(), io.StringIO()
+    stats = batch.run(io.StringIO("\n".join(lines) + "\n"), dst, err, workers=workers, chunk_size=7)
+    assert (stats["ok"], stats["errors"]) == (len(histories), len(BAD))
+    out = [json.loads(line) for line in dst.getvalue().splitlines()]
+    assert [o["id"] for o in out] == list(range(len(histories)))
+    for o, h in zip(out, histories):
+        want = estimate_all(h)
+        assert (o["total_low"], o["total_high"]) == (want["total_low"], want["total_high"])
+    errors = [json.loads(line) for line in err.getvalue().splitlines()]
+    assert [e["input"] for e in errors] == BAD
+    assert errors[0]["error"].startswith("OverflowError")
@@ -0,0 +1,53 @@
+# tests/test_bench.py
+# The regression gate: results map back to their groups, and a benchmark
+# that did not run fails unless its group was skipped for a missing package.
+from __future__ import annotations
+
+import bench
+
+def _result(group, median=1.0):
+    return {"median_s": median, "group": group}
+
+BASELINE = {"results": {
+    "store.group_sum[100000,task+decade]": _result("store"),
+    "edit_one[100]": _result("edit"),
+    "compare_batch[10000,K=4]": _result("compare"),
+    "band_for": _result("band_for"),
+}}
+
+def test_every_result_names_a_group():
+    assert {bench._group(n, r) for n, r in BASELINE["results"].items()} <= bench.GROUPS.keys()
+    # Files written before results recorded their group
+    assert bench._group("estimate_all[100]", {"median_s": 1.0}) == "estimate_all"
+
+def test_missing_fails_the_gate():
+    current = {"results": {"band_for": _result("band_for")}, "skipped": {}}
+    rows, failed = bench.compare(BASELINE, current)
+    assert failed
+    assert sorted(r["name"] for r in rows if r["status"] == "missing") == [
+        "compare_batch[10000,K=4]", "edit_one[100]", "store.group_sum[100000,task+decade]"]
+
+def test_skipped_group_does_not_fail():
+    current = {"results": {"band_for": _result("band_for")},
+               "skipped": {"store": "No module named 'numpy'", "edit": "No module named 'pandas'",
+                           "compare": "No module named 'numpy'"}}
+    rows, failed = bench.compare(BASELINE, current)
+    assert not failed
+    assert {r["name"]: r["status"] for r in rows}["edit_one[100]"] == "skipped"
+
+def test_run_records_group():
+    res = bench.run(["band_for"], quick=True, repeats=1, min_time=0.001, log=None)
+    assert res["results"]["band_for"]["group"] == "band_for"
+
+def test_store_and_pdf_benches_leave_nothing_behind(monkeypatch, tmp_path):
+    import tempfile
+    import report
+    live = tmp_path / "live-cache"
+    scratch = tmp_path / "tmp"
+    scratch.mkdir()
+    monkeypatch.setattr(report, "CACHE_DIR", live)
+    monkeypatch.setattr(tempfile, "tempdir", str(scratch))
+    res = bench.run(["store", "make_pdf"], quick=True, repeats=1, min_time=0.001, log=None)
+    assert "make_pdf[cached]" in res["results"] and "store.count_over[100000]" in res["results"]
+    assert report.CACHE_DIR == live and not live.exists()
+    assert list(scratch.iterdir()) == []
@@ -0,0 +1,53 @@
+# tests/test_compare.py
+# compare_batch's row k must equal estimate_all (and estimate_batch) run with
+# table k as the current table, including tables whose task and era
+# vocabularies differ from each other.
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+import bands
+from bands import BASE_BANDS, BandTable
+from compare import compare, compare_batch
+from core import estimate_all, estimate_batch, roles_to_columns
+from tests.helpers import random_histories
+
+def _tables():
+    scaled = [BandTable.from_pairs({k: (lo * f, hi * f) for k, (lo, hi) in BASE_BANDS.items()}, name=f"x{f}")
+              for f in (0.5, 1.7)]
+    # No garage/brakes row, an extra task and an extra era
+    other = {k: (lo * 1.3, hi * 0.9) for k, (lo, hi) in BASE_BANDS.items() if k[0] != "garage/brakes"}
+    other[("welding", "pre-1980")] = (0.2, 4.0)
+    other[("lagging/insulation", "1950s")] = (9.0, 90.0)
+    return [bands.current(), *scaled, BandTable.from_pairs(other, name="other")]
+
+@pytest.fixture
+def histories():
+    return random_histories(300, seed=13, max_roles=10)
+
+def test_compare_batch_matches_estimate_all(histories, monkeypatch):
+    tables = _tables()
+    roles = [r for h in histories for r in h]
+    cols = {k: np.asarray(v) for k, v in roles_to_columns(roles).items()}
+    cols["person_id"] = np.repeat(np.arange(len(histories)), [len(h) for h in histories])
+    res = compare_batch(cols, tables)
+    assert res["tables"] == [t.label for t in tables]
+    for k, table in enumerate(tables):
+        batch = estimate_batch(cols, table=table)
+        assert res["total_low"][k].tolist() == batch["total_low"].tolist()
+        assert res["total_high"][k].tolist() == batch["total_high"].tolist()
+        monkeypatch.setattr(bands, "current", lambda table=table: table)
+        for pid, history in enumerate(histories):
+            want = estimate_all(history)
+            assert (res["total_low"][k, pid], res["total_high"][k, pid]) == (want["total_low"], want["total_high"])
+
+def test_compare_one_history(histories, monkeypatch):
+    tables = _tables()
+    for history in histories[:100]:
+        rows = compare(history, tables)
+        for row, table in zip(rows, tables):
+            monkeypatch.setattr(bands, "current", lambda table=table: table)
+            want = estimate_all(history)
+            assert (row["table"], row["total_low"], row["total_high"]) == \
+                   (table.label, want["total_low"], want["total_high"])
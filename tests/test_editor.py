@@ -0,0 +1,49 @@
+# tests/test_editor.py
+# The live grid totals (editor.EditSession) must equal what the Estimate
+# button gives (app._estimate) for the same grid, after every edit.
+from __future__ import annotations
+import random
+
+import pandas as pd
+import pytest
+
+import app
+from editor import EditSession
+from tests.helpers import random_role
+
+FIELDS = ["days_per_week", "hours_per_day", "start_year", "end_year", "rpe", "lev", "task"]
+
+def _edit(rng: random.Random, df: pd.DataFrame) -> pd.DataFrame:
+    op = rng.random()
+    if op < 0.1 or not len(df):
+        row = pd.DataFrame([random_role(rng)], dtype=object)
+        at = rng.randint(0, len(df))
+        return pd.concat([df.iloc[:at], row, df.iloc[at:]], ignore_index=True)
+    if op < 0.2:
+        return df.drop(index=df.index[rng.randrange(len(df))]).reset_index(drop=True)
+    df = df.copy()
+    i, field = rng.randrange(len(df)), rng.choice(FIELDS)
+    df.loc[i, field] = random_role(rng)[field] if rng.random() < 0.95 else None
+    return df
+
+def _button(df: pd.DataFrame):
+    ingested = app._ingest(df)
+    if not len(ingested):
+        return None
+    res = app._estimate(ingested)
+    return res["total_low"], res["total_high"]
+
+@pytest.mark.parametrize("seed", range(6))
+def test_live_totals_match_estimate_button(seed):
+    rng = random.Random(seed)
+    # Object columns, so any cell can take any value, like a grid being typed into
+    df = pd.DataFrame([random_role(rng) for _ in range(rng.randint(1, 30))], dtype=object)
+    session = EditSession()
+    for _ in range(500):
+        df = _edit(rng, df)
+        live = session.update(df.copy())
+        expected = _button(df)
+        if expected is None:
+            assert not live["valid"]
+        else:
+            assert (live["total_low"], live["total_high"]) == expected
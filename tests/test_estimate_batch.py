@@ -0,0 +1,63 @@
+# tests/test_estimate_batch.py
+# estimate_batch over a cohort must give each person exactly what
+# estimate_all gives their history, role by role and in total, whatever the
+# row order and input layout.
+from __future__ import annotations
+import random
+
+import numpy as np
+import pytest
+
+from core import estimate_all, estimate_batch, role_records, roles_to_columns
+from tests.helpers import random_histories
+
+SUMMARY_FIELDS = ("years", "base_band_low", "base_band_high", "adj_band_low", "adj_band_high", "dose_low", "dose_high")
+
+def _cohort(histories, shuffle: bool):
+    # Rows of (person, role); shuffled, people are interleaved at random but
+    # each person's roles stay in order, as the running sum depends on it.
+    queues = [list(roles) for roles in histories]
+    rng = random.Random(5)
+    order = [p for p, roles in enumerate(histories) for _ in roles]
+    if shuffle:
+        rng.shuffle(order)
+    roles = [queues[p].pop(0) for p in order]
+    return order, roles
+
+@pytest.mark.parametrize("layout", ["columns", "records"])
+@pytest.mark.parametrize("shuffle", [False, True], ids=["sorted", "interleaved"])
+def test_estimate_batch_matches_estimate_all(layout, shuffle):
+    histories = random_histories(400, seed=7, max_roles=12)
+    person, roles = _cohort(histories, shuffle)
+    if layout == "columns":
+        data = {k: np.asarray(v) for k, v in roles_to_columns(roles).items()}
+        data["person_id"] = np.asarray(person)
+    else:
+        data = role_records(roles, person_ids=person)
+    res = estimate_batch(data)
+    assert res["person_id"].tolist() == list(range(len(histories)))
+    for pid, history in enumerate(histories):
+        want = estimate_all(history)
+        assert res["total_low"][pid] == want["total_low"]
+        assert res["total_high"][pid] == want["total_high"]
+        assert res["latency_years"][pid] == want["latency_years"]
+    # Per-role summaries line up with the input rows
+    for i, role in enumerate(roles):
+        (want,) = estimate_all([role])["summaries"]
+        for field in SUMMARY_FIELDS:
+            assert res["summaries"][field][i] == want[field], (i, field)
+
+def test_estimate_batch_one_history():
+    for history in random_histories(200, seed=8, max_roles=30):
+        res = estimate_batch(roles_to_columns(history))
+        want = estimate_all(history)
+        assert (res["total_low"][0], res["total_high"][0]) == (want["total_low"], want["total_high"])
+
+def test_round_matches_builtin():
+    from cohort import _round
+    rng = np.random.default_rng(3)
+    # Near-ties (0.0375, 2.675, ...) are common in these products
+    values = np.concatenate([rng.random(20_000) * 50, rng.integers(0, 10**5, 20_000) * 0.0375 / 7,
+                             (rng.integers(0, 10**6, 20_000) + 0.5) / 1000, [0.0, 2.675, 0.0005, 1e15 + 0.5]])
+    for ndigits in (2, 3):
+        assert _round(values, ndigits).tolist() == [round(v, ndigits) for v in values.tolist()]
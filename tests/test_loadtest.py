@@ -0,0 +1,12 @@
+# tests/test_loadtest.py
+# A missing client package is reported in one line, not as a traceback.
+from __future__ import annotations
+import sys
+
+import loadtest
+
+def test_missing_httpx_is_reported(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "httpx", None)
+    assert loadtest.main(["--url", "http://127.0.0.1:9", "--duration", "0.1"]) == 1
+    err = capsys.readouterr().err
+    assert err == "loadtest: httpx is not installed (pip install -r requirements.txt)\n"
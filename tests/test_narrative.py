@@ -0,0 +1,74 @@
+# tests/test_narrative.py
+# A one-job narrative keeps the original keyword parser's role, bar the era of
+# the dated texts in ERA_CHANGES; each role of a multi-job narrative takes its
+# era from its own years.
+from __future__ import annotations
+import re
+
+import pytest
+
+from narrative import parse_history
+
+def old_parse(text):
+    # The baseline Flask /ai/parse_history, as it was
+    text = text.lower()
+    task = "bystander"
+    if "lagger" in text or "lagging" in text or "insulation" in text: task = "lagging/insulation"
+    elif "demolition" in text or "maintenance" in text: task = "maintenance/demolition"
+    elif "cement" in text or "board" in text or "cutting" in text: task = "cement/board cutting"
+    elif "garage" in text or "brake" in text: task = "garage/brakes"
+    era = "pre-1980" if any(y.startswith("196") or y.startswith("195") for y in text.split()) else \
+          "1980-1999" if "198" in text or "199" in text else "2000+"
+    rpe = "mask" in text or "respirat" in text
+    lev = "ventilation" in text or "lev" in text or "extract" in text
+    years = [int(y) for y in re.findall(r"\b(19[5-9]\d|20[0-2]\d)\b", text)]
+    start_year = min(years) if years else 1980
+    end_year = max(years) if years else start_year + 5
+    return {"task": task, "era": era, "start_year": start_year, "end_year": end_year,
+            "days_per_week": 5, "hours_per_day": 6, "rpe": bool(rpe), "lev": bool(lev)}
+
+SINGLE = [
+    "Lagger 1962 to 1975, no mask",
+    "Lagger 1975-1985",
+    "Brake work 1990-1995.",
+    "worked in a garage from 1970 to 1975",
+    "Cutting cement board 2003-2008 with extraction",
+    "maintenance in the 1980s, wore a respirator",
+    "bystander in a shipyard",
+]
+
+@pytest.mark.parametrize("text", SINGLE)
+def test_single_job_matches_old_parser(text):
+    (role,) = parse_history(text)
+    want = old_parse(text)
+    assert {k: v for k, v in role.items() if k != "era"} == {k: v for k, v in want.items() if k != "era"}
+    if not re.search(r"\b(19[5-9]\d|20[0-2]\d)\b", text):
+        assert role["era"] == want["era"]
+
+# The documented behaviour change (README, "Free-text histories"): a dated
+# one-job narrative takes its era from its start year
+ERA_CHANGES = [
+    ("Lagger 1975-1985", "1980-1999", "pre-1980"),
+    ("worked in a garage from 1970 to 1975", "2000+", "pre-1980"),
+]
+
+@pytest.mark.parametrize("text,old_era,era", ERA_CHANGES)
+def test_single_job_era_change(text, old_era, era):
+    assert old_parse(text)["era"] == old_era
+    assert [r["era"] for r in parse_history(text)] == [era]
+
+@pytest.mark.parametrize("text", [t for t in SINGLE if t not in {c[0] for c in ERA_CHANGES}])
+def test_single_job_era_otherwise_unchanged(text):
+    (role,) = parse_history(text)
+    assert role["era"] == old_parse(text)["era"]
+
+def test_multi_job_era_from_years():
+    roles = parse_history("garage brakes from 1970 to 1975. Later worked in demolition 1985-1990")
+    assert [(r["task"], r["era"], r["start_year"], r["end_year"]) for r in roles] == [
+        ("garage/brakes", "pre-1980", 1970, 1975),
+        ("maintenance/demolition", "1980-1999", 1985, 1990),
+    ]
+
+def test_multi_job_later_era():
+    roles = parse_history("Lagging 1965-1978, then cement board cutting 2001-2004")
+    assert [r["era"] for r in roles] == ["pre-1980", "2000+"]
@@ -0,0 +1,64 @@
+# tests/test_report.py
+# The PDF cache: each process evicts only from its own directory, a process
+# that has exited leaves its PDFs to the next one, and a pool that cannot
+# take a render fails the request at once.
+from __future__ import annotations
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import report
+from report import FILENAME, ReportCache, _process_dir
+
+def _pdf(directory, key, size=10):
+    path = directory / key / FILENAME
+    path.parent.mkdir(parents=True)
+    path.write_bytes(b"%" * size)
+    return path
+
+def test_processes_get_their_own_directory(tmp_path):
+    d1, f1 = _process_dir(tmp_path)
+    kept = _pdf(d1, "a")
+    d2, f2 = _process_dir(tmp_path)
+    assert d1 != d2 and kept.exists()
+    # The second process evicting everything it has leaves the first's PDFs alone
+    other = ReportCache(d2, max_bytes=1 << 20, max_files=1, max_age=3600)
+    other.put("b", _pdf(d2, "b").stat().st_size)
+    other.put("c", _pdf(d2, "c").stat().st_size)
+    assert kept.exists() and not (d2 / "b").exists()
+    f1.close()
+    f2.close()
+
+def test_exited_process_pdfs_are_adopted(tmp_path):
+    legacy = _pdf(tmp_path, "old")            # the layout before per-process directories
+    d1, f1 = _process_dir(tmp_path)
+    assert not legacy.exists() and (d1 / "old" / FILENAME).exists()
+    _pdf(d1, "a")
+    f1.close()                                # the process exits
+    d2, f2 = _process_dir(tmp_path)
+    assert not d1.exists() and sorted(p.name for p in d2.iterdir()) == ["a", "old"]
+    assert ReportCache(d2, 1 << 20, 10, 3600).get("a") == str(d2 / "a" / FILENAME)
+    f2.close()
+
+class _BrokenPool:
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("a worker died")
+
+    def shutdown(self, **kwargs):
+        pass
+
+def test_submit_failure_fails_the_request(tmp_path, monkeypatch):
+    monkeypatch.setattr(report, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(report, "_cache", None)
+    monkeypatch.setattr(report, "_pool", _BrokenPool())
+    monkeypatch.setattr(report, "PDF_WORKERS", 1)
+    for _ in range(2):
+        fut: Future = report.pdf_future([], 0.0, 0.0)
+        assert fut.done()
+        with pytest.raises(BrokenProcessPool):
+            fut.result(0)
+        assert report._inflight == {}
+        # A new pool is started for the next request
+        assert report._pool is None
+        monkeypatch.setattr(report, "_pool", _BrokenPool())
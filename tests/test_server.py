@@ -0,0 +1,113 @@
+# tests/test_server.py
+# /estimate must answer exactly as the original Flask route did
+# (app_flastk_backup.estimate, reproduced in `flask_estimate`); a bad line
+# in /estimate/batch becomes an error line, never a truncated stream.
+from __future__ import annotations
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import pytest
+from starlette.testclient import TestClient
+
+import batch
+import server
+from core import DISCLAIMER, band_for, control_multiplier, freq_multiplier
+from tests.helpers import random_histories
+
+def flask_estimate(roles):
+    summaries = []
+    total_low = 0.0
+    total_high = 0.0
+    first_exposure_year = None
+    for r in roles:
+        low, high = band_for(r["task"], r["era"])
+        f_mult = freq_multiplier(float(r["days_per_week"]), float(r["hours_per_day"]))
+        c_mult = control_multiplier(bool(r["rpe"]), bool(r["lev"]))
+        adj_low = low * f_mult * c_mult
+        adj_high = high * f_mult * c_mult
+        years = max(0, int(r["end_year"]) - int(r["start_year"]))
+        res = {"task": r["task"], "era": r["era"], "years": years, "base_band": [low, high],
+               "adjusted_band": [adj_low, adj_high], "dose_range": [adj_low * years, adj_high * years]}
+        summaries.append(res)
+        total_low += res["dose_range"][0]
+        total_high += res["dose_range"][1]
+        sy = int(r.get("start_year"))
+        if first_exposure_year is None or sy < first_exposure_year:
+            first_exposure_year = sy
+    latency = None
+    if first_exposure_year:
+        latency = datetime.now().year - first_exposure_year
+    return {"summaries": summaries, "total_range": [round(total_low, 1), round(total_high, 1)],
+            "latency_years": latency, "disclaimer": DISCLAIMER}
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(server.app) as c:
+        yield c
+
+def test_estimate_matches_flask_route(client):
+    for roles in [[], *random_histories(300, seed=7)]:
+        assert client.post("/estimate", json={"roles": roles}).json() == flask_estimate(roles)
+
+def test_estimate_total_rounded_once(client):
+    # Exact total 0.0475: rounding estimate_all's 2 dp total again gave 0.1
+    role = {"task": "bystander", "era": "2000+", "start_year": 2000, "end_year": 2005,
+            "days_per_week": 5, "hours_per_day": 7.6, "rpe": False, "lev": False}
+    assert client.post("/estimate", json={"roles": [role]}).json()["total_range"][0] == 0.0
+
+def test_export_pdf_default_disclaimer_is_empty(client, monkeypatch, tmp_path):
+    seen = {}
+    path = tmp_path / "r.pdf"
+    path.write_bytes(b"%PDF-1.4\n")
+
+    def fake_pdf_future(roles, low, high, latency_note, disclaimer, *rest):
+        from concurrent.futures import Future
+        seen["disclaimer"] = disclaimer
+        fut = Future()
+        fut.set_result(path)
+        return fut
+
+    monkeypatch.setattr(server, "pdf_future", fake_pdf_future)
+    assert client.post("/export_pdf", json={"roles": []}).status_code == 200
+    assert seen["disclaimer"] == ""
+
+def _batch_body(histories, bad):
+    lines = [json.dumps({"id": i, "roles": h}) for i, h in enumerate(histories)]
+    lines.insert(len(lines) // 2, bad)
+    return "\n".join(lines) + "\n"
+
+def _batch_lines(client, body):
+    r = client.post("/estimate/batch", content=body.encode("utf-8"))
+    assert r.status_code == 200
+    return [json.loads(line) for line in r.text.splitlines()]
+
+BIG_YEAR = ('{"id": "bad", "roles": [{"task": "bystander", "era": "2000+", "start_year": 1e400, "end_year": 2005,'
+            ' "days_per_week": 5, "hours_per_day": 8, "rpe": false, "lev": false}]}')
+
+def test_batch_bad_line_is_an_error_line(client):
+    histories = random_histories(250, seed=31)
+    out = _batch_lines(client, _batch_body(histories, BIG_YEAR))
+    assert len(out) == len(histories) + 1
+    (err,) = [o for o in out if "error" in o]
+    assert err["record"] == len(histories) // 2 + 1 and err["error"].startswith("OverflowError")
+    assert [o["id"] for o in out if "id" in o] == list(range(len(histories)))
+
+def test_batch_chunk_failure_loses_only_its_record(client, monkeypatch):
+    # Whatever batch._run_chunk lets escape, only the record at fault is lost
+    run_chunk = batch._run_chunk
+
+    def fragile(chunk):
+        if any("boom" in payload for _, _, payload in chunk):
+            raise RuntimeError("boom")
+        return run_chunk(chunk)
+
+    monkeypatch.setattr(batch, "_run_chunk", fragile)
+    # In-process, so the patched function is the one run
+    monkeypatch.setattr(server, "_pool", ThreadPoolExecutor(2))
+    histories = random_histories(250, seed=37)
+    out = _batch_lines(client, _batch_body(histories, '{"id": "boom", "roles": []}'))
+    assert len(out) == len(histories) + 1
+    (err,) = [o for o in out if "error" in o]
+    assert err["input"] == '{"id": "boom", "roles": []}' and err["error"] == "RuntimeError: boom"
+    assert [o["id"] for o in out if "id" in o] == list(range(len(histories)))
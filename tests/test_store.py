@@ -0,0 +1,34 @@
+# tests/test_store.py
+# Years are stored as int16: a year (or role length) outside that range is
+# refused, not wrapped.
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from bench import synthetic_columns
+from store import CohortStore
+
+def _cols(n=50, **years):
+    cols = {k: np.asarray(v) for k, v in synthetic_columns(n).items()}
+    for col, (row, value) in years.items():
+        cols[col] = cols[col].astype(np.int64)
+        cols[col][row] = value
+    return cols
+
+def test_append_round_trips_years(tmp_path):
+    store = CohortStore.create(tmp_path)
+    cols = _cols()
+    assert store.append(cols) == 50
+    assert store.manifest["years"] == [int(cols["start_year"].min()), int(cols["start_year"].max())]
+
+@pytest.mark.parametrize("years,match", [
+    ({"start_year": (7, 40000)}, r"start_year 40000 \(row 7\)"),
+    ({"end_year": (3, -40000)}, r"end_year -40000 \(row 3\)"),
+    ({"start_year": (5, -30000), "end_year": (5, 30000)}, r"row 5\) is longer than 32767 years"),
+])
+def test_append_refuses_years_out_of_range(tmp_path, years, match):
+    store = CohortStore.create(tmp_path)
+    with pytest.raises(ValueError, match=match):
+        store.append(_cols(**years))
+    assert len(store) == 0 and not list(tmp_path.glob("seg-*"))
@@ -0,0 +1,38 @@
+# tests/test_sweep.py
+# Every sweep grid point must equal estimate_all on the history edited that
+# way, including the empty grid (nothing swept) and apply_to subsets.
+from __future__ import annotations
+import itertools
+import random
+
+import pytest
+
+from core import estimate_all
+from sweep import PARAMS, sweep
+from tests.helpers import random_histories
+
+GRIDS = [
+    {},
+    {"hours_per_day": [0.5, 7.6, 12]},
+    {"days_per_week": [1, 2.5, 5], "rpe": [False, True]},
+    {"days_per_week": [3, 5], "hours_per_day": [6, 7.6], "rpe": [False, True], "lev": [True, False]},
+]
+
+def _expected(roles, grid, apply_to, point):
+    edited = [dict(r, **point) if i in apply_to else r for i, r in enumerate(roles)]
+    return estimate_all(edited)
+
+@pytest.mark.parametrize("grid", GRIDS, ids=lambda g: "+".join(g) or "empty")
+def test_sweep_matches_estimate_all(grid):
+    rng = random.Random(3)
+    params = [p for p in PARAMS if p in grid]
+    for roles in random_histories(100, seed=11, max_roles=20):
+        apply_to = None if rng.random() < 0.5 else sorted(rng.sample(range(len(roles)), rng.randint(1, len(roles))))
+        res = sweep(roles, grid, apply_to=apply_to)
+        targets = set(range(len(roles))) if apply_to is None else set(apply_to)
+        base = estimate_all(roles)
+        assert res["baseline"] == {"total_low": base["total_low"], "total_high": base["total_high"]}
+        for idx in itertools.product(*(range(len(grid[p])) for p in params)):
+            want = _expected(roles, grid, targets, {p: grid[p][i] for p, i in zip(params, idx)})
+            assert res["total_low"][idx] == want["total_low"]
+            assert res["total_high"][idx] == want["total_high"]
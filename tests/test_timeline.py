@@ -0,0 +1,62 @@
+# tests/test_timeline.py
+# Without the hours cap, a timeline's totals are estimate_all's over the
+# history split at era boundaries; capped or not, the cohort engine gives
+# each person exactly what timeline() gives their history.
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from core import estimate_all, roles_to_columns
+from timeline import era_for_year, segments, timeline, timeline_batch
+from tests.helpers import random_histories
+
+NO_CAP = 1e9
+
+def _pieces(history):
+    # The history as estimate_all roles, one per era piece, each banded by
+    # the era its years fall in
+    return [dict(history[s["role"]], era=s["era"], start_year=s["start_year"], end_year=s["end_year"])
+            for s in segments(history)]
+
+def _close(a, b, n_terms):
+    # estimate_all rounds each role's dose to 3 dp before adding; the
+    # timeline adds unrounded doses. Both round the total to 2 dp.
+    return abs(a - b) <= 0.005 * 2 + 0.0005 * n_terms + 1e-9
+
+def test_uncapped_totals_match_estimate_all():
+    for history in random_histories(300, seed=17, max_roles=8):
+        res = timeline(history, max_hours_per_week=NO_CAP)
+        pieces = _pieces(history)
+        want = estimate_all(pieces) if pieces else {"total_low": 0.0, "total_high": 0.0}
+        assert res["capped_years"] == []
+        assert _close(res["total_low"], want["total_low"], len(pieces))
+        assert _close(res["total_high"], want["total_high"], len(pieces))
+        if res["years"]:
+            assert _close(res["cumulative_low"][-1], res["total_low"], 1)
+
+def test_single_era_history_matches_estimate_all():
+    # Roles within one era, labelled with it: no split, so the same roles
+    for history in random_histories(300, seed=19, max_roles=8):
+        for r in history:
+            r["era"] = era_for_year(r["start_year"])
+            stop = 1980 if r["start_year"] < 1980 else 2000 if r["start_year"] < 2000 else 2100
+            r["end_year"] = min(r["end_year"], stop)
+        res = timeline(history, max_hours_per_week=NO_CAP)
+        want = estimate_all(history)
+        assert _close(res["total_low"], want["total_low"], len(history))
+        assert _close(res["total_high"], want["total_high"], len(history))
+
+@pytest.mark.parametrize("cap", [None, 30.0])
+def test_timeline_batch_matches_timeline(cap):
+    histories = random_histories(300, seed=23, max_roles=8)
+    roles = [r for h in histories for r in h]
+    cols = {k: np.asarray(v) for k, v in roles_to_columns(roles).items()}
+    cols["person_id"] = np.repeat(np.arange(len(histories)), [len(h) for h in histories])
+    curves = timeline_batch(cols, max_hours_per_week=cap)
+    totals = timeline_batch(cols, max_hours_per_week=cap, curves=False)
+    for pid, history in enumerate(histories):
+        one = timeline(history, max_hours_per_week=cap)
+        assert len(one["capped_years"]) == curves["capped_years"][pid] == totals["capped_years"][pid]
+        for key in ("total_low", "total_high"):
+            assert curves[key][pid] == totals[key][pid] == one[key]
@@ -0,0 +1,227 @@
+# timeline.py
+# Year-by-year exposure: each role is split at era boundaries (so a 1975-1995
+# job is banded pre-1980 for five years and 1980-1999 after that), overlapping
+# roles are capped at a maximum number of hours a week, and the result is an
+# annual and a cumulative dose per calendar year. Roles are accumulated with
+# difference arrays, so the cost is O(roles + people x years).
+from __future__ import annotations
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import bands
+from bands import BandTable
+from cohort import _round, role_arrays
+from core import roles_to_columns
+
+# Calendar years each era band applies to: [first, last + 1); None is open.
+ERA_YEARS: Tuple[Tuple[str, Optional[int], Optional[int]], ...] = (
+    ("pre-1980", None, 1980),
+    ("1980-1999", 1980, 2000),
+    ("2000+", 2000, None),
+)
+# Total across concurrent roles; a year above it has every role scaled down
+# in proportion. 60 leaves one full-time role (5 x 8 = 40) alone.
+MAX_HOURS_PER_WEEK = float(os.environ.get("ASBESTOS_MAX_HOURS_PER_WEEK", 60))
+MAX_SPAN = 200          # years; guards against 0 / 9999 typos allocating huge grids
+HOURS_PER_WEEK = 40.0   # a full-time week, the reference the bands assume
+
+def era_for_year(year: int) -> str:
+    for era, first, stop in ERA_YEARS:
+        if (first is None or year >= first) and (stop is None or year < stop):
+            return era
+    raise ValueError(year)
+
+def _task_codes(table: BandTable, task) -> np.ndarray:
+    task = np.asarray(task)
+    if task.dtype.kind in "iu":
+        return task.astype(np.intp)
+    uniq, inverse = np.unique(task.astype(str), return_inverse=True)
+    return table.encode_tasks(uniq.tolist()).astype(np.intp)[inverse]
+
+_BLOCK_CELLS = 1 << 21   # person-years per block; bounds the difference array
+
+def _per_year(table: BandTable, row, start, end, task, hours, weight, n_people: int, y0: int, width: int) -> np.ndarray:
+    # (people, years, 3): hours a week, low and high f/ml, before the cap.
+    # One difference array holds all three: +w where a span starts and -w
+    # where it stops, so a single bincount and a cumsum along the years
+    # give every year's total whatever the number of roles.
+    cells = [row + start]
+    stops = [row + end]
+    qty = [np.zeros(len(row), dtype=np.intp)]
+    weights = [hours]
+    for era, first, stop in ERA_YEARS:
+        # The part of each role inside this era's years, banded for that era.
+        lo = start if first is None else np.maximum(start, first)
+        hi = end if stop is None else np.minimum(end, stop)
+        part = hi > lo
+        if not part.any():
+            continue
+        e = table.era_code(era)
+        for q, grid in ((1, table.low), (2, table.high)):
+            cells.append(row[part] + lo[part])
+            stops.append(row[part] + hi[part])
+            qty.append(np.full(int(part.sum()), q, dtype=np.intp))
+            weights.append(grid[task[part], e] * weight[part])
+    qty = np.concatenate(qty)
+    w = np.concatenate(weights)
+    index = np.concatenate([(np.concatenate(cells) - y0) * 3 + qty, (np.concatenate(stops) - y0) * 3 + qty])
+    diff = np.bincount(index, np.concatenate([w, -w]), minlength=n_people * width * 3)
+    return np.cumsum(diff.reshape(n_people, width, 3), axis=1)[:, :width - 1]
+
+def _may_cap(inverse, start, end, over_alone, y0: int, width: int, n_people: int) -> np.ndarray:
+    # People with a role over the cap by itself, or with a role starting
+    # before an earlier one (same person, sorted by start) has ended.
+    order = np.lexsort((start, inverse))
+    person = inverse[order].astype(np.int64)
+    # Keys grow with the person, so a running max never reaches across people.
+    ends = np.maximum.accumulate(person * width + (end[order] - y0))
+    begins = person * width + (start[order] - y0)
+    overlap = np.zeros(len(order), dtype=bool)
+    overlap[1:] = (begins[1:] < ends[:-1]) & (end[order][1:] > start[order][1:])
+    flag = np.zeros(n_people, dtype=bool)
+    flag[person[overlap]] = True
+    flag[inverse[over_alone]] = True
+    return np.flatnonzero(flag)
+
+def timeline_batch(data, person_col: str = "person_id", table: BandTable = None,
+                   max_hours_per_week: float = None, curves: bool = True) -> Dict[str, Any]:
+    """Per-person exposure by calendar year for columnar role data (the same
+    inputs as core.estimate_batch). The role's own `era` is not used: each
+    calendar year takes the band of the era it falls in (ERA_YEARS).
+
+    Returns `years` (Y,) and, per person, (P, Y) arrays `hours_per_week`
+    (before the cap), `annual_low`/`annual_high` (f/ml in that year) and
+    `cumulative_low`/`cumulative_high` (f/ml·years by the end of that year),
+    plus `total_low`/`total_high` and `capped_years` (years over the cap).
+    With curves=False only the per-person values are returned, in memory
+    bounded by the block size rather than people x years."""
+    table = table or bands.current()
+    cap = MAX_HOURS_PER_WEEK if max_hours_per_week is None else float(max_hours_per_week)
+    if not cap > 0:
+        raise ValueError("max_hours_per_week must be positive")
+    cols = role_arrays(data, person_col, table)
+    task = _task_codes(table, data["task"])
+    start, end, inverse, ids = cols["start"], cols["end"], cols["inverse"], cols["ids"]
+    live = end > start
+    y0 = int(start[live].min()) if live.any() else 0
+    y1 = int(end[live].max()) if live.any() else 0
+    if y1 - y0 > MAX_SPAN:
+        raise ValueError(f"roles span {y1 - y0} years ({y0}-{y1}); at most {MAX_SPAN} are supported")
+    # Roles that never run get an empty span at y0, so they add nothing.
+    start = np.where(live, start, y0)
+    end = np.where(live, end, y0)
+    hours = cols["days"] * cols["hours"]
+    weight = hours / HOURS_PER_WEEK * np.where(cols["rpe"], 0.5, 1.0) * np.where(cols["lev"], 0.8, 1.0)
+
+    n_people, n_years = len(ids), y1 - y0
+    width = n_years + 1                     # a spare year for spans ending at y1
+    total_low = np.zeros(n_people)
+    total_high = np.zeros(n_people)
+    capped = np.zeros(n_people, dtype=np.int64)
+    names = ("hours_per_week", "annual_low", "annual_high", "cumulative_low", "cumulative_high")
+    out = {k: np.empty((n_people, n_years)) for k in names} if curves else {}
+    # Totals straight from the roles: each era piece adds band x weight x
+    # years. Only people with a capped year take theirs from the grid, so a
+    # person's totals do not depend on the rest of the cohort or on `curves`.
+    for era, first, stop in ERA_YEARS:
+        lo = start if first is None else np.maximum(start, first)
+        hi = end if stop is None else np.minimum(end, stop)
+        part = hi > lo
+        e = table.era_code(era)
+        dose = weight[part] * (hi - lo)[part]
+        total_low += np.bincount(inverse[part], table.low[task[part], e] * dose, minlength=n_people)
+        total_high += np.bincount(inverse[part], table.high[task[part], e] * dose, minlength=n_people)
+    if curves:
+        people = np.arange(n_people)
+    else:
+        # Only people with overlapping roles (or one role over the cap by
+        # itself) can be capped, and only they go through the grid.
+        people = _may_cap(inverse, start, end, live & (hours > cap), y0, width, n_people)
+
+    # Blocks of consecutive people (of `people`); roles are put in person order once.
+    slot = np.full(n_people, -1, dtype=np.intp)
+    slot[people] = np.arange(len(people))
+    role_slot = slot[inverse]
+    order = np.argsort(role_slot, kind="stable")
+    order = order[role_slot[order] >= 0]
+    bounds = np.searchsorted(role_slot[order], np.arange(len(people) + 1))
+    step = max(1, _BLOCK_CELLS // width)
+    for p0 in range(0, len(people), step):
+        p1 = min(p0 + step, len(people))
+        sel = order[bounds[p0]:bounds[p1]]
+        row = (role_slot[sel] - p0) * width
+        per_year = _per_year(table, row, start[sel], end[sel], task[sel], hours[sel], weight[sel],
+                             p1 - p0, y0, width)
+        hours_y = per_year[:, :, 0]
+        over = hours_y > cap + 1e-9         # the running sums carry rounding noise
+        scale = np.where(over, cap / np.where(over, hours_y, 1.0), 1.0)
+        annual_low = per_year[:, :, 1] * scale
+        annual_high = per_year[:, :, 2] * scale
+        idx = people[p0:p1]
+        capped[idx] = over.sum(axis=1)
+        if curves:
+            out["hours_per_week"][p0:p1] = hours_y
+            out["annual_low"][p0:p1] = annual_low
+            out["annual_high"][p0:p1] = annual_high
+            cum_low = np.cumsum(annual_low, axis=1, out=out["cumulative_low"][p0:p1])
+            cum_high = np.cumsum(annual_high, axis=1, out=out["cumulative_high"][p0:p1])
+        else:
+            cum_low, cum_high = np.cumsum(annual_low, axis=1), np.cumsum(annual_high, axis=1)
+        hit = capped[idx] > 0
+        if hit.any():
+            # Sequential sums: the years before and after a person's own
+            # (the cohort's span) add exact zeros, unlike a pairwise sum.
+            total_low[idx[hit]] = cum_low[hit, -1]
+            total_high[idx[hit]] = cum_high[hit, -1]
+    return {
+        "person_id": ids,
+        "years": np.arange(y0, y1),
+        **out,
+        "total_low": _round(total_low, 2),
+        "total_high": _round(total_high, 2),
+        "capped_years": capped,
+        "max_hours_per_week": cap,
+    }
+
+def segments(roles: List[Any], table: BandTable = None) -> List[Dict[str, Any]]:
+    # How each role was split: one entry per (role, era) piece with its band.
+    table = table or bands.current()
+    out = []
+    for i, r in enumerate(roles):
+        start, end = int(r["start_year"]), int(r["end_year"])
+        for era, first, stop in ERA_YEARS:
+            lo = start if first is None else max(start, first)
+            hi = end if stop is None else min(end, stop)
+            if hi > lo:
+                low, high = table.band(str(r["task"]), era)
+                out.append({"role": i, "task": r["task"], "era": era, "start_year": lo,
+                            "end_year": hi, "band_low": low, "band_high": high})
+    return out
+
+def timeline(roles: List[Any], max_hours_per_week: float = None, table: BandTable = None) -> Dict[str, Any]:
+    """One history's timeline as plain lists (for JSON, the UI and the PDF);
+    see timeline_batch. `capped_years` lists the calendar years scaled down
+    to the hours cap."""
+    table = table or bands.current()
+    res = timeline_batch(roles_to_columns(roles), table=table, max_hours_per_week=max_hours_per_week)
+    years = res["years"].tolist()
+    if not len(res["person_id"]) or not years:
+        row = {k: [] for k in ("hours_per_week", "annual_low", "annual_high", "cumulative_low", "cumulative_high")}
+        total_low = total_high = 0.0
+        capped = []
+    else:
+        row = {k: _round(res[k][0], 3).tolist()
+               for k in ("hours_per_week", "annual_low", "annual_high", "cumulative_low", "cumulative_high")}
+        total_low, total_high = float(res["total_low"][0]), float(res["total_high"][0])
+        capped = [y for y, h in zip(years, res["hours_per_week"][0]) if h > res["max_hours_per_week"] + 1e-9]
+    return {
+        "years": years,
+        **row,
+        "total_low": total_low,
+        "total_high": total_high,
+        "max_hours_per_week": res["max_hours_per_week"],
+        "capped_years": capped,
+        "segments": segments(roles, table),
+    }